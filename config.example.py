@@ -1,6 +1,7 @@
 """
 配置文件模板
 复制此文件为 config.py 并根据需要修改配置
+config.py 中没有的配置项使用默认值（见 settings.py），升级后不需要重新复制
 """
 import os
 
@@ -13,17 +14,108 @@ MARKDOWN_DIR = os.path.join(OUTPUT_DIR, "markdown")
 IMAGES_DIR = os.path.join(OUTPUT_DIR, "images")
 PDF_DIR = os.path.join(OUTPUT_DIR, "pdf")
 
+# 输出目录布局
+# flat: 所有文件平铺在各自目录下
+# sharded: Markdown/PDF按 公众号/年-月 分目录，图片按文件名哈希分到256个子目录（适合数万篇文章的归档）
+# 修改后可用 migrate-layout 子命令迁移已有归档
+OUTPUT_LAYOUT = "flat"
+
+# 任务日志（记录每篇文章的处理阶段，用于 --resume 断点续传）
+JOURNAL_FILE = os.path.join(OUTPUT_DIR, "journal.jsonl")
+
+# 进度文件（运行中原子更新，供 status 子命令读取）
+STATUS_FILE = os.path.join(OUTPUT_DIR, "status.json")
+
 # 请求配置
 REQUEST_TIMEOUT = 30  # 请求超时时间（秒）
 MAX_RETRIES = 3  # 最大重试次数
 RETRY_DELAY = 2  # 重试延迟（秒）
 
+# HTTP连接池：获取文章、下载图片和音视频共用一个连接池（按主机保持长连接）
+HTTP_POOL_HOSTS = 16  # 保留连接池的主机数
+HTTP_POOL_SIZE = 32  # 每个主机保留的空闲连接数（应不小于同时下载的线程数）
+HTTP_POOL_HOST_SIZES = {}  # 按主机单独设置，如 {"mmbiz.qpic.cn": 64}
+# 使用HTTP/2（需要 pip install "httpx[http2]"，未安装时使用HTTP/1.1）
+HTTP2 = False
+
+# 批量下载配置
+MAX_WORKERS = 1  # 同时处理的文章数（1表示逐篇处理）
+PDF_TABS = 1  # 在同一个浏览器中同时渲染PDF的标签页数（1表示每篇文章单独启动浏览器，应不大于MAX_WORKERS）
+PDF_PROCESSES = 0  # PDF渲染进程数，每个进程一个浏览器（0表示不使用多进程渲染）
+PDF_PROCESS_MAX_RSS_MB = 1536  # 单个渲染进程（含浏览器）的内存上限，超过后回收重启（0表示不限制）
+ARTICLE_DEADLINE = 600  # 单篇文章所有阶段（获取、图片、PDF）共用的时间预算（秒），用完后该文章按超时失败（0表示不限制）
+
+# 遇到验证页面的文章放入隔离队列，冷却后重试（冷却时间从 QUARANTINE_BASE_DELAY 开始每次翻倍）
+QUARANTINE_BASE_DELAY = 60  # 第一次冷却时间（秒）
+QUARANTINE_MAX_DELAY = 900  # 冷却时间上限（秒）
+QUARANTINE_MAX_ATTEMPTS = 3  # 每篇文章最多隔离次数
+
+# 浏览器配置档：生成PDF时持久化Cookie和本地存储，新建浏览器上下文时复用（设为None表示每篇文章都是全新访问）
+BROWSER_PROFILE = "default"
+PROFILE_DIR = os.path.join(OUTPUT_DIR, "profiles")
+SHARE_COOKIES_WITH_REQUESTS = False  # 是否把配置档中的Cookie同步给获取文章和下载图片的requests会话
+
+# PDF渲染请求拦截：只放行文档、CSS和正文图片，拦截统计脚本、评论/点赞组件、视频、字体等
+# 默认关闭：拦截后页面脚本不再运行，PDF的排版可能与未拦截时不同，开启前请先对比几篇文章的输出
+PDF_BLOCK_RESOURCES = False
+PDF_ALLOWED_RESOURCE_TYPES = ('document', 'stylesheet', 'image')
+PDF_ALLOWED_IMAGE_HOSTS = ('mmbiz.qpic.cn',)
+
+# PDF输出方式：page（page.pdf，整个PDF在内存中生成）或 stream（CDP流式写入临时文件后重命名，适合很长的文章）
+PDF_PRINT_BACKEND = "page"
+
+# PDF来源：page（加载文章页面打印）或 markdown（用刚保存的Markdown和本地图片离线打印，不访问网络，需 --format both）
+PDF_SOURCE = "page"
+
+# 生成PDF时在同一次页面加载中额外保存的快照：png（整页截图）、mhtml（可离线重新生成PDF）、html（渲染后的HTML）
+PDF_CAPTURE_ARTIFACTS = ()
+SNAPSHOT_DIR = os.path.join(OUTPUT_DIR, "snapshots")
+# 生成PDF时直接用渲染后的页面生成Markdown，每篇文章只加载一次页面
+SINGLE_PAGE_LOAD = False
+
 # User-Agent
 USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 
 # 图片下载配置
 IMAGE_TIMEOUT = 60  # 图片下载超时时间（秒）
 IMAGE_MAX_SIZE = 10 * 1024 * 1024  # 图片最大下载大小（10MB）
+# 图片缓存索引：按图片URL记录已下载的文件，重新处理文章或不同文章引用同一张图片时不再下载
+IMAGE_CACHE = True
+IMAGE_CACHE_FILE = os.path.join(OUTPUT_DIR, "image_cache.jsonl")
+# audit-images 发现的缺失或损坏的图片，等待重新下载
+IMAGE_REDOWNLOAD_FILE = os.path.join(OUTPUT_DIR, "image_redownload.jsonl")
+# 图片感知哈希索引：为每张下载的图片计算aHash/dHash，用于找出重新压缩过的近似重复图片（hash-images 子命令）
+IMAGE_HASH = True
+IMAGE_HASH_FILE = os.path.join(OUTPUT_DIR, "image_hashes.jsonl")
+IMAGE_HASH_DISTANCE = 4  # aHash和dHash的汉明距离都不超过该值时视为重复（64位）
+# 新下载的图片与已有图片近似重复时删除新文件，文章改用已有的图片
+IMAGE_DEDUP = False
+# 图片下载方式：eager（处理文章时下载）或 deferred（先保存引用远程图片的Markdown，之后用 hydrate-images 补全）
+IMAGE_MODE = "eager"
+PENDING_IMAGES_FILE = os.path.join(OUTPUT_DIR, "pending_images.jsonl")
+# 图片质量：original（HTML中的原始链接）、1080 / 640（限制宽度）、webp（WebP格式）
+# 只改写微信图片CDN（mmbiz）的链接，改写后的链接下载失败时自动改用原始链接
+IMAGE_QUALITY = "original"
+# 图片后处理：下载后转换为 webp 或 avif（None表示不转换）、限制最长边、去掉EXIF等元数据，在进程池中进行
+IMAGE_OPTIMIZE_FORMAT = None
+IMAGE_MAX_DIMENSION = 0  # 最长边的像素上限（0表示不限制）
+IMAGE_OPTIMIZE_QUALITY = 80  # 有损压缩质量（1-100）
+IMAGE_OPTIMIZE_PROCESSES = 2  # 后处理进程数（0表示在下载线程中处理）
+IMAGE_GIF_TO_WEBP = False  # 把GIF动图转换为WebP动图（已有归档可用 compact-gifs 子命令转换）
+IMAGE_GIF_KEEP_ORIGINAL = False  # 转换后保留原GIF
+# 图片下载量预算（字节，0表示不限制）：单篇文章用完后其余图片保留原链接（文章标记为图片不完整），
+# 整批任务用完后不再开始新的文章（剩余文章可用 --resume 继续）
+ARTICLE_MAX_BYTES = 0  # 如 200 * 1024 * 1024
+BATCH_MAX_BYTES = 0
+
+# 音视频下载配置（--media 开启）：正文中嵌入的视频、音频用多个HTTP Range分段并行下载，
+# 中断后从已完成的分段继续，Markdown中链接到本地文件
+EXTRACT_MEDIA = False
+MEDIA_DIR = os.path.join(OUTPUT_DIR, "media")
+MEDIA_SEGMENTS = 4  # 同时下载的分段数
+MEDIA_SEGMENT_SIZE = 4 * 1024 * 1024  # 每段大小（4MB）
+MEDIA_TIMEOUT = 60  # 每个分段请求的超时时间（秒）
+MEDIA_MAX_SIZE = 2 * 1024 * 1024 * 1024  # 单个文件最大下载大小（2GB）
 
 # 文件名清理配置（移除非法字符）
 INVALID_CHARS = ['/', '\\', ':', '*', '?', '"', '<', '>', '|']
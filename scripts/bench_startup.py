@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令行启动时间基准测试
+多次启动 wechat_article_downloader.py 的常用命令，统计耗时，并列出导入最慢的模块
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+entry_point = os.path.join(project_root, 'wechat_article_downloader.py')
+
+# 需要测量的命令
+COMMANDS = [
+    ['--help'],
+    ['status', '--file', os.devnull],
+    ['retry', '--dry-run'],
+]
+
+
+def time_command(args, runs):
+    """
+    多次运行命令并记录耗时
+
+    Args:
+        args: 命令参数
+        runs: 运行次数
+
+    Returns:
+        list: 每次运行的耗时（毫秒）
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, entry_point] + args, cwd=project_root,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def slowest_imports(args, top):
+    """
+    使用 python -X importtime 找出导入最慢的模块
+
+    Args:
+        args: 命令参数
+        top: 显示的模块数
+
+    Returns:
+        list: (累计耗时微秒, 模块名) 列表
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', entry_point] + args, cwd=project_root,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in proc.stderr.splitlines():
+        match = re.match(r'import time:\s+\d+\s+\|\s+(\d+)\s+\| (.+)$', line)
+        # 只统计顶层模块（没有缩进），避免子模块重复计算
+        if match and not match.group(2).startswith(' '):
+            imports.append((int(match.group(1)), match.group(2)))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='测量命令行启动时间')
+    parser.add_argument('--runs', type=int, default=10, help='每个命令运行的次数（默认10）')
+    parser.add_argument('--top', type=int, default=5, help='显示导入最慢的模块数（默认5）')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print(f"启动时间基准测试（每个命令运行 {args.runs} 次）")
+    print("=" * 70)
+
+    # 解释器本身的启动时间作为参照
+    interpreter = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'])
+        interpreter.append((time.perf_counter() - start) * 1000)
+    print(f"{'python -c pass':<40} 中位数 {statistics.median(interpreter):7.1f} ms")
+
+    for command in COMMANDS:
+        timings = time_command(command, args.runs)
+        label = ' '.join(command)
+        print(f"{label:<40} 中位数 {statistics.median(timings):7.1f} ms  "
+              f"最小 {min(timings):7.1f} ms  最大 {max(timings):7.1f} ms")
+
+    print(f"\n--help 导入最慢的 {args.top} 个模块（累计耗时）:")
+    for cumulative, module in slowest_imports(['--help'], args.top):
+        print(f"  {cumulative / 1000:7.1f} ms  {module}")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
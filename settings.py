@@ -0,0 +1,46 @@
+"""
+配置读取模块
+读取用户的 config.py，再执行 config.example.py 补上其中没有的配置项，升级后不需要重新复制配置文件。
+默认值只在 config.example.py 中定义一次；补默认值时 config.py 中已有的配置项保持用户的值，
+因此 JOURNAL_FILE 等默认路径会放在用户配置的 OUTPUT_DIR 下。其他模块都从这里导入配置。
+"""
+import os
+import config
+
+
+# 配置模板（与本文件在同一目录）
+EXAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.example.py')
+
+
+class _UserFirstNamespace(dict):
+    """执行配置模板时使用的命名空间：用户已配置的项不会被模板中的赋值覆盖"""
+
+    def __init__(self, user_settings):
+        super().__init__(user_settings)
+        self._user_keys = set(user_settings)
+
+    def __setitem__(self, key, value):
+        if key not in self._user_keys:
+            super().__setitem__(key, value)
+
+
+def load_settings(user_config=config, example_file=EXAMPLE_FILE):
+    """
+    合并用户配置和配置模板中的默认值
+
+    Args:
+        user_config: 用户的配置模块
+        example_file: 配置模板路径
+
+    Returns:
+        dict: 配置项名 -> 值（只包含大写的配置项）
+    """
+    user_settings = {name: value for name, value in vars(user_config).items() if name.isupper()}
+    namespace = _UserFirstNamespace(user_settings)
+    with open(example_file, 'r', encoding='utf-8') as f:
+        code = compile(f.read(), example_file, 'exec')
+    exec(code, {'__file__': example_file, '__name__': 'config_example', '__builtins__': __builtins__}, namespace)
+    return {name: value for name, value in namespace.items() if name.isupper()}
+
+
+globals().update(load_settings())
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+归档核对测试脚本
+测试PDF文章ID写入与读取、按文章ID核对缺失、重复和孤立文件以及布局迁移（不需要网络）
+"""
+
+import os
+import sys
+import tempfile
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from PIL import Image
+from test_integration import TestResults
+from utils.archive_index import reconcile_archive, migrate_layout
+from utils.layout import image_link_prefix
+from utils.pdf_metadata import stamp_article_metadata, read_article_id
+from utils.wechat_to_pdf_perfect import remove_stale_pdfs
+
+
+def write_markdown(md_dir, filename, title, url, images):
+    """按 MarkdownConverter.add_metadata 的格式写一个Markdown文件"""
+    body = '\n\n'.join(f'![img](../images/{name})' for name in images)
+    content = f"# {title}\n\n{body}\n\n---\n\n**作者**: 测试  \n**发布时间**: 2025-01-01 00:00:00  \n"
+    if url:
+        content += f"**原文链接**: {url}  \n"
+    with open(os.path.join(md_dir, filename), 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def write_pdf(pdf_path, article_id=None):
+    """生成一个最小的PDF，并可选写入文章ID"""
+    Image.new('RGB', (20, 20), 'white').save(pdf_path)
+    if article_id:
+        if not stamp_article_metadata(pdf_path, article_id, title='标题'):
+            raise ValueError(f"写入文章ID失败: {pdf_path}")
+
+
+def test_pdf_metadata_roundtrip(test_results, temp_dir):
+    """测试PDF文章ID写入后能读回"""
+    try:
+        pdf_path = os.path.join(temp_dir, 'roundtrip.pdf')
+        write_pdf(pdf_path, 'MzA5_2650_2')
+        if read_article_id(pdf_path) != 'MzA5_2650_2':
+            raise ValueError(f"读回的文章ID错误: {read_article_id(pdf_path)}")
+
+        plain_path = os.path.join(temp_dir, 'plain.pdf')
+        write_pdf(plain_path)
+        if read_article_id(plain_path) is not None:
+            raise ValueError("未写入文章ID的PDF不应读出ID")
+        test_results.add_pass("归档核对 - PDF文章ID写入与读取")
+    except Exception as e:
+        test_results.add_fail("归档核对 - PDF文章ID写入与读取", str(e))
+
+
+def test_reconcile(test_results, temp_dir):
+    """测试缺失、重复、孤立文件的识别"""
+    try:
+        md_dir = os.path.join(temp_dir, 'markdown')
+        pdf_dir = os.path.join(temp_dir, 'pdf')
+        images_dir = os.path.join(temp_dir, 'images')
+        for d in (md_dir, pdf_dir, images_dir):
+            os.makedirs(d)
+        for name in ('a_001.jpg', 'b_001.png', 'orphan.jpg'):
+            open(os.path.join(images_dir, name), 'wb').close()
+
+        # 标题互为前缀、跨年份的文章不能被误判
+        write_markdown(md_dir, '声学_20251231_235959.md', '声学', 'https://mp.weixin.qq.com/s/aaa', ['a_001.jpg'])
+        write_markdown(md_dir, '声学（二）_20260101_000000.md', '声学（二）',
+                       'https://mp.weixin.qq.com/s/bbb', ['b_001.png', 'gone.jpg'])
+        write_markdown(md_dir, '声学（二）_20260102_000000.md', '声学（二）',
+                       'https://mp.weixin.qq.com/s/bbb', [])
+        write_markdown(md_dir, '旧文章.md', '无链接', None, [])
+
+        write_pdf(os.path.join(pdf_dir, '声学（二）.pdf'), 'bbb')
+        write_pdf(os.path.join(pdf_dir, '声学（二）_副本.pdf'), 'bbb')
+        write_pdf(os.path.join(pdf_dir, '其他.pdf'), 'ccc')
+        write_pdf(os.path.join(pdf_dir, '未知.pdf'))
+
+        report = reconcile_archive(md_dir, pdf_dir, images_dir)
+
+        if [item['article_id'] for item in report['missing_pdf']] != ['aaa']:
+            raise ValueError(f"缺少PDF的文章错误: {report['missing_pdf']}")
+        if [item['article_id'] for item in report['missing_markdown']] != ['ccc']:
+            raise ValueError(f"缺少Markdown的文章错误: {report['missing_markdown']}")
+        if set(report['duplicate_markdown']) != {'bbb'} or set(report['duplicate_pdf']) != {'bbb'}:
+            raise ValueError("重复文件识别错误")
+        if [os.path.basename(p) for p in report['unidentified_markdown']] != ['旧文章.md']:
+            raise ValueError(f"无法识别的Markdown错误: {report['unidentified_markdown']}")
+        if [os.path.basename(p) for p in report['unidentified_pdf']] != ['未知.pdf']:
+            raise ValueError(f"无法识别的PDF错误: {report['unidentified_pdf']}")
+        if [os.path.basename(item['image']) for item in report['missing_images']] != ['gone.jpg']:
+            raise ValueError(f"缺失图片识别错误: {report['missing_images']}")
+        if [os.path.basename(p) for p in report['orphan_images']] != ['orphan.jpg']:
+            raise ValueError(f"孤立图片识别错误: {report['orphan_images']}")
+        test_results.add_pass("归档核对 - 缺失/重复/孤立文件")
+    except Exception as e:
+        test_results.add_fail("归档核对 - 缺失/重复/孤立文件", str(e))
+
+
+def test_migrate_layout(test_results, temp_dir):
+    """测试平铺与分片布局之间的迁移"""
+    try:
+        root = os.path.join(temp_dir, 'migrate')
+        md_dir = os.path.join(root, 'markdown')
+        pdf_dir = os.path.join(root, 'pdf')
+        images_dir = os.path.join(root, 'images')
+        for d in (md_dir, pdf_dir, images_dir):
+            os.makedirs(d)
+        for name in ('a_001.jpg', 'a_002.png'):
+            open(os.path.join(images_dir, name), 'wb').close()
+        write_markdown(md_dir, '文章_20250101_000000.md', '文章', 'https://mp.weixin.qq.com/s/aaa',
+                       ['a_001.jpg', 'a_002.png'])
+        write_pdf(os.path.join(pdf_dir, '文章.pdf'), 'aaa')
+
+        stats = migrate_layout('sharded', md_dir, pdf_dir, images_dir)
+        if stats['images'] != 2 or stats['markdown'] != 1 or stats['pdf'] != 1:
+            raise ValueError(f"迁移统计错误: {stats}")
+        new_md = os.path.join(md_dir, '测试', '2025-01', '文章_20250101_000000.md')
+        if not os.path.exists(new_md) or not os.path.exists(os.path.join(pdf_dir, '测试', '2025-01', '文章.pdf')):
+            raise ValueError("Markdown或PDF未移动到分片目录")
+        report = reconcile_archive(md_dir, pdf_dir, images_dir)
+        if report['missing_images'] or report['orphan_images'] or report['missing_pdf']:
+            raise ValueError(f"迁移后链接失效: {report['missing_images']}")
+        if image_link_prefix(os.path.dirname(new_md), images_dir) != '../../../':
+            raise ValueError("分片目录的图片链接前缀错误")
+
+        # 再次运行不应有任何改动，迁移回平铺布局后链接仍然有效
+        if migrate_layout('sharded', md_dir, pdf_dir, images_dir) != dict(stats, images=0, markdown=0, pdf=0, links=0):
+            raise ValueError("重复迁移不应移动文件")
+        migrate_layout('flat', md_dir, pdf_dir, images_dir)
+        report = reconcile_archive(md_dir, pdf_dir, images_dir)
+        if report['missing_images'] or set(os.listdir(images_dir)) != {'a_001.jpg', 'a_002.png'} or \
+                not os.path.exists(os.path.join(md_dir, '文章_20250101_000000.md')):
+            raise ValueError("迁移回平铺布局失败")
+        with open(os.path.join(md_dir, '文章_20250101_000000.md'), 'r', encoding='utf-8') as f:
+            if '](../images/a_001.jpg)' not in f.read():
+                raise ValueError("平铺布局的图片链接应为 ../images/")
+        test_results.add_pass("归档核对 - 布局迁移")
+    except Exception as e:
+        test_results.add_fail("归档核对 - 布局迁移", str(e))
+
+
+def test_remove_stale_pdfs(test_results, temp_dir):
+    """测试只删除同一篇文章（按文章ID）以其他文件名保存的旧PDF"""
+    try:
+        pdf_dir = os.path.join(temp_dir, 'stale')
+        os.makedirs(pdf_dir)
+        write_pdf(os.path.join(pdf_dir, '旧标题.pdf'), 'aaa')
+        write_pdf(os.path.join(pdf_dir, 'AI新闻.pdf'), 'bbb')  # 标题包含新标题的其他文章
+        write_pdf(os.path.join(pdf_dir, 'A.pdf'), 'ccc')  # 标题被新标题包含的其他文章
+        write_pdf(os.path.join(pdf_dir, 'AI_20260101.pdf'))  # 正在生成、尚未写入文章ID
+        output_path = os.path.join(pdf_dir, 'AI.pdf')
+        write_pdf(output_path, 'aaa')
+
+        remove_stale_pdfs(output_path, 'https://mp.weixin.qq.com/s/aaa')
+        remaining = set(os.listdir(pdf_dir))
+        if remaining != {'AI.pdf', 'AI新闻.pdf', 'A.pdf', 'AI_20260101.pdf'}:
+            raise ValueError(f"删除的PDF错误: {sorted(remaining)}")
+        remove_stale_pdfs(os.path.join(pdf_dir, 'x.pdf'), 'https://example.com/unknown')
+        if len(os.listdir(pdf_dir)) != 4:
+            raise ValueError("无法识别文章ID时不应删除任何PDF")
+        test_results.add_pass("归档核对 - 删除旧PDF")
+    except Exception as e:
+        test_results.add_fail("归档核对 - 删除旧PDF", str(e))
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("开始归档核对测试")
+    print("=" * 60)
+
+    test_results = TestResults()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        test_pdf_metadata_roundtrip(test_results, temp_dir)
+        test_reconcile(test_results, temp_dir)
+        test_migrate_layout(test_results, temp_dir)
+        test_remove_stale_pdfs(test_results, temp_dir)
+
+    success = test_results.summary()
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
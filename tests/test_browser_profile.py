@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+浏览器配置档测试脚本
+测试同一个事件循环中的多个标签页同时保存配置档时，配置档仍是完整的JSON（不需要浏览器）
+"""
+
+import os
+import sys
+import json
+import asyncio
+import tempfile
+import threading
+import time
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from test_integration import TestResults
+from utils.browser_profile import save_storage_state_async, storage_state_path, context_options
+
+
+class FakeAsyncContext:
+    """模拟Playwright异步上下文：与Playwright一样在其他线程中分几次写入文件"""
+
+    def __init__(self, name):
+        self.state = {'cookies': [{'name': name, 'value': 'x' * 4096}], 'origins': []}
+
+    def _write(self, path):
+        data = json.dumps(self.state)
+        with open(path, 'w', encoding='utf-8') as f:
+            for start in range(0, len(data), 1024):
+                f.write(data[start:start + 1024])
+                f.flush()
+                time.sleep(0.005)
+
+    async def storage_state(self, path):
+        thread = threading.Thread(target=self._write, args=(path,))
+        thread.start()
+        while thread.is_alive():
+            await asyncio.sleep(0.001)
+
+
+async def save_concurrently(profile_dir, count):
+    contexts = [FakeAsyncContext(f'tab{i}') for i in range(count)]
+    await asyncio.gather(*(save_storage_state_async(context, 'default', profile_dir) for context in contexts))
+
+
+def test_concurrent_async_saves(test_results, temp_dir):
+    """测试同一个事件循环中同时保存配置档"""
+    try:
+        profile_dir = os.path.join(temp_dir, 'profiles')
+        for _ in range(3):
+            asyncio.run(save_concurrently(profile_dir, 4))
+            with open(storage_state_path('default', profile_dir), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if len(state['cookies']) != 1 or not state['cookies'][0]['name'].startswith('tab'):
+                raise ValueError(f"配置档内容错误: {state['cookies'][0]['name']}")
+        leftovers = [name for name in os.listdir(profile_dir) if name.endswith('.tmp')]
+        if leftovers:
+            raise ValueError(f"遗留临时文件: {leftovers}")
+        if context_options({}, 'default', profile_dir).get('storage_state') != storage_state_path('default', profile_dir):
+            raise ValueError("新建上下文时应载入保存的配置档")
+        test_results.add_pass("浏览器配置档 - 同时保存")
+    except Exception as e:
+        test_results.add_fail("浏览器配置档 - 同时保存", str(e))
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("开始浏览器配置档测试")
+    print("=" * 60)
+
+    test_results = TestResults()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        test_concurrent_async_saves(test_results, temp_dir)
+
+    success = test_results.summary()
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
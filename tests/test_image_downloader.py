@@ -0,0 +1,593 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片下载测试脚本
+使用本地HTTP服务器模拟图片服务器，测试图片下载、缓存索引、图片质量档位、下载后压缩、下载量预算、完整性检查、延后下载图片、近似重复图片、GIF动图转换和共享连接池（不需要外网）
+"""
+
+import os
+import sys
+import io
+import tempfile
+import threading
+from http.server import HTTPServer, ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from test_integration import TestResults
+from PIL import Image
+import utils.image_downloader as image_downloader_module
+from utils.image_downloader import ImageDownloader, image_variant_url
+from utils.image_cache import ImageCache, normalize_image_url
+from utils.image_optimizer import ImageOptimizer, compact_gifs
+from utils.byte_budget import ByteBudget
+from utils.deadline import DeadlineExceeded
+from utils.image_integrity import RedownloadQueue, audit_images, check_image
+from utils.pending_images import PendingImages, hydrate_article
+from utils.markdown_converter import MarkdownConverter
+from utils.image_hash import ImageHashIndex
+from utils.html_parser import WeChatArticleParser
+from utils.http_pool import POOL_STATS, PooledAdapter
+
+
+def make_png(color, size=(40, 30), image_format='PNG', **options):
+    """生成图片的字节"""
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def make_pattern(seed, image_format='PNG', noise=False, **options):
+    """生成带图案的图片（模拟横幅），noise为True时改动少量像素"""
+    image = Image.new('RGB', (320, 120), 'white')
+    pixels = image.load()
+    for x in range(320):
+        for y in range(120):
+            if (x // (20 + seed * 7) + y // (15 + seed * 5)) % 2:
+                pixels[x, y] = (30 * seed % 256, 90, 160)
+    if noise:
+        for x in range(0, 320, 40):
+            pixels[x, 5] = (0, 0, 0)
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def make_animated_gif(frames=4):
+    """生成每帧时长不同的GIF动图（渐变色，与公众号中常见的抖动GIF一样不易压缩）"""
+    images = []
+    for i in range(frames):
+        red = Image.linear_gradient('L').resize((240, 180)).rotate(i * 20)
+        green = Image.radial_gradient('L').resize((240, 180))
+        blue = Image.linear_gradient('L').resize((240, 180)).transpose(Image.FLIP_LEFT_RIGHT)
+        images.append(Image.merge('RGB', (red, green, blue)))
+    buffer = io.BytesIO()
+    images[0].save(buffer, format='GIF', save_all=True, append_images=images[1:],
+                   duration=[100, 200, 300, 400][:frames], loop=0)
+    return buffer.getvalue()
+
+
+def check_animated_webp(path, frames=4):
+    """检查WebP动图的帧数和每帧时长"""
+    with Image.open(path) as image:
+        durations = []
+        for i in range(image.n_frames):
+            image.seek(i)
+            image.load()  # WebP在解码帧时才设置时长
+            durations.append(image.info.get('duration'))
+        if image.format != 'WEBP' or durations != [100, 200, 300, 400][:frames]:
+            raise ValueError(f"{path} 不是原来的动图: {image.format} {durations}")
+
+
+def make_jpeg_with_exif(size=(800, 600)):
+    """生成带EXIF的JPEG"""
+    exif = Image.Exif()
+    exif[0x010F] = 'TestCamera'  # Make
+    return make_png('orange', size, 'JPEG', exif=exif.tobytes())
+
+
+class ImageServer:
+    """本地图片服务器，记录收到的请求"""
+
+    def __init__(self, images, no_length=(), keep_alive=False):
+        self.images = images  # 路径（可带查询参数） -> (Content-Type, 字节)
+        self.no_length = no_length  # 不发送Content-Length的路径
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep_alive 时使用HTTP/1.1长连接（所有响应都要带Content-Length）
+            protocol_version = 'HTTP/1.1' if keep_alive else 'HTTP/1.0'
+
+            def do_GET(self):
+                server.requests.append(self.path)
+                path = self.path if self.path in server.images else self.path.split('?', 1)[0]
+                if path not in server.images:
+                    self.send_error(404)
+                    return
+                content_type, body = server.images[path]
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                if path not in server.no_length:
+                    self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', f'"{len(body)}"')
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端中止了下载
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = (ThreadingHTTPServer if keep_alive else HTTPServer)(('127.0.0.1', 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path, query=''):
+        return self.base_url + path + (f"?{query}" if query else '')
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def make_downloader(temp_dir, quality='original'):
+    """创建使用临时目录的图片下载器"""
+    image_downloader_module.IMAGES_DIR = os.path.join(temp_dir, 'images')
+    image_downloader_module.IMAGE_CACHE_FILE = os.path.join(temp_dir, 'image_cache.jsonl')
+    image_downloader_module.IMAGE_HASH_FILE = os.path.join(temp_dir, 'image_hashes.jsonl')
+    return ImageDownloader(quality)
+
+
+def test_image_cache(test_results, temp_dir, server):
+    """测试重新处理文章和其他文章引用同一张图片时不再下载"""
+    try:
+        html = (f'<p><img data-src="{server.url("/a.png", "wx_fmt=png&wxfrom=5")}">'
+                f'<img src="{server.url("/b.png")}"></p>')
+        downloader = make_downloader(temp_dir)
+        _, image_map = downloader.download_images_from_html(html, '文章', 1)
+        if len(server.requests) != 2 or len(image_map) != 2:
+            raise ValueError(f"第一次应下载2张图片: {server.requests}")
+        downloader.cache.close()
+
+        # 新的下载器（模拟重新运行）：同一篇文章和引用同一张图片的其他文章都不再请求
+        server.requests.clear()
+        downloader = make_downloader(temp_dir)
+        new_html, second_map = downloader.download_images_from_html(html, '文章', 1)
+        other_html = f'<img src="{server.url("/a.png", "wxfrom=10&wx_fmt=png")}">'
+        _, other_map = downloader.download_images_from_html(other_html, '另一篇', 2)
+        if server.requests:
+            raise ValueError(f"缓存命中时不应发出请求: {server.requests}")
+        if set(second_map.values()) != set(image_map.values()):
+            raise ValueError(f"缓存应返回原来的文件: {second_map} != {image_map}")
+        if list(other_map.values()) != [image_map[server.url("/a.png", "wx_fmt=png&wxfrom=5")]]:
+            raise ValueError(f"其他文章应复用同一个文件: {other_map}")
+
+        # 本地文件被删除后重新下载，且不覆盖其他图片
+        os.remove(os.path.join(temp_dir, second_map[server.url("/b.png")]))
+        downloader.download_images_from_html(html, '文章', 1)
+        if server.requests != ['/b.png']:
+            raise ValueError(f"文件丢失后应只重新下载该图片: {server.requests}")
+        downloader.cache.close()
+
+        cache = ImageCache(os.path.join(temp_dir, 'image_cache.jsonl'), os.path.join(temp_dir, 'images'))
+        entry = cache.entries[normalize_image_url(server.url("/a.png", "wx_fmt=png"))]
+        if entry.get('etag') != f'"{entry["size"]}"' or entry.get('content_type') != 'image/png':
+            raise ValueError(f"缓存记录缺少校验信息: {entry}")
+        test_results.add_pass("图片下载 - 缓存索引")
+    except Exception as e:
+        test_results.add_fail("图片下载 - 缓存索引", str(e))
+
+
+def test_quality_tiers(test_results, temp_dir, server):
+    """测试按图片质量改写CDN链接，变体下载失败时改用原图"""
+    original_hosts = image_downloader_module.MMBIZ_HOSTS
+    try:
+        url = 'https://mmbiz.qpic.cn/mmbiz_jpg/AbC/0?wx_fmt=jpeg&tp=png'
+        expected = {
+            'original': url,
+            '640': 'https://mmbiz.qpic.cn/mmbiz_jpg/AbC/640?wx_fmt=jpeg&tp=png',
+            'webp': 'https://mmbiz.qpic.cn/mmbiz_jpg/AbC/0?wx_fmt=jpeg&tp=webp',
+        }
+        for quality, rewritten in expected.items():
+            if image_variant_url(url, quality) != rewritten:
+                raise ValueError(f"{quality} 改写错误: {image_variant_url(url, quality)}")
+        if image_variant_url('https://example.com/a/640', '1080') != 'https://example.com/a/640':
+            raise ValueError("非微信CDN的链接不应改写")
+
+        # 本地服务器当作CDN：webp 版本返回WebP，1080 版本不存在
+        image_downloader_module.MMBIZ_HOSTS = ('127.0.0.1',)
+        server.requests.clear()
+        downloader = make_downloader(os.path.join(temp_dir, 'tiers_webp'), 'webp')
+        _, image_map = downloader.download_images_from_html(
+            f'<img src="{server.url("/mmbiz_png/c/640", "wx_fmt=png")}">', '质量', 1)
+        if server.requests != ['/mmbiz_png/c/640?wx_fmt=png&tp=webp'] or \
+                not list(image_map.values())[0].endswith('.webp'):
+            raise ValueError(f"应下载WebP版本并使用.webp扩展名: {server.requests} {image_map}")
+
+        server.requests.clear()
+        downloader = make_downloader(os.path.join(temp_dir, 'tiers_1080'), '1080')
+        _, image_map = downloader.download_images_from_html(
+            f'<img src="{server.url("/mmbiz_png/c/640", "wx_fmt=png")}">', '质量', 1)
+        if server.requests != ['/mmbiz_png/c/1080?wx_fmt=png', '/mmbiz_png/c/640?wx_fmt=png'] or not image_map:
+            raise ValueError(f"变体失败后应改用原图: {server.requests}")
+        test_results.add_pass("图片下载 - 图片质量档位")
+    except Exception as e:
+        test_results.add_fail("图片下载 - 图片质量档位", str(e))
+    finally:
+        image_downloader_module.MMBIZ_HOSTS = original_hosts
+
+
+def test_optimize_images(test_results, temp_dir, server):
+    """测试下载后转换为WebP、限制尺寸、去掉元数据并更新HTML中的扩展名"""
+    try:
+        root = os.path.join(temp_dir, 'optimize')
+        downloader = make_downloader(root)
+        downloader.optimizer = ImageOptimizer('webp', max_dimension=200, quality=80, processes=1)
+        html = f'<img src="{server.url("/big.png")}"><img src="{server.url("/photo.jpg")}">'
+        new_html, image_map = downloader.download_images_from_html(html, '压缩', 1)
+        downloader.close()
+
+        paths = [image_map[server.url("/big.png")], image_map[server.url("/photo.jpg")]]
+        if not all(path.endswith('.webp') for path in paths) or any(p not in new_html for p in paths):
+            raise ValueError(f"HTML和映射应使用.webp路径: {image_map}")
+        for path in paths:
+            with Image.open(os.path.join(root, path)) as image:
+                if image.format != 'WEBP' or max(image.size) > 200:
+                    raise ValueError(f"{path} 未转换或未缩小: {image.format} {image.size}")
+                if image.getexif():
+                    raise ValueError(f"{path} 仍带有EXIF")
+        leftovers = [f for f in os.listdir(os.path.join(root, 'images')) if not f.endswith('.webp')]
+        if leftovers:
+            raise ValueError(f"原图应被替换: {leftovers}")
+        cache = ImageCache(os.path.join(root, 'image_cache.jsonl'), os.path.join(root, 'images'))
+        if cache.lookup(server.url("/big.png")) != paths[0][len('images/'):]:
+            raise ValueError("缓存应记录压缩后的文件")
+
+        # 第二张图片超时：已下载的第一张也要完成压缩并写入缓存，下次运行不再下载
+        root = os.path.join(temp_dir, 'optimize_deadline')
+        downloader = make_downloader(root)
+        downloader.optimizer = ImageOptimizer('webp', max_dimension=200, quality=80, processes=1)
+        download_preferred = downloader.download_preferred
+
+        def time_out_on_photo(url, *args, **kwargs):
+            if url.endswith('/photo.jpg'):
+                raise DeadlineExceeded("超过单篇文章的时间预算")
+            return download_preferred(url, *args, **kwargs)
+
+        downloader.download_preferred = time_out_on_photo
+        try:
+            downloader.download_images_from_html(html, '压缩超时', 1)
+            raise ValueError("超时应向上抛出")
+        except DeadlineExceeded:
+            pass
+        downloader.close()
+        cached = ImageCache(os.path.join(root, 'image_cache.jsonl'), os.path.join(root, 'images'))
+        relpath = cached.lookup(server.url("/big.png"))
+        if not relpath or not relpath.endswith('.webp') or os.listdir(os.path.join(root, 'images')) != [relpath]:
+            raise ValueError(f"超时前下载的图片应压缩后写入缓存: {relpath} {os.listdir(os.path.join(root, 'images'))}")
+        test_results.add_pass("图片下载 - 下载后压缩")
+    except Exception as e:
+        test_results.add_fail("图片下载 - 下载后压缩", str(e))
+
+
+def test_byte_budget(test_results, temp_dir, server):
+    """测试没有Content-Length时边下载边检查大小，以及单篇文章和整批任务的下载量预算"""
+    original_max_size = image_downloader_module.IMAGE_MAX_SIZE
+    try:
+        root = os.path.join(temp_dir, 'budget')
+        downloader = make_downloader(root)
+        image_downloader_module.IMAGE_MAX_SIZE = 64 * 1024
+        save_path = os.path.join(root, 'huge.bin')
+        budget = ByteBudget()
+        if downloader.download_image(server.url('/huge.bin'), save_path, budget=budget):
+            raise ValueError("超过大小上限的图片应下载失败")
+        if os.path.exists(save_path):
+            raise ValueError("中止下载后应删除已写入的部分")
+        if budget.used > 64 * 1024 + 8192:
+            raise ValueError(f"超过上限后应立即中止，实际下载了 {budget.used} 字节")
+        image_downloader_module.IMAGE_MAX_SIZE = original_max_size
+
+        # 单篇文章的预算只够一张图片：其余图片不再请求，保留原链接并计入失败
+        batch = ByteBudget(0, '整批任务')
+        article = ByteBudget(1, '单篇文章', parent=batch)
+        server.requests.clear()
+        html = ''.join(f'<img src="{server.url(path)}">' for path in ('/a.png', '/b.png', '/big.png'))
+        failed = []
+        new_html, image_map = downloader.download_images_from_html(html, '预算', 1, failed=failed, budget=article)
+        if server.requests != ['/a.png'] or len(image_map) != 1 or len(failed) != 2:
+            raise ValueError(f"预算用完后不应再下载: {server.requests} {failed}")
+        if server.url('/b.png') not in new_html or batch.used != article.used or not article.used:
+            raise ValueError("未下载的图片应保留原链接，下载量应计入整批任务")
+
+        # 整批任务的预算用完后，新的文章也不再下载
+        batch.limit = batch.used
+        server.requests.clear()
+        next_article = ByteBudget(0, '单篇文章', parent=batch)
+        downloader.download_images_from_html(f'<img src="{server.url("/photo.jpg")}">', '预算2', 2,
+                                             budget=next_article)
+        if server.requests or next_article.exhausted_name() != '整批任务':
+            raise ValueError(f"整批任务预算用完后不应再下载: {server.requests}")
+        downloader.close()
+        test_results.add_pass("图片下载 - 下载量预算")
+    except Exception as e:
+        test_results.add_fail("图片下载 - 下载量预算", str(e))
+    finally:
+        image_downloader_module.IMAGE_MAX_SIZE = original_max_size
+
+
+def test_integrity(test_results, temp_dir, server):
+    """测试按文件头识别扩展名、丢弃截断和非图片的响应，以及检查归档后只重新下载损坏的图片"""
+    try:
+        root = os.path.join(temp_dir, 'integrity')
+        downloader = make_downloader(root)
+        html = (f'<img src="{server.url("/mmbiz/noext/0", "wx_fmt=jpeg")}">'
+                f'<img src="{server.url("/truncated.png")}"><img src="{server.url("/error.png")}">'
+                f'<img src="{server.url("/mmbiz/gif/0", "wx_fmt=gif")}">')
+        failed = []
+        _, image_map = downloader.download_images_from_html(html, '完整性', 1, failed=failed)
+        if not image_map.get(server.url("/mmbiz/noext/0", "wx_fmt=jpeg"), '').endswith('.png'):
+            raise ValueError(f"应按文件头使用.png扩展名: {image_map}")
+        if not image_map.get(server.url("/mmbiz/gif/0", "wx_fmt=gif"), '').endswith('.gif'):
+            raise ValueError(f"没有扩展名时应按 wx_fmt 命名: {image_map}")
+        if sorted(failed) != sorted([server.url("/truncated.png"), server.url("/error.png")]):
+            raise ValueError(f"截断的图片和错误页面应下载失败: {failed}")
+        images_dir = os.path.join(root, 'images')
+        if any(f.endswith('.part') or 'truncated' in f for f in os.listdir(images_dir)):
+            raise ValueError("失败的下载不应留下文件")
+
+        # 一张图片被截断、一张被删除：检查后只重新下载这两张，写回原路径
+        png_path, gif_path = (os.path.join(root, path) for path in image_map.values())
+        with open(png_path, 'r+b') as f:
+            f.truncate(os.path.getsize(png_path) // 2)
+        os.remove(gif_path)
+        queue = RedownloadQueue(os.path.join(root, 'redownload.jsonl'))
+        stats = audit_images(downloader.cache, queue)
+        if stats != {'checked': 2, 'queued': 2}:
+            raise ValueError(f"应发现2张损坏的图片: {stats} {queue.entries}")
+        server.requests.clear()
+        if downloader.redownload(queue) != (2, 0) or len(queue) or len(server.requests) != 2:
+            raise ValueError(f"应只重新下载损坏的图片: {server.requests} {queue.entries}")
+        if check_image(png_path) or check_image(gif_path):
+            raise ValueError("重新下载后的图片仍不完整")
+        if audit_images(downloader.cache, RedownloadQueue(os.path.join(root, 'again.jsonl')))['queued']:
+            raise ValueError("重新下载后再次检查不应有损坏的图片")
+        downloader.close()
+        test_results.add_pass("图片下载 - 完整性检查")
+    except Exception as e:
+        test_results.add_fail("图片下载 - 完整性检查", str(e))
+
+
+def test_deferred_images(test_results, temp_dir, server):
+    """测试延后下载：Markdown先引用远程图片，补全后原地改为本地链接，失败的图片留在待下载列表中"""
+    try:
+        root = os.path.join(temp_dir, 'deferred')
+        downloader = make_downloader(root)
+        html = (f'<p>正文</p><img data-src="{server.url("/a.png", "wx_fmt=png&from=appmsg")}">'
+                f'<img src="{server.url("/missing.png")}"><img data-src="{server.url("/a.png", "wx_fmt=png&from=appmsg")}">')
+        server.requests.clear()
+        content_html, urls = downloader.prepare_deferred(html)
+        if server.requests or len(urls) != 2:
+            raise ValueError(f"延后下载时不应请求图片: {server.requests} {urls}")
+
+        md_dir = os.path.join(root, 'markdown', '公众号')
+        os.makedirs(md_dir)
+        md_path = os.path.join(md_dir, '文章.md')
+        markdown = MarkdownConverter().html_to_markdown(content_html, image_prefix='../../')
+        with open(md_path, 'w', encoding='utf-8') as f:
+            f.write(markdown)
+        if markdown.count(urls[0]) != 2:
+            raise ValueError(f"Markdown应引用远程图片: {markdown}")
+
+        pending = PendingImages(os.path.join(root, 'pending_images.jsonl'))
+        pending.add(md_path, '文章', 3, urls)
+        count, failed = hydrate_article(downloader, PendingImages(pending.path).entries[md_path],
+                                        os.path.join(root, 'images'))
+        pending.update(md_path, failed)
+        if count != 1 or failed != [server.url("/missing.png")]:
+            raise ValueError(f"应下载1张、失败1张: {count} {failed}")
+        with open(md_path, 'r', encoding='utf-8') as f:
+            hydrated = f.read()
+        if urls[0] in hydrated or hydrated.count('](../../images/') != 2 or server.url("/missing.png") not in hydrated:
+            raise ValueError(f"Markdown链接未正确改写: {hydrated}")
+        if PendingImages(pending.path).entries[md_path]['images'] != failed:
+            raise ValueError("失败的图片应留在待下载列表中")
+        pending.update(md_path, [])
+        if len(PendingImages(pending.path)):
+            raise ValueError("全部下载后应从列表中移除")
+        downloader.close()
+        test_results.add_pass("图片下载 - 延后下载")
+    except Exception as e:
+        test_results.add_fail("图片下载 - 延后下载", str(e))
+
+
+def test_near_duplicates(test_results, temp_dir, server):
+    """测试感知哈希：下载时把重新压缩的图片链接到已有图片，批量补算已有图片并用硬链接合并"""
+    try:
+        html = (f'<img src="{server.url("/banner.png")}"><img src="{server.url("/banner.jpg")}">'
+                f'<img src="{server.url("/other.png")}"><img src="{server.url("/banner2.png")}">')
+        root = os.path.join(temp_dir, 'dedup')
+        downloader = make_downloader(root)
+        downloader.dedup = True
+        _, image_map = downloader.download_images_from_html(html, '横幅', 1)
+        downloader.close()
+        paths = [image_map[server.url(path)] for path in ('/banner.png', '/banner.jpg', '/other.png', '/banner2.png')]
+        if not paths[0] == paths[1] == paths[3] or paths[2] == paths[0]:
+            raise ValueError(f"重新压缩的横幅应改用同一个文件，其他图片不应合并: {paths}")
+        if downloader.hashes.duplicates != 2 or not downloader.hashes.reclaimed:
+            raise ValueError(f"应记录2张重复图片: {downloader.hashes.duplicates}")
+        if len(os.listdir(os.path.join(root, 'images'))) != 2:
+            raise ValueError("重复的文件应被删除")
+
+        # 未开启去重时下载的归档：批量补算哈希，找出重复并用硬链接合并扩展名相同的图片
+        root = os.path.join(temp_dir, 'backfill')
+        downloader = make_downloader(root)
+        downloader.hashes = None
+        _, image_map = downloader.download_images_from_html(html, '横幅', 1)
+        downloader.close()
+        index = ImageHashIndex(os.path.join(root, 'hashes.jsonl'), os.path.join(root, 'images'))
+        if index.backfill(processes=1) != 4 or index.backfill(processes=1) != 0:
+            raise ValueError("应为4张图片计算哈希，再次运行时不重复计算")
+        groups = ImageHashIndex(index.index_path, index.images_dir).duplicate_groups()
+        banner = [image_map[server.url(path)][len('images/'):] for path in ('/banner.png', '/banner.jpg', '/banner2.png')]
+        if groups != {banner[0]: sorted(banner[1:])}:
+            raise ValueError(f"重复分组错误: {groups}")
+        index.link(banner[0], banner[2])
+        if not os.path.samefile(os.path.join(index.images_dir, banner[0]), os.path.join(index.images_dir, banner[2])):
+            raise ValueError("应替换为硬链接")
+        if ImageHashIndex(index.index_path, index.images_dir).duplicate_groups() != {banner[0]: [banner[1]]}:
+            raise ValueError("已合并的图片不应再计入重复")
+        index.close()
+        test_results.add_pass("图片下载 - 近似重复图片")
+    except Exception as e:
+        test_results.add_fail("图片下载 - 近似重复图片", str(e))
+
+
+def test_animated_gif(test_results, temp_dir, server):
+    """测试下载时把GIF动图转换为WebP动图，以及转换已有归档并改写Markdown链接（可重复运行）"""
+    try:
+        root = os.path.join(temp_dir, 'gif')
+        downloader = make_downloader(root)
+        downloader.optimizer = ImageOptimizer(None, 0, 80, processes=0, animated_gif=True)
+        html = f'<img src="{server.url("/anim.gif")}"><img src="{server.url("/static.gif")}">'
+        _, image_map = downloader.download_images_from_html(html, '动图', 1)
+        downloader.close()
+        anim, static = image_map[server.url("/anim.gif")], image_map[server.url("/static.gif")]
+        if not anim.endswith('.webp') or not static.endswith('.gif'):
+            raise ValueError(f"只应转换动图: {image_map}")
+        check_animated_webp(os.path.join(root, anim))
+        if os.path.exists(os.path.join(root, anim[:-len('.webp')] + '.gif')):
+            raise ValueError("未要求保留时应删除原GIF")
+
+        # 已有归档：Markdown引用GIF，转换后链接改为WebP，缓存指向新文件
+        root = os.path.join(temp_dir, 'gif_archive')
+        downloader = make_downloader(root)
+        _, image_map = downloader.download_images_from_html(html, '归档', 2)
+        md_dir = os.path.join(root, 'markdown', '公众号')
+        os.makedirs(md_dir)
+        md_path = os.path.join(md_dir, '归档.md')
+        with open(md_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(f'![图](../../{path})\n' for path in image_map.values()))
+        images_dir = os.path.join(root, 'images')
+        optimizer = ImageOptimizer(None, 0, 80, processes=1, animated_gif=True)
+        stats = compact_gifs(images_dir, os.path.join(root, 'markdown'), optimizer, downloader.cache)
+        if (stats['converted'], stats['unchanged'], stats['links']) != (1, 1, 1) or not stats['saved']:
+            raise ValueError(f"转换统计错误: {stats}")
+        with open(md_path, 'r', encoding='utf-8') as f:
+            links = f.read()
+        webp = image_map[server.url("/anim.gif")][:-len('.gif')] + '.webp'
+        if f'../../{webp}' not in links or image_map[server.url("/static.gif")] not in links:
+            raise ValueError(f"Markdown链接未正确改写: {links}")
+        check_animated_webp(os.path.join(root, webp))
+        if downloader.cache.lookup(server.url("/anim.gif")) != webp[len('images/'):]:
+            raise ValueError("缓存应指向WebP")
+
+        # 再次运行不重复转换；保留原GIF中断后也能补做链接改写
+        stats = compact_gifs(images_dir, os.path.join(root, 'markdown'), optimizer, downloader.cache)
+        optimizer.close()
+        downloader.close()
+        if stats['converted'] or stats['links'] or stats['unchanged'] != 1:
+            raise ValueError(f"再次运行不应重复转换: {stats}")
+        test_results.add_pass("图片下载 - GIF动图转换")
+    except Exception as e:
+        test_results.add_fail("图片下载 - GIF动图转换", str(e))
+
+
+def test_shared_pool(test_results, temp_dir):
+    """测试文章解析器和图片下载器共用连接池，并发下载时复用长连接"""
+    server = ImageServer({f'/{i}.png': ('image/png', make_png((i * 8, 0, 0))) for i in range(24)}, keep_alive=True)
+    try:
+        downloader = make_downloader(os.path.join(temp_dir, 'pool'))
+        parser = WeChatArticleParser()
+        if downloader.session.get_adapter(server.base_url) is not parser.session.get_adapter(server.base_url):
+            raise ValueError("文章解析器和图片下载器应共用一个传输适配器")
+
+        before = POOL_STATS.snapshot()
+        failed = []
+
+        def download(start):
+            html = ''.join(f'<img src="{server.url(f"/{i}.png")}">' for i in range(start, 24, 4))
+            downloader.download_images_from_html(html, f'文章{start}', start, failed=failed)
+
+        threads = [threading.Thread(target=download, args=(start,)) for start in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        downloader.close()
+        after = POOL_STATS.snapshot()
+        requests_count = after['requests'] - before['requests']
+        connections = after['connections'] - before['connections']
+        if failed or requests_count != 24:
+            raise ValueError(f"应下载24张图片: 请求 {requests_count} 次，失败 {failed}")
+        if connections > 4:
+            raise ValueError(f"4个线程最多应新建4个连接，实际 {connections} 个")
+
+        adapter = PooledAdapter(pool_size=8, host_sizes={'127.0.0.1': 2})
+        pool = adapter.poolmanager.connection_from_url(server.url('/0.png'))
+        other = adapter.poolmanager.connection_from_url('http://localhost:1/')
+        if pool.pool.maxsize != 2 or other.pool.maxsize != 8:
+            raise ValueError(f"按主机设置的连接数无效: {pool.pool.maxsize}, {other.pool.maxsize}")
+        test_results.add_pass("图片下载 - 共享连接池")
+    except Exception as e:
+        test_results.add_fail("图片下载 - 共享连接池", str(e))
+    finally:
+        server.close()
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("开始图片下载测试")
+    print("=" * 60)
+
+    test_results = TestResults()
+    original_dirs = (image_downloader_module.IMAGES_DIR, image_downloader_module.IMAGE_CACHE_FILE,
+                     image_downloader_module.IMAGE_HASH_FILE)
+    server = ImageServer({
+        '/a.png': ('image/png', make_png('red')),
+        '/b.png': ('image/png', make_png('blue')),
+        '/mmbiz_png/c/640': ('image/png', make_png('green', (640, 480))),
+        '/big.png': ('image/png', make_png('purple', (1200, 900))),
+        '/photo.jpg': ('image/jpeg', make_jpeg_with_exif()),
+        '/mmbiz_png/c/640?wx_fmt=png&tp=webp': ('image/webp', make_png('green', (640, 480), 'WEBP')),
+        '/huge.bin': ('image/png', make_png('red')[:16] + os.urandom(1024 * 1024)),
+        '/mmbiz/noext/0': ('application/octet-stream', make_png('white')),
+        '/mmbiz/gif/0': ('application/octet-stream', make_png('black', image_format='GIF')),
+        '/truncated.png': ('image/png', make_png('gray', (300, 300))[:200]),
+        '/error.png': ('image/png', '<html><body>404 Not Found</body></html>'.encode()),
+        '/banner.png': ('image/png', make_pattern(1)),
+        '/banner.jpg': ('image/jpeg', make_pattern(1, 'JPEG', quality=60)),
+        '/banner2.png': ('image/png', make_pattern(1, noise=True)),
+        '/other.png': ('image/png', make_pattern(2)),
+        '/anim.gif': ('image/gif', make_animated_gif()),
+        '/static.gif': ('image/gif', make_pattern(3, 'GIF')),
+    }, no_length=('/huge.bin', '/truncated.png'))
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            test_image_cache(test_results, temp_dir, server)
+            test_quality_tiers(test_results, temp_dir, server)
+            test_optimize_images(test_results, temp_dir, server)
+            test_byte_budget(test_results, temp_dir, server)
+            test_integrity(test_results, temp_dir, server)
+            test_deferred_images(test_results, temp_dir, server)
+            test_near_duplicates(test_results, temp_dir, server)
+            test_animated_gif(test_results, temp_dir, server)
+            test_shared_pool(test_results, temp_dir)
+    finally:
+        server.close()
+        (image_downloader_module.IMAGES_DIR, image_downloader_module.IMAGE_CACHE_FILE,
+         image_downloader_module.IMAGE_HASH_FILE) = original_dirs
+
+    success = test_results.summary()
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
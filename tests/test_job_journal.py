@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务日志测试脚本
+测试任务日志的记录与回放、失败分类、--resume 断点续传、retry 重试、验证页面隔离以及单篇文章时间预算（不需要网络）
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from test_integration import TestResults
+from utils import job_journal
+from utils.job_journal import JobJournal, classify_error, get_article_id
+from utils.deadline import Deadline, DeadlineExceeded, MIN_TIMEOUT
+from utils.progress import read_status, PROGRESS_BUDGET_EXHAUSTED
+from utils.quarantine import QuarantineQueue
+import wechat_article_downloader
+from wechat_article_downloader import WeChatArticleDownloader
+
+
+def test_record_and_replay(test_results, temp_dir):
+    """测试日志记录后能被重新加载"""
+    try:
+        path = os.path.join(temp_dir, 'replay.jsonl')
+        journal = JobJournal(path)
+        journal.record('https://mp.weixin.qq.com/s/aaa', job_journal.STAGE_QUEUED)
+        journal.record('https://mp.weixin.qq.com/s/aaa', job_journal.STAGE_MD, md_path='/tmp/a.md')
+        journal.record('https://mp.weixin.qq.com/s/bbb', job_journal.STATE_FAILED,
+                       error_class=job_journal.ERROR_TIMEOUT, error='timed out')
+        journal.close()
+
+        # 模拟中断时写了一半的最后一行
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('{"url": "https://mp.weixin.qq.com/s/ccc", "sta')
+
+        reloaded = JobJournal(path)
+        record = reloaded.get('https://mp.weixin.qq.com/s/aaa')
+        if record['state'] != job_journal.STAGE_MD or record['md_path'] != '/tmp/a.md':
+            raise ValueError(f"回放结果错误: {record}")
+        if reloaded.get('https://mp.weixin.qq.com/s/ccc') is not None:
+            raise ValueError("不完整的日志行不应被加载")
+        failures = reloaded.failures([job_journal.ERROR_TIMEOUT])
+        if len(failures) != 1 or failures[0]['url'] != 'https://mp.weixin.qq.com/s/bbb':
+            raise ValueError(f"失败记录查询错误: {failures}")
+
+        # 失败后重试成功：再次回放时不应保留上一次的失败信息
+        reloaded.record('https://mp.weixin.qq.com/s/bbb', job_journal.STAGE_QUEUED)
+        reloaded.record('https://mp.weixin.qq.com/s/bbb', job_journal.STATE_DONE, md_path='/tmp/b.md')
+        reloaded.close()
+        replayed = JobJournal(path)
+        record = replayed.get('https://mp.weixin.qq.com/s/bbb')
+        if record['state'] != job_journal.STATE_DONE or set(job_journal.FAILURE_FIELDS) & set(record):
+            raise ValueError(f"重试成功后回放仍有失败信息: {record}")
+        if replayed.failures():
+            raise ValueError(f"重试成功的任务不应出现在失败列表中: {replayed.failures()}")
+        replayed.close()
+        test_results.add_pass("任务日志 - 记录与回放")
+    except Exception as e:
+        test_results.add_fail("任务日志 - 记录与回放", str(e))
+
+
+def test_classify_and_article_id(test_results):
+    """测试失败分类和文章ID提取"""
+    try:
+        cases = [
+            (Exception("获取文章失败: Read timed out"), job_journal.ERROR_TIMEOUT),
+            (Exception("当前环境异常，完成验证后即可继续访问"), job_journal.ERROR_VERIFICATION),
+            (ConnectionError("reset"), job_journal.ERROR_NETWORK),
+            (ValueError("奇怪的错误"), job_journal.ERROR_UNKNOWN),
+        ]
+        for error, expected in cases:
+            if classify_error(error) != expected:
+                raise ValueError(f"{error} 应分类为 {expected}，实际为 {classify_error(error)}")
+
+        if get_article_id('https://mp.weixin.qq.com/s/AbC123') != 'AbC123':
+            raise ValueError("短链接文章ID提取错误")
+        long_url = 'https://mp.weixin.qq.com/s?__biz=MzA5&mid=2650&idx=2&sn=abc'
+        if get_article_id(long_url) != 'MzA5_2650_2':
+            raise ValueError("长链接文章ID提取错误")
+        test_results.add_pass("任务日志 - 失败分类与文章ID")
+    except Exception as e:
+        test_results.add_fail("任务日志 - 失败分类与文章ID", str(e))
+
+
+def test_resume_skips_finished(test_results, temp_dir):
+    """测试 --resume 只处理未完成的文章"""
+    try:
+        path = os.path.join(temp_dir, 'resume.jsonl')
+        journal = JobJournal(path)
+        journal.record('https://mp.weixin.qq.com/s/done', job_journal.STATE_DONE)
+        journal.record('https://mp.weixin.qq.com/s/failed', job_journal.STATE_FAILED,
+                       error_class=job_journal.ERROR_MISSING_PDF)
+        journal.record('https://mp.weixin.qq.com/s/inflight', job_journal.STAGE_IMAGES)
+        journal.close()
+
+        downloader = WeChatArticleDownloader(download_format='md', workers=2, journal_path=path,
+                                             status_path=os.path.join(temp_dir, 'status.json'))
+        processed = []
+
+        def fake_download(url, article_index=0, skip_existing=True, resume_record=None):
+            processed.append((url, skip_existing, resume_record and resume_record.get('state')))
+            return {'success': True, 'skipped': False, 'url': url}
+
+        downloader.download_article = fake_download
+        downloader.download_from_urls([
+            'https://mp.weixin.qq.com/s/done',
+            'https://mp.weixin.qq.com/s/failed',
+            'https://mp.weixin.qq.com/s/inflight',
+            'https://mp.weixin.qq.com/s/new',
+        ], resume=True)
+
+        expected = {
+            ('https://mp.weixin.qq.com/s/inflight', False, job_journal.STAGE_IMAGES),
+            ('https://mp.weixin.qq.com/s/new', False, None),
+        }
+        if set(processed) != expected:
+            raise ValueError(f"续传处理的文章不正确: {processed}")
+        status = read_status(os.path.join(temp_dir, 'status.json'))
+        if not status or status['state'] != 'finished' or status['total'] != 2:
+            raise ValueError(f"进度文件内容错误: {status}")
+        test_results.add_pass("任务日志 - 断点续传")
+    except Exception as e:
+        test_results.add_fail("任务日志 - 断点续传", str(e))
+
+
+def test_retry_by_failure_class(test_results, temp_dir):
+    """测试 retry 只重新处理指定失败分类的文章"""
+    try:
+        path = os.path.join(temp_dir, 'retry.jsonl')
+        md_path = os.path.join(temp_dir, 'article.md')
+        with open(md_path, 'w', encoding='utf-8') as f:
+            f.write('# article\n')
+
+        journal = JobJournal(path)
+        journal.record('https://mp.weixin.qq.com/s/pdf', job_journal.STAGE_MD, md_path=md_path)
+        journal.record('https://mp.weixin.qq.com/s/pdf', job_journal.STATE_FAILED,
+                       failed_stage=job_journal.STAGE_PDF, error_class=job_journal.ERROR_MISSING_PDF)
+        journal.record('https://mp.weixin.qq.com/s/slow', job_journal.STATE_FAILED,
+                       failed_stage=job_journal.STAGE_QUEUED, error_class=job_journal.ERROR_TIMEOUT)
+        journal.record('https://mp.weixin.qq.com/s/ok', job_journal.STATE_DONE)
+        journal.close()
+
+        downloader = WeChatArticleDownloader(download_format='both', journal_path=path,
+                                             status_path=os.path.join(temp_dir, 'status.json'))
+        processed = []
+
+        def fake_download(url, article_index=0, skip_existing=True, resume_record=None):
+            processed.append((url, downloader._can_resume_from_markdown(resume_record)))
+            return {'success': True, 'skipped': False, 'url': url}
+
+        downloader.download_article = fake_download
+        downloader.retry_failed([job_journal.ERROR_MISSING_PDF])
+
+        if processed != [('https://mp.weixin.qq.com/s/pdf', True)]:
+            raise ValueError(f"重试的文章不正确: {processed}")
+        test_results.add_pass("任务日志 - 按失败分类重试")
+    except Exception as e:
+        test_results.add_fail("任务日志 - 按失败分类重试", str(e))
+
+
+def test_quarantine_verification(test_results, temp_dir):
+    """测试遇到验证页面的文章进入隔离队列，冷却后重试，不影响其他文章"""
+    original_queue = wechat_article_downloader.QuarantineQueue
+    try:
+        path = os.path.join(temp_dir, 'quarantine.jsonl')
+        downloader = WeChatArticleDownloader(download_format='md', workers=2, journal_path=path,
+                                             status_path=os.path.join(temp_dir, 'status.json'))
+        wechat_article_downloader.QuarantineQueue = lambda: QuarantineQueue(
+            base_delay=0.05, max_delay=0.1, max_attempts=2)
+        calls = []
+
+        def fake_download(url, article_index=0, skip_existing=True, resume_record=None):
+            calls.append((url, skip_existing))
+            if url.endswith('/blocked') and len([c for c in calls if c[0] == url]) == 1 or url.endswith('/always'):
+                downloader._record(url, job_journal.STATE_FAILED, error_class=job_journal.ERROR_VERIFICATION)
+                return {'success': False, 'url': url, 'error': '检测到验证页面',
+                        'error_class': job_journal.ERROR_VERIFICATION}
+            downloader._record(url, job_journal.STATE_DONE)
+            return {'success': True, 'skipped': False, 'url': url}
+
+        downloader.download_article = fake_download
+        urls = ['https://mp.weixin.qq.com/s/blocked', 'https://mp.weixin.qq.com/s/always',
+                'https://mp.weixin.qq.com/s/ok']
+        results = downloader._run_jobs([(i, url, None) for i, url in enumerate(urls)])
+
+        if [c[0] for c in calls].count(urls[0]) != 2 or [c[0] for c in calls].count(urls[1]) != 3:
+            raise ValueError(f"隔离重试次数错误: {calls}")
+        if (urls[0], False) not in calls:
+            raise ValueError("隔离后重试不应跳过已存在的文件")
+        outcome = {r['url']: r['success'] for r in results}
+        if outcome != {urls[0]: True, urls[1]: False, urls[2]: True}:
+            raise ValueError(f"最终结果错误: {outcome}")
+        if downloader.journal.get_state(urls[0]) != job_journal.STATE_DONE:
+            raise ValueError("重试成功后任务日志应为done")
+        status = read_status(os.path.join(temp_dir, 'status.json'))
+        if status['succeeded'] != 2 or status['failed'] != 1 or status['in_flight']:
+            raise ValueError(f"进度计数错误: {status}")
+        test_results.add_pass("任务日志 - 验证页面隔离重试")
+    except Exception as e:
+        test_results.add_fail("任务日志 - 验证页面隔离重试", str(e))
+    finally:
+        wechat_article_downloader.QuarantineQueue = original_queue
+
+
+def test_article_deadline(test_results, temp_dir):
+    """测试单篇文章的时间预算用完后按超时失败，不再等待后续阶段"""
+    try:
+        path = os.path.join(temp_dir, 'deadline.jsonl')
+        downloader = WeChatArticleDownloader(download_format='md', journal_path=path,
+                                             status_path=os.path.join(temp_dir, 'status.json'),
+                                             article_deadline=1)
+
+        class FakeParser:
+            def fetch_article(self, url, deadline=None):
+                return '<html></html>'
+
+            def parse_article(self, html_content, url=None):
+                return {'title': '慢文章', 'author': '作者', 'account': '公众号',
+                        'publish_time': '2024-01-01', 'content_html': '<p>正文</p>'}
+
+        class SlowImages:
+            def download_images_from_html(self, html_content, title, article_index=0, failed=None, deadline=None,
+                                          budget=None):
+                deadline.sleep(30)  # 模拟很慢的图片，只会等到时间预算用完
+                return html_content, {}
+
+        downloader._parser = FakeParser()
+        downloader._image_downloader = SlowImages()
+        url = 'https://mp.weixin.qq.com/s/slow'
+        start = time.time()
+        result = downloader.download_article(url, skip_existing=False)
+        elapsed = time.time() - start
+
+        if result['success'] or result['error_class'] != job_journal.ERROR_TIMEOUT:
+            raise ValueError(f"超过时间预算应按超时失败: {result}")
+        if elapsed > 5:
+            raise ValueError(f"时间预算没有限制住处理时间: {elapsed:.1f} 秒")
+        record = downloader.journal.get(url)
+        if record['state'] != job_journal.STATE_FAILED or record['failed_stage'] != job_journal.STAGE_IMAGES:
+            raise ValueError(f"任务日志记录错误: {record}")
+        test_results.add_pass("任务日志 - 单篇文章时间预算")
+    except Exception as e:
+        test_results.add_fail("任务日志 - 单篇文章时间预算", str(e))
+
+
+def test_deadline_timeouts(test_results):
+    """测试截止时间给出的超时不会为0或接近0，以及异步操作的超时"""
+    try:
+        deadline = Deadline(10)
+        deadline.expires_at = time.time() + MIN_TIMEOUT / 2
+        for call in (lambda: deadline.timeout(30), lambda: deadline.timeout_ms(30000), lambda: deadline.check()):
+            try:
+                call()
+                raise ValueError("剩余时间不足 MIN_TIMEOUT 时应抛出 DeadlineExceeded")
+            except DeadlineExceeded:
+                pass
+        if Deadline(10).timeout(5) != 5 or Deadline(0).timeout_ms(3000) != 3000:
+            raise ValueError("超时时间应不超过原本的超时时间")
+
+        async def slow():
+            await asyncio.sleep(5)
+
+        started = time.time()
+        try:
+            asyncio.run(Deadline(0.3).wait_async(slow(), 60, '生成PDF'))
+            raise ValueError("超过截止时间的异步操作应抛出 DeadlineExceeded")
+        except DeadlineExceeded as e:
+            if '生成PDF' not in str(e):
+                raise ValueError(f"错误信息应包含阶段: {e}")
+        try:
+            asyncio.run(Deadline(0).wait_async(slow(), 0.3, '执行页面脚本'))
+            raise ValueError("超过操作超时时间的异步操作应抛出 TimeoutError")
+        except DeadlineExceeded:
+            raise ValueError("未超过截止时间时不应抛出 DeadlineExceeded")
+        except TimeoutError:
+            pass
+        if time.time() - started > 2:
+            raise ValueError(f"异步操作没有按超时结束: {time.time() - started:.1f} 秒")
+        test_results.add_pass("任务日志 - 截止时间的超时")
+    except Exception as e:
+        test_results.add_fail("任务日志 - 截止时间的超时", str(e))
+
+
+def test_batch_budget_stop(test_results, temp_dir):
+    """测试整批任务的下载量预算用完后停止，进度状态与Ctrl+C中断区分"""
+    try:
+        path = os.path.join(temp_dir, 'budget.jsonl')
+        status_path = os.path.join(temp_dir, 'budget_status.json')
+        downloader = WeChatArticleDownloader(download_format='md', workers=1, journal_path=path,
+                                             status_path=status_path, batch_max_bytes=1000)
+        processed = []
+
+        def fake_download(url, article_index=0, skip_existing=True, resume_record=None):
+            processed.append(url)
+            downloader.batch_budget.consume(600)
+            return {'success': True, 'skipped': False, 'url': url}
+
+        downloader.download_article = fake_download
+        urls = [f'https://mp.weixin.qq.com/s/budget{i}' for i in range(5)]
+        downloader.download_from_urls(urls)
+
+        if processed != urls[:2]:
+            raise ValueError(f"预算用完后不应再开始新的文章: {processed}")
+        status = read_status(status_path)
+        if status['state'] != PROGRESS_BUDGET_EXHAUSTED:
+            raise ValueError(f"进度状态应为 {PROGRESS_BUDGET_EXHAUSTED}: {status['state']}")
+        test_results.add_pass("任务日志 - 整批任务下载量预算")
+    except Exception as e:
+        test_results.add_fail("任务日志 - 整批任务下载量预算", str(e))
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("开始任务日志测试")
+    print("=" * 60)
+
+    test_results = TestResults()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        test_record_and_replay(test_results, temp_dir)
+        test_classify_and_article_id(test_results)
+        test_resume_skips_finished(test_results, temp_dir)
+        test_retry_by_failure_class(test_results, temp_dir)
+        test_quarantine_verification(test_results, temp_dir)
+        test_article_deadline(test_results, temp_dir)
+        test_deadline_timeouts(test_results)
+        test_batch_budget_stop(test_results, temp_dir)
+
+    success = test_results.summary()
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
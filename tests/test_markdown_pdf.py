@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线Markdown转PDF测试脚本
+测试公式识别：正文中的金额、代码块和行内代码中的 $ 不当作公式（不需要浏览器）
+"""
+
+import os
+import sys
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from test_integration import TestResults
+from utils.markdown_pdf import _extract_formulas, markdown_to_html
+
+
+# (Markdown, 识别出的公式)
+FORMULA_CASES = [
+    ("公式 $x^2$ 和 $\\alpha + \\beta$，以及 $a$。", [('x^2', False), ('\\alpha + \\beta', False), ('a', False)]),
+    ("$$\nE = mc^2\n$$\n", [('E = mc^2', True)]),
+    ("售价 $5，折后 $3", []),
+    ("价格在 $5 到 $10 之间", []),
+    ("$x$5 不是公式", []),
+    ("$ x $ 前后有空格不是公式", []),
+    ("转义的 \\$5 和公式 $k$", [('k', False)]),
+    ("```bash\necho \"$HOME $PATH\"\nprice='$x$'\n```\n代码块之后 $y$", [('y', False)]),
+    ("~~~\n$$\nnot = math\n$$\n~~~\n", []),
+    ("行内代码 `echo $HOME $x$` 与 $z$", [('z', False)]),
+    ("双反引号 `` a ` $b$ `` 之后 $c$", [('c', False)]),
+    ("```\n未闭合的代码块 $a$\n", []),
+]
+
+
+def test_formula_detection(test_results):
+    """测试行内公式、块级公式和不是公式的 $"""
+    try:
+        wrong = []
+        for markdown_content, expected in FORMULA_CASES:
+            replaced, formulas = _extract_formulas(markdown_content)
+            if formulas != expected:
+                wrong.append(f"{markdown_content!r}: {formulas}")
+            elif not formulas and replaced != markdown_content:
+                wrong.append(f"{markdown_content!r} 不应被修改: {replaced!r}")
+        if wrong:
+            raise ValueError('；'.join(wrong))
+        test_results.add_pass("Markdown转PDF - 公式识别")
+    except Exception as e:
+        test_results.add_fail("Markdown转PDF - 公式识别", str(e))
+
+
+def test_html_output(test_results):
+    """测试渲染后的HTML中只有公式变为MathML，代码和金额保持原样"""
+    try:
+        markdown_content = (
+            "# 标题\n\n售价 $5，折后 $3，面积 $S = \\pi r^2$。\n\n"
+            "```python\ncost = '$5 $3'\n```\n\n行内 `$x$` 结束\n"
+        )
+        document, title = markdown_to_html(markdown_content, project_root)
+        if title != '标题':
+            raise ValueError(f"标题错误: {title}")
+        if document.count('<math') != 1:
+            raise ValueError(f"应只有一个公式: {document.count('<math')}")
+        for text in ('售价 $5，折后 $3', "cost = '$5 $3'", '<code>$x$</code>'):
+            if text not in document.replace('&#x27;', "'").replace('&#39;', "'"):
+                raise ValueError(f"应保留原文: {text}")
+        test_results.add_pass("Markdown转PDF - HTML输出")
+    except Exception as e:
+        test_results.add_fail("Markdown转PDF - HTML输出", str(e))
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("开始离线Markdown转PDF测试")
+    print("=" * 60)
+
+    test_results = TestResults()
+    test_formula_detection(test_results)
+    test_html_output(test_results)
+
+    success = test_results.summary()
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+音视频下载测试脚本
+使用支持Range的本地HTTP服务器模拟媒体服务器，测试音视频提取、分段并行下载、断点续传和不支持Range时的下载（不需要外网）
+"""
+
+import os
+import sys
+import re
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from test_integration import TestResults
+from utils.html_parser import WeChatArticleParser
+from utils.markdown_converter import MarkdownConverter
+from utils.media_downloader import MediaDownloader
+
+
+class MediaServer:
+    """本地媒体服务器，支持单个Range请求，记录收到的Range"""
+
+    def __init__(self, files, no_range=()):
+        self.files = files  # 路径 -> 字节
+        self.no_range = no_range  # 不支持Range的路径
+        self.fail_from = None  # 起始位置不小于该值的分段返回500
+        self.ranges = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in server.files:
+                    self.send_error(404)
+                    return
+                body = server.files[self.path]
+                match = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+                with server.lock:
+                    server.ranges.append((self.path, match.group(0) if match else None))
+                if match and self.path not in server.no_range:
+                    start, end = int(match.group(1)), min(int(match.group(2)), len(body) - 1)
+                    if server.fail_from is not None and start >= server.fail_from and start > 0:
+                        self.send_error(500)
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{len(body)}')
+                    body = body[start:end + 1]
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', 'video/mp4')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', f'"{len(server.files[self.path])}"')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path):
+        return self.base_url + path
+
+    def segment_requests(self, path):
+        """除探测请求以外的分段请求"""
+        return [r for p, r in self.ranges if p == path and r != 'bytes=0-0']
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def test_extract_media(test_results, server):
+    """测试解析时把嵌入的视频、音频替换为链接"""
+    try:
+        html = f'''<html><body><div id="js_content">
+            <p>正文</p>
+            <video src="{server.url('/clip.mp4')}"></video>
+            <audio><source src="//example.com/song.mp3"></audio>
+            <mpvoice voice_encode_fileid="MzA5_1" name="语音一"></mpvoice>
+            <iframe data-src="https://v.qq.com/txp/iframe/player.html?vid=x"></iframe>
+        </div></body></html>'''
+        content = WeChatArticleParser(extract_media=True).parse_article(html)['content_html']
+        markdown = MarkdownConverter().html_to_markdown(content)
+        expected = [
+            f"[视频]({server.url('/clip.mp4')})",
+            "[音频](https://example.com/song.mp3)",
+            "[音频: 语音一](https://res.wx.qq.com/voice/getvoice?mediaid=MzA5_1)",
+        ]
+        for link in expected:
+            if link not in markdown:
+                raise ValueError(f"Markdown缺少链接 {link}:\n{markdown}")
+        if 'v.qq.com' in markdown:
+            raise ValueError("播放页iframe不应当作媒体文件")
+        plain = WeChatArticleParser(extract_media=False).parse_article(html)['content_html']
+        if 'data-media' in plain:
+            raise ValueError("未开启时不应提取音视频")
+        test_results.add_pass("音视频下载 - 提取嵌入的音视频")
+    except Exception as e:
+        test_results.add_fail("音视频下载 - 提取嵌入的音视频", str(e))
+
+
+def test_segmented_download(test_results, temp_dir, server):
+    """测试分段并行下载，并在Markdown中链接到本地文件"""
+    try:
+        downloader = MediaDownloader(segments=4, segment_size=64 * 1024, media_dir=os.path.join(temp_dir, 'media'))
+        html = f'<p><a data-media="video" href="{server.url("/clip.mp4")}">视频</a></p>'
+        new_html, count = downloader.download_media_from_html(html, '文章: 标题', 3, '../media/')
+        path = os.path.join(temp_dir, 'media', '文章_标题_003_media01.mp4')
+        if count != 1 or '../media/文章_标题_003_media01.mp4' not in new_html:
+            raise ValueError(f"链接未改为本地路径: {new_html}")
+        with open(path, 'rb') as f:
+            if f.read() != server.files['/clip.mp4']:
+                raise ValueError("下载的内容与原文件不同")
+        segments = server.segment_requests('/clip.mp4')
+        if len(segments) != 5:
+            raise ValueError(f"应分5段下载: {segments}")
+        if os.path.exists(path + '.part') or os.path.exists(path + '.part.json'):
+            raise ValueError("完成后应删除临时文件")
+        test_results.add_pass("音视频下载 - 分段并行下载")
+    except Exception as e:
+        test_results.add_fail("音视频下载 - 分段并行下载", str(e))
+
+
+def test_resume(test_results, temp_dir, server):
+    """测试中断后只下载未完成的分段"""
+    try:
+        downloader = MediaDownloader(segments=2, segment_size=64 * 1024, media_dir=os.path.join(temp_dir, 'resume'))
+        path = os.path.join(temp_dir, 'resume', 'clip.mp4')
+        server.ranges.clear()
+        server.fail_from = 3 * 64 * 1024
+        if downloader.download(server.url('/clip.mp4'), path):
+            raise ValueError("分段失败时不应报告成功")
+        if os.path.exists(path) or not os.path.exists(path + '.part.json'):
+            raise ValueError("失败时应保留 .part 和进度文件")
+
+        server.ranges.clear()
+        server.fail_from = None
+        if not downloader.download(server.url('/clip.mp4'), path):
+            raise ValueError("继续下载失败")
+        with open(path, 'rb') as f:
+            if f.read() != server.files['/clip.mp4']:
+                raise ValueError("继续下载后的内容与原文件不同")
+        expected = [f'bytes={3 * 65536}-{4 * 65536 - 1}', f'bytes={4 * 65536}-{len(server.files["/clip.mp4"]) - 1}']
+        if sorted(server.segment_requests('/clip.mp4')) != expected:
+            raise ValueError(f"应只下载未完成的分段: {server.segment_requests('/clip.mp4')}")
+        test_results.add_pass("音视频下载 - 断点续传")
+    except Exception as e:
+        test_results.add_fail("音视频下载 - 断点续传", str(e))
+
+
+def test_no_range(test_results, temp_dir, server):
+    """测试服务器不支持Range时单连接下载"""
+    try:
+        downloader = MediaDownloader(segments=4, segment_size=64 * 1024, media_dir=os.path.join(temp_dir, 'plain'))
+        path = os.path.join(temp_dir, 'plain', 'song.mp3')
+        server.ranges.clear()
+        if not downloader.download(server.url('/song.mp3'), path):
+            raise ValueError("下载失败")
+        with open(path, 'rb') as f:
+            if f.read() != server.files['/song.mp3']:
+                raise ValueError("下载的内容与原文件不同")
+        if len(server.ranges) != 2:
+            raise ValueError(f"应只有探测和一次完整下载: {server.ranges}")
+        test_results.add_pass("音视频下载 - 不支持Range的服务器")
+    except Exception as e:
+        test_results.add_fail("音视频下载 - 不支持Range的服务器", str(e))
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("音视频下载测试")
+    print("=" * 60)
+
+    test_results = TestResults()
+    server = MediaServer({
+        '/clip.mp4': os.urandom(4 * 64 * 1024 + 1000),
+        '/song.mp3': os.urandom(100 * 1024),
+    }, no_range=('/song.mp3',))
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            test_extract_media(test_results, server)
+            test_segmented_download(test_results, temp_dir, server)
+            test_resume(test_results, temp_dir, server)
+            test_no_range(test_results, temp_dir, server)
+    finally:
+        server.close()
+
+    success = test_results.summary()
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
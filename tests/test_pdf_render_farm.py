@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程PDF渲染测试脚本
+测试进程树内存统计，以及用模拟的工作进程（不启动浏览器）测试错误类型的传递、内存超限回收、进程异常退出后的重启、
+丢失和超时的任务，以及多个进程在同一目录中清理旧PDF
+"""
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import multiprocessing
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from test_integration import TestResults
+from utils import pdf_render_farm
+from utils.pdf_render_farm import (
+    PdfRenderFarm, process_tree_rss, MSG_STARTED, MSG_FINISHED, MSG_RECYCLE, TASK_MARKDOWN
+)
+from utils.quarantine import VerificationRequired
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.job_journal import classify_error, ERROR_VERIFICATION, ERROR_TIMEOUT
+
+
+def stub_worker(worker_id, tasks, results, max_rss):
+    """模拟的工作进程：按URL决定渲染结果，消息格式与 _worker_main 相同"""
+    pid = os.getpid()
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        job_id, kind, url, output_path, options, deadline = task
+        if url.startswith('vanish:'):
+            # 领取任务后、报告开始前被杀死（如内存不足被系统杀死），只发生一次
+            marker = url.split(':', 1)[1]
+            if not os.path.exists(marker):
+                open(marker, 'w').close()
+                os._exit(9)
+        results.put((MSG_STARTED, worker_id, pid, job_id))
+        if url == 'crash':
+            # 渲染过程中崩溃（先等开始消息发出）
+            time.sleep(0.5)
+            os._exit(3)
+        if url == 'hang':
+            time.sleep(10)
+        error = None
+        if url == 'verify':
+            error = ('VerificationRequired', '检测到验证页面')
+        elif url == 'deadline':
+            error = ('DeadlineExceeded', '超过单篇文章的时间预算')
+        elif url == 'error':
+            error = ('ValueError', '渲染失败')
+        if url == 'recycle':
+            results.put((MSG_RECYCLE, worker_id, pid, 2048 * 1024 * 1024))
+        if kind == TASK_MARKDOWN:
+            # 离线打印Markdown：按Markdown文件名命名，图片目录随任务传入
+            name = os.path.splitext(os.path.basename(url))[0] + f"@{options['images_dir']}"
+        else:
+            name = pid
+        results.put((MSG_FINISHED, worker_id, pid, job_id, (f"{output_path}/{name}.pdf", None), error))
+        if url == 'recycle':
+            break
+
+
+def write_and_clean_pdfs(pdf_dir, worker, rounds):
+    """在同一目录中反复写入本进程的文章PDF并清理旧PDF（多个进程同时运行）"""
+    from test_archive_index import write_pdf
+    from utils.wechat_to_pdf_perfect import remove_stale_pdfs
+    for i in range(rounds):
+        output_path = os.path.join(pdf_dir, f"{'AI' * (worker + 1)}_{i}.pdf")
+        write_pdf(output_path, f'article{worker}')
+        remove_stale_pdfs(output_path, f'https://mp.weixin.qq.com/s/article{worker}')
+
+
+def test_process_tree_rss(test_results):
+    """测试统计进程及其子进程的常驻内存"""
+    if not os.path.isdir('/proc'):
+        test_results.add_pass("多进程PDF渲染 - 进程树内存（非Linux，跳过）")
+        return
+    child = None
+    try:
+        before = process_tree_rss(os.getpid())
+        if not before or before <= 0:
+            raise ValueError(f"应能读取当前进程的内存: {before}")
+        # 子进程占用约64MB后等待
+        child = subprocess.Popen([sys.executable, '-c',
+                                  'import sys, time; data = bytearray(64 * 1024 * 1024); '
+                                  'print("ready", flush=True); time.sleep(30)'],
+                                 stdout=subprocess.PIPE, text=True)
+        child.stdout.readline()
+        with_child = process_tree_rss(os.getpid())
+        if with_child - before < 48 * 1024 * 1024:
+            raise ValueError(f"应计入子进程的内存: {before} -> {with_child}")
+        if process_tree_rss(child.pid) > with_child:
+            raise ValueError("子进程的内存不应大于整个进程树")
+        if process_tree_rss(2 ** 22 + 12345) is not None:
+            raise ValueError("不存在的进程应返回None")
+        test_results.add_pass("多进程PDF渲染 - 进程树内存")
+    except Exception as e:
+        test_results.add_fail("多进程PDF渲染 - 进程树内存", str(e))
+    finally:
+        if child is not None:
+            child.kill()
+            child.wait()
+
+
+def expect_error(farm, url, error_type):
+    try:
+        farm.render(url, 'out')
+    except error_type as e:
+        return e
+    raise ValueError(f"{url} 应抛出 {error_type.__name__}")
+
+
+def test_errors_and_restart(test_results):
+    """测试错误类型的传递、内存超限回收和异常退出后重启"""
+    farm = None
+    try:
+        farm = PdfRenderFarm(1, worker=stub_worker)
+        first = farm.render('ok', 'out')
+        if not first.startswith('out/'):
+            raise ValueError(f"渲染结果错误: {first}")
+
+        error = expect_error(farm, 'verify', VerificationRequired)
+        if classify_error(error) != ERROR_VERIFICATION:
+            raise ValueError("验证页面应分类为 verification")
+        error = expect_error(farm, 'deadline', DeadlineExceeded)
+        if classify_error(error) != ERROR_TIMEOUT:
+            raise ValueError("超时应分类为 timeout")
+        error = expect_error(farm, 'error', RuntimeError)
+        if str(error) != 'ValueError: 渲染失败':
+            raise ValueError(f"错误信息应只有类型和信息: {error!r}")
+
+        # 离线Markdown转PDF也由工作进程处理（不再每篇文章启动一个浏览器）
+        if farm.render_markdown('/tmp/文章.md', 'out', images_dir='imgs') != 'out/文章@imgs.pdf':
+            raise ValueError("Markdown转PDF应交给工作进程处理")
+        if farm.render_markdown('error', 'out') is not False:
+            raise ValueError("Markdown转PDF失败时应返回False")
+
+        # 内存超限：当前任务正常返回，进程退出后由新进程接手
+        farm.render('recycle', 'out')
+        second = farm.render('ok', 'out')
+        if farm.recycled != 1 or second == first:
+            raise ValueError(f"内存超限后应重启工作进程: recycled={farm.recycled}, {first} -> {second}")
+
+        # 异常退出：正在处理的任务失败，之后的任务由重启的进程处理
+        error = expect_error(farm, 'crash', RuntimeError)
+        if '退出码 3' not in str(error):
+            raise ValueError(f"应报告进程异常退出: {error}")
+        third = farm.render('ok', 'out')
+        if third in (first, second):
+            raise ValueError("异常退出后应重启工作进程")
+        test_results.add_pass("多进程PDF渲染 - 错误类型、回收和重启")
+    except Exception as e:
+        test_results.add_fail("多进程PDF渲染 - 错误类型、回收和重启", str(e))
+    finally:
+        if farm is not None:
+            started = time.time()
+            farm.close()
+            if time.time() - started > 10:
+                test_results.add_fail("多进程PDF渲染 - 关闭", "关闭渲染池耗时过长")
+
+
+def test_lost_and_stuck_jobs(test_results, temp_dir):
+    """测试领取后未开始就退出的任务重新分派，以及超过截止时间仍未返回的任务"""
+    farm = None
+    try:
+        farm = PdfRenderFarm(1, worker=stub_worker)
+        marker = os.path.join(temp_dir, 'vanished')
+        future = farm.submit(f'vanish:{marker}', 'out')
+        result, _ = future.result(timeout=30)
+        if not os.path.exists(marker) or not result.startswith('out/'):
+            raise ValueError(f"任务应由重启的进程完成: {result}")
+
+        pdf_render_farm.RESULT_GRACE = 0.5
+        started = time.time()
+        try:
+            farm.render('hang', 'out', deadline=Deadline(0.5))
+            raise ValueError("超过截止时间仍未返回时应抛出 DeadlineExceeded")
+        except DeadlineExceeded:
+            pass
+        if time.time() - started > 2.5:
+            raise ValueError(f"等待时间应以截止时间为限: {time.time() - started:.1f} 秒")
+        # 卡住的进程被结束，下一篇文章由重启的进程处理，不需要等卡住的任务结束
+        started = time.time()
+        farm.render('ok', 'out')
+        if time.time() - started > 5:
+            raise ValueError("超过截止时间的工作进程应被结束")
+        test_results.add_pass("多进程PDF渲染 - 丢失和超时的任务")
+    except Exception as e:
+        test_results.add_fail("多进程PDF渲染 - 丢失和超时的任务", str(e))
+    finally:
+        pdf_render_farm.RESULT_GRACE = 30
+        if farm is not None:
+            farm.close()
+
+
+def test_concurrent_stale_pdf_cleanup(test_results, temp_dir):
+    """测试多个进程同时向同一目录写入PDF并清理旧PDF时，不会删除其他文章的PDF"""
+    try:
+        pdf_dir = os.path.join(temp_dir, 'pdf')
+        os.makedirs(pdf_dir)
+        mp = multiprocessing.get_context('spawn')
+        processes = [mp.Process(target=write_and_clean_pdfs, args=(pdf_dir, worker, 10)) for worker in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        if any(process.exitcode != 0 for process in processes):
+            raise ValueError("写入PDF的进程出错")
+        expected = {f"{'AI' * (worker + 1)}_9.pdf" for worker in range(4)}
+        if set(os.listdir(pdf_dir)) != expected:
+            raise ValueError(f"每篇文章应只保留最新的PDF: {sorted(os.listdir(pdf_dir))}")
+        test_results.add_pass("多进程PDF渲染 - 同一目录中清理旧PDF")
+    except Exception as e:
+        test_results.add_fail("多进程PDF渲染 - 同一目录中清理旧PDF", str(e))
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("开始多进程PDF渲染测试")
+    print("=" * 60)
+
+    test_results = TestResults()
+    test_process_tree_rss(test_results)
+    test_errors_and_restart(test_results)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        test_lost_and_stuck_jobs(test_results, temp_dir)
+        test_concurrent_stale_pdf_cleanup(test_results, temp_dir)
+
+    success = test_results.summary()
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF渲染请求拦截测试脚本
+用模拟的请求和响应对象（不需要浏览器）测试按资源类型和域名放行/拦截的判断，以及统计描述和加载用时
+"""
+
+import os
+import sys
+import time
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from test_integration import TestResults
+from utils.resource_policy import ResourcePolicy
+
+
+class FakeRequest:
+    """模拟Playwright请求对象"""
+
+    def __init__(self, resource_type, url):
+        self.resource_type = resource_type
+        self.url = url
+
+
+class FakeResponse:
+    """模拟Playwright响应对象"""
+
+    def __init__(self, headers):
+        self.headers = headers
+
+
+# (资源类型, URL, 是否放行)
+DECISIONS = [
+    ('document', 'https://mp.weixin.qq.com/s/abc', True),
+    ('stylesheet', 'https://res.wx.qq.com/mmbizappmsg/zh_CN/htmledition/style.css', True),
+    ('image', 'https://mmbiz.qpic.cn/mmbiz_jpg/abc/640?wx_fmt=jpeg', True),
+    ('image', 'https://a.mmbiz.qpic.cn/mmbiz_png/abc/0', True),
+    ('image', 'https://res.wx.qq.com/mmbizappmsg/zh_CN/htmledition/icon.png', False),
+    ('image', 'https://evilmmbiz.qpic.cn/abc.png', False),
+    ('image', 'https://mmbiz.qpic.cn.example.com/abc.png', False),
+    ('image', 'data:image/png;base64,iVBORw0KGgo=', True),
+    ('script', 'https://res.wx.qq.com/mmbizappmsg/zh_CN/htmledition/appmsg.js', False),
+    ('script', 'https://mmbiz.qpic.cn/tracker.js', False),
+    ('xhr', 'https://mp.weixin.qq.com/mp/getcomment', False),
+    ('font', 'https://res.wx.qq.com/fonts/x.woff2', False),
+    ('media', 'https://mpvideo.qpic.cn/abc.mp4', False),
+    ('script', 'blob:https://mp.weixin.qq.com/1234', True),
+]
+
+
+def test_decisions(test_results):
+    """测试资源类型 × 域名的放行判断"""
+    try:
+        policy = ResourcePolicy(('document', 'stylesheet', 'image'), ('mmbiz.qpic.cn',))
+        wrong = [
+            f"{resource_type} {url} 应{'放行' if expected else '拦截'}"
+            for resource_type, url, expected in DECISIONS
+            if policy.check(FakeRequest(resource_type, url)) != expected
+        ]
+        if wrong:
+            raise ValueError('；'.join(wrong))
+        allowed = sum(1 for _, _, expected in DECISIONS if expected)
+        if policy.allowed != allowed:
+            raise ValueError(f"放行计数错误: {policy.allowed} != {allowed}")
+        if policy.blocked != {'image': 3, 'script': 2, 'xhr': 1, 'font': 1, 'media': 1}:
+            raise ValueError(f"拦截计数错误: {policy.blocked}")
+
+        # 放行范围可配置
+        custom = ResourcePolicy(('document', 'image', 'font'), ('res.wx.qq.com',))
+        if not custom.allows('font', 'https://res.wx.qq.com/fonts/x.woff2'):
+            raise ValueError("配置放行的资源类型应放行")
+        if custom.allows('stylesheet', 'https://res.wx.qq.com/style.css'):
+            raise ValueError("未配置的资源类型应拦截")
+        if custom.allows('image', 'https://mmbiz.qpic.cn/abc/640'):
+            raise ValueError("未配置的图片域名应拦截")
+        test_results.add_pass("请求拦截 - 放行判断")
+    except Exception as e:
+        test_results.add_fail("请求拦截 - 放行判断", str(e))
+
+
+def test_summary(test_results):
+    """测试统计描述"""
+    try:
+        policy = ResourcePolicy(('document', 'stylesheet', 'image'), ('mmbiz.qpic.cn',))
+        if policy.summary() != "拦截 0 个请求，放行 0 个，已加载 0.00 MB，加载用时 0.0 秒":
+            raise ValueError(f"空统计错误: {policy.summary()}")
+
+        for resource_type, url in [
+            ('document', 'https://mp.weixin.qq.com/s/abc'),
+            ('script', 'https://res.wx.qq.com/a.js'),
+            ('script', 'https://res.wx.qq.com/b.js'),
+            ('font', 'https://res.wx.qq.com/x.woff2'),
+        ]:
+            policy.check(FakeRequest(resource_type, url))
+        for headers in [
+            {'content-length': str(1024 * 1024)},
+            {'content-length': str(512 * 1024)},
+            {'content-length': 'abc'},  # 无效的Content-Length不计入
+            {},  # 没有Content-Length（分块传输）不计入
+        ]:
+            policy.on_response(FakeResponse(headers))
+        policy.started_at = time.time() - 2.5  # 模拟页面加载了 2.5 秒
+
+        expected = "拦截 3 个请求（script 2, font 1），放行 1 个，已加载 1.50 MB，加载用时 2.5 秒"
+        if policy.summary() != expected:
+            raise ValueError(f"统计描述错误: {policy.summary()}")
+        test_results.add_pass("请求拦截 - 统计描述")
+    except Exception as e:
+        test_results.add_fail("请求拦截 - 统计描述", str(e))
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("开始PDF渲染请求拦截测试")
+    print("=" * 60)
+
+    test_results = TestResults()
+    test_decisions(test_results)
+    test_summary(test_results)
+
+    success = test_results.summary()
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+配置读取测试脚本
+用初始版本的 config.py（没有之后新增的配置项）测试升级后程序仍能启动，且新配置项的默认值与 config.example.py 一致；
+自定义的 config.py 中的值和输出目录不被默认值覆盖
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from test_integration import TestResults
+
+
+# 初始版本的 config.example.py
+OLD_CONFIG = '''
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+MARKDOWN_DIR = os.path.join(OUTPUT_DIR, "markdown")
+IMAGES_DIR = os.path.join(OUTPUT_DIR, "images")
+PDF_DIR = os.path.join(OUTPUT_DIR, "pdf")
+
+REQUEST_TIMEOUT = 30
+MAX_RETRIES = 3
+RETRY_DELAY = 2
+
+USER_AGENT = "Mozilla/5.0"
+
+IMAGE_TIMEOUT = 60
+IMAGE_MAX_SIZE = 10 * 1024 * 1024
+
+INVALID_CHARS = ['/', '\\\\', ':', '*', '?', '"', '<', '>', '|']
+'''
+
+# 在子进程中运行：临时目录中的旧 config.py 优先于项目中的 config.py
+CHECK_SCRIPT = '''
+import sys, runpy
+sys.path[:0] = [sys.argv[1], sys.argv[2]]
+import settings
+example = runpy.run_path(sys.argv[3])
+names = [name for name in example if name.isupper() and name != 'USER_AGENT']
+missing = [name for name in names if not hasattr(settings, name)]
+different = [name for name in names if hasattr(settings, name) and getattr(settings, name) != example[name]]
+if missing or different:
+    sys.exit(f"缺少 {missing}，默认值不同 {different}")
+import wechat_article_downloader
+sys.argv = ['wechat_article_downloader.py', '--help']
+wechat_article_downloader.main()
+'''
+
+
+# 在子进程中运行：自定义了输出目录和部分新配置项的 config.py
+CUSTOM_SCRIPT = '''
+import os, sys
+sys.path[:0] = [sys.argv[1], sys.argv[2]]
+import settings
+output_dir = os.path.join(sys.argv[1], 'archive')
+expected = {
+    'OUTPUT_DIR': output_dir,
+    'JOURNAL_FILE': os.path.join(output_dir, 'journal.jsonl'),
+    'MEDIA_DIR': os.path.join(output_dir, 'media'),
+    'ARTICLE_MAX_BYTES': 12345,
+    'MAX_WORKERS': 1,
+}
+wrong = {name: getattr(settings, name) for name, value in expected.items() if getattr(settings, name) != value}
+if wrong:
+    sys.exit(f"配置项错误 {wrong}")
+'''
+
+
+def test_old_config(test_results, temp_dir):
+    """测试旧的 config.py 缺少新配置项时使用默认值"""
+    try:
+        with open(os.path.join(temp_dir, 'config.py'), 'w', encoding='utf-8') as f:
+            f.write(OLD_CONFIG)
+        # 与旧配置放在同一目录，BASE_DIR 等路径相同
+        example_path = os.path.join(temp_dir, 'example.py')
+        shutil.copy(os.path.join(project_root, 'config.example.py'), example_path)
+        result = subprocess.run(
+            [sys.executable, '-c', CHECK_SCRIPT, temp_dir, project_root, example_path],
+            capture_output=True, text=True, cwd=temp_dir
+        )
+        if result.returncode != 0:
+            raise ValueError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else result.returncode)
+        if 'usage:' not in result.stdout:
+            raise ValueError(f"--help 没有输出帮助: {result.stdout}")
+        test_results.add_pass("配置读取 - 旧的config.py")
+    except Exception as e:
+        test_results.add_fail("配置读取 - 旧的config.py", str(e))
+
+
+def test_custom_config(test_results, temp_dir):
+    """测试默认路径放在用户配置的 OUTPUT_DIR 下，用户配置的新配置项不被默认值覆盖"""
+    try:
+        config_dir = os.path.join(temp_dir, 'custom')
+        os.makedirs(config_dir)
+        custom = OLD_CONFIG.replace('os.path.join(BASE_DIR, "output")', 'os.path.join(BASE_DIR, "archive")')
+        with open(os.path.join(config_dir, 'config.py'), 'w', encoding='utf-8') as f:
+            f.write(custom + 'ARTICLE_MAX_BYTES = 12345\n')
+        result = subprocess.run(
+            [sys.executable, '-c', CUSTOM_SCRIPT, config_dir, project_root],
+            capture_output=True, text=True, cwd=config_dir
+        )
+        if result.returncode != 0:
+            raise ValueError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else result.returncode)
+        test_results.add_pass("配置读取 - 自定义的config.py")
+    except Exception as e:
+        test_results.add_fail("配置读取 - 自定义的config.py", str(e))
+
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("开始配置读取测试")
+    print("=" * 60)
+
+    test_results = TestResults()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        test_old_config(test_results, temp_dir)
+        test_custom_config(test_results, temp_dir)
+
+    success = test_results.summary()
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
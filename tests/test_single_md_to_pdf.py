@@ -1,19 +1,37 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-测试单个Markdown文件转换为PDF
+测试单个Markdown文件转换为PDF（使用本地图片，不需要网络）
+
+用法: python tests/test_single_md_to_pdf.py [Markdown文件] [PDF输出路径]
+默认转换Markdown目录中的第一个文件
 """
 
 import os
 import sys
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from markdown_to_pdf_with_local_images import convert_md_to_pdf_with_local_images
+# 添加项目根目录到路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from settings import MARKDOWN_DIR, IMAGES_DIR, OUTPUT_DIR
+from utils import layout
+from utils.markdown_pdf import convert_md_to_pdf_with_local_images
 
 # 测试文件
-md_file = '/Users/fanyumeng/Documents/公众号/公众号文章导出/WeChat-Articles-Batch-Downloader/output/markdown/-2dB的消声室_20260106_184543.md'
-pdf_output = '/Users/fanyumeng/Documents/公众号/公众号文章导出/WeChat-Articles-Batch-Downloader/output/pdf_with_images/-2dB的消声室_20260106_184543.pdf'
-images_dir = '/Users/fanyumeng/Documents/公众号/公众号文章导出/WeChat-Articles-Batch-Downloader/output/images'
+if len(sys.argv) > 1:
+    md_file = sys.argv[1]
+else:
+    md_files = sorted(layout.iter_files(MARKDOWN_DIR, ('.md',)))
+    if not md_files:
+        print(f"❌ {MARKDOWN_DIR} 中没有Markdown文件，请先下载文章或指定文件")
+        sys.exit(1)
+    md_file = md_files[0]
+pdf_dir = os.path.join(OUTPUT_DIR, 'pdf_with_images')
+pdf_output = sys.argv[2] if len(sys.argv) > 2 else os.path.join(
+    pdf_dir, os.path.splitext(os.path.basename(md_file))[0] + '.pdf'
+)
+images_dir = IMAGES_DIR
 
 os.makedirs(os.path.dirname(pdf_output), exist_ok=True)
 
@@ -24,4 +42,4 @@ if success:
     print(f"\n✅ 测试成功！PDF文件: {pdf_output}")
 else:
     print(f"\n❌ 测试失败")
-
+    sys.exit(1)
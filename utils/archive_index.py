@@ -0,0 +1,343 @@
+"""
+归档索引模块
+以文章ID为键建立Markdown、PDF和图片的索引，一次线性扫描找出缺失、重复和孤立的文件，
+并支持在平铺和分片布局之间迁移已有归档
+"""
+import os
+import re
+import shutil
+from urllib.parse import unquote
+from utils.job_journal import get_article_id
+from utils.layout import (
+    iter_files, image_relpath, markdown_dir_for, pdf_dir_for
+)
+from utils.pdf_metadata import read_article_id, sanitize_filename
+
+
+# Markdown末尾元数据中的原文链接
+SOURCE_URL_PATTERN = re.compile(r'原文链接\*{0,2}[：:]\s*(https?://\S+)')
+# Markdown末尾元数据中的其他字段
+FOOTER_FIELD_PATTERN = re.compile(r'^\*\*(作者|公众号|发布时间)\*\*:\s*(.+?)\s*$', re.MULTILINE)
+# Markdown图片引用
+IMAGE_REF_PATTERN = re.compile(r'!\[[^\]]*\]\(([^)\s]+)\)')
+IMAGE_LINK_PATTERN = re.compile(r'(!\[[^\]]*\]\()([^)\s]+)(\))')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.avif')
+
+
+def parse_markdown_file(md_path):
+    """
+    从Markdown文件中提取标题、原文链接和本地图片引用
+
+    Args:
+        md_path: Markdown文件路径
+
+    Returns:
+        dict: 包含 title、url、author、account、publish_time、images（图片绝对路径列表）
+    """
+    with open(md_path, 'r', encoding='utf-8', errors='replace') as f:
+        content = f.read()
+    return _parse_markdown_content(md_path, content)
+
+
+def _parse_markdown_content(md_path, content):
+    """解析Markdown内容，见 parse_markdown_file"""
+    first_line = content.split('\n', 1)[0]
+    title = first_line[2:].strip() if first_line.startswith('# ') else None
+
+    # 原文链接在文件末尾，从最后一次出现的位置开始匹配
+    url = None
+    footer_pos = content.rfind('原文链接')
+    if footer_pos >= 0:
+        match = SOURCE_URL_PATTERN.search(content, footer_pos)
+        if match:
+            url = match.group(1).rstrip('.,;!?')
+
+    fields = {}
+    separator_pos = content.rfind('\n---\n')
+    if separator_pos >= 0:
+        fields = dict(FOOTER_FIELD_PATTERN.findall(content, separator_pos))
+
+    md_dir = os.path.dirname(md_path)
+    images = []
+    for ref in IMAGE_REF_PATTERN.findall(content):
+        if ref.startswith(('http://', 'https://', 'data:', '//')):
+            continue
+        images.append(os.path.normpath(os.path.join(md_dir, unquote(ref))))
+
+    return {
+        'title': title,
+        'url': url,
+        'author': fields.get('作者'),
+        'account': fields.get('公众号'),
+        'publish_time': fields.get('发布时间'),
+        'images': images,
+    }
+
+
+def reconcile_archive(markdown_dir, pdf_dir, images_dir):
+    """
+    核对归档：每个目录只扫描一次，按文章ID建立索引后比较
+
+    Args:
+        markdown_dir: Markdown目录
+        pdf_dir: PDF目录
+        images_dir: 图片目录
+
+    Returns:
+        dict: 核对报告
+    """
+    markdown_by_id = {}
+    markdown_by_title = {}
+    unidentified_markdown = []
+    referenced_images = set()
+    missing_images = []
+    md_count = 0
+
+    image_files = set(os.path.normpath(p) for p in iter_files(images_dir, IMAGE_EXTENSIONS))
+
+    # 1. Markdown：从末尾元数据读取文章ID，同时收集图片引用
+    for md_path in iter_files(markdown_dir, ('.md',)):
+        md_count += 1
+        try:
+            info = parse_markdown_file(md_path)
+        except OSError:
+            unidentified_markdown.append(md_path)
+            continue
+
+        article_id = get_article_id(info['url']) if info['url'] else None
+        if article_id:
+            markdown_by_id.setdefault(article_id, []).append(md_path)
+            if info['title']:
+                markdown_by_title[sanitize_filename(info['title'])] = article_id
+        else:
+            unidentified_markdown.append(md_path)
+
+        for image_path in info['images']:
+            referenced_images.add(image_path)
+            if image_path not in image_files:
+                missing_images.append({'markdown': md_path, 'image': image_path})
+
+    # 2. PDF：读取写入的文章ID，旧PDF按标题对应的文件名回退匹配
+    pdf_by_id = {}
+    unidentified_pdf = []
+    pdf_count = 0
+    for pdf_path in iter_files(pdf_dir, ('.pdf',)):
+        pdf_count += 1
+        article_id = read_article_id(pdf_path)
+        if not article_id:
+            stem = os.path.splitext(os.path.basename(pdf_path))[0]
+            article_id = markdown_by_title.get(stem)
+        if article_id:
+            pdf_by_id.setdefault(article_id, []).append(pdf_path)
+        else:
+            unidentified_pdf.append(pdf_path)
+
+    missing_pdf = [
+        {'article_id': article_id, 'markdown': paths[0]}
+        for article_id, paths in markdown_by_id.items() if article_id not in pdf_by_id
+    ]
+    missing_markdown = [
+        {'article_id': article_id, 'pdf': paths[0]}
+        for article_id, paths in pdf_by_id.items() if article_id not in markdown_by_id
+    ]
+
+    return {
+        'counts': {
+            'markdown': md_count,
+            'pdf': pdf_count,
+            'images': len(image_files),
+            'articles': len(set(markdown_by_id) | set(pdf_by_id)),
+        },
+        'missing_pdf': sorted(missing_pdf, key=lambda item: item['markdown']),
+        'missing_markdown': sorted(missing_markdown, key=lambda item: item['pdf']),
+        'duplicate_markdown': {k: sorted(v) for k, v in markdown_by_id.items() if len(v) > 1},
+        'duplicate_pdf': {k: sorted(v) for k, v in pdf_by_id.items() if len(v) > 1},
+        'unidentified_markdown': sorted(unidentified_markdown),
+        'unidentified_pdf': sorted(unidentified_pdf),
+        'missing_images': missing_images,
+        'orphan_images': sorted(image_files - referenced_images),
+    }
+
+
+def print_report(report):
+    """打印核对报告"""
+    counts = report['counts']
+    print("=" * 70)
+    print("归档核对结果")
+    print("=" * 70)
+    print(f"Markdown文件: {counts['markdown']}")
+    print(f"PDF文件: {counts['pdf']}")
+    print(f"图片文件: {counts['images']}")
+    print(f"文章数: {counts['articles']}")
+
+    sections = [
+        ('missing_pdf', "缺少PDF的文章", lambda item: f"{item['article_id']}: {item['markdown']}"),
+        ('missing_markdown', "缺少Markdown的文章", lambda item: f"{item['article_id']}: {item['pdf']}"),
+        ('unidentified_markdown', "无法识别文章ID的Markdown", str),
+        ('unidentified_pdf', "无法识别文章ID的PDF", str),
+        ('missing_images', "引用了不存在图片的Markdown", lambda item: f"{item['markdown']} -> {item['image']}"),
+        ('orphan_images', "未被引用的图片", str),
+    ]
+    for key, label, fmt in sections:
+        items = report[key]
+        print(f"\n{label}: {len(items)}")
+        for item in items[:20]:
+            print(f"  - {fmt(item)}")
+        if len(items) > 20:
+            print(f"  ... 还有 {len(items) - 20} 项（使用 --json 查看完整结果）")
+
+    for key, label in (('duplicate_markdown', "重复的Markdown"), ('duplicate_pdf', "重复的PDF")):
+        groups = report[key]
+        print(f"\n{label}: {len(groups)} 组")
+        for article_id, paths in list(groups.items())[:20]:
+            print(f"  {article_id}:")
+            for path in paths:
+                print(f"    - {path}")
+    print("=" * 70)
+
+
+def _move(src, dst, dry_run):
+    """移动文件，目标目录不存在时自动创建"""
+    if dry_run:
+        return
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.move(src, dst)
+
+
+def _remove_empty_dirs(root):
+    """删除迁移后留下的空目录（保留根目录）"""
+    for current, dirs, files in os.walk(root, topdown=False):
+        if current != root and not os.listdir(current):
+            os.rmdir(current)
+
+
+def rewrite_image_links(markdown_dir, renamed, dry_run=False):
+    """
+    改写Markdown中指向已改名图片的链接
+
+    Args:
+        markdown_dir: Markdown目录
+        renamed: 旧图片路径 -> 新图片路径（绝对路径）
+        dry_run: 只统计，不写入
+
+    Returns:
+        dict: markdown（改写的文件数）、links（改写的链接数）
+    """
+    stats = {'markdown': 0, 'links': 0}
+    renamed = {os.path.normpath(old): new for old, new in renamed.items()}
+    for md_path in list(iter_files(markdown_dir, ('.md',))):
+        with open(md_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        md_dir = os.path.dirname(os.path.abspath(md_path))
+
+        def rewrite_link(match):
+            ref = match.group(2)
+            if ref.startswith(('http://', 'https://', 'data:', '//')):
+                return match.group(0)
+            new_path = renamed.get(os.path.normpath(os.path.join(md_dir, unquote(ref))))
+            if not new_path:
+                return match.group(0)
+            stats['links'] += 1
+            return match.group(1) + os.path.relpath(new_path, md_dir).replace(os.sep, '/') + match.group(3)
+
+        new_content = IMAGE_LINK_PATTERN.sub(rewrite_link, content)
+        if new_content != content:
+            stats['markdown'] += 1
+            if not dry_run:
+                tmp_path = md_path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(new_content)
+                os.replace(tmp_path, md_path)
+    return stats
+
+
+def migrate_layout(target_layout, markdown_dir, pdf_dir, images_dir, dry_run=False):
+    """
+    把已有归档迁移到指定布局，并改写Markdown中的图片链接
+
+    图片按文件名重新定位，所以中断后重新运行即可继续。
+
+    Args:
+        target_layout: 目标布局（flat 或 sharded）
+        markdown_dir: Markdown目录
+        pdf_dir: PDF目录
+        images_dir: 图片目录
+        dry_run: 只统计，不移动文件
+
+    Returns:
+        dict: 迁移统计
+    """
+    stats = {'images': 0, 'markdown': 0, 'pdf': 0, 'links': 0, 'unmatched_pdf': 0}
+
+    # 1. 图片：文件名 -> 新位置
+    image_index = {}
+    for path in list(iter_files(images_dir, IMAGE_EXTENSIONS)):
+        name = os.path.basename(path)
+        target = os.path.join(images_dir, image_relpath(name, target_layout))
+        if os.path.normpath(path) != os.path.normpath(target):
+            _move(path, target, dry_run)
+            stats['images'] += 1
+        image_index[name] = target
+
+    # 2. Markdown：移动到新目录并改写图片链接
+    shard_by_id = {}
+    shard_by_title = {}
+    for md_path in list(iter_files(markdown_dir, ('.md',))):
+        with open(md_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        info = _parse_markdown_content(md_path, content)
+        account = info['account'] or info['author']
+        new_dir = markdown_dir_for(account, info['publish_time'], target_layout, markdown_dir)
+        new_path = os.path.join(new_dir, os.path.basename(md_path))
+
+        def rewrite_link(match):
+            ref = match.group(2)
+            if ref.startswith(('http://', 'https://', 'data:', '//')):
+                return match.group(0)
+            image_path = image_index.get(os.path.basename(unquote(ref)))
+            if not image_path:
+                return match.group(0)
+            new_ref = os.path.relpath(image_path, new_dir).replace(os.sep, '/')
+            if new_ref != ref:
+                stats['links'] += 1
+            return match.group(1) + new_ref + match.group(3)
+
+        new_content = IMAGE_LINK_PATTERN.sub(rewrite_link, content)
+        moved = os.path.normpath(new_path) != os.path.normpath(md_path)
+        if moved or new_content != content:
+            stats['markdown'] += 1
+            if not dry_run:
+                os.makedirs(new_dir, exist_ok=True)
+                tmp_path = new_path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(new_content)
+                os.replace(tmp_path, new_path)
+                if moved:
+                    os.remove(md_path)
+
+        shard = (account, info['publish_time'])
+        article_id = get_article_id(info['url']) if info['url'] else None
+        if article_id:
+            shard_by_id[article_id] = shard
+        if info['title']:
+            shard_by_title[sanitize_filename(info['title'])] = shard
+
+    # 3. PDF：按文章ID（或标题）找到对应Markdown的分片
+    for pdf_path in list(iter_files(pdf_dir, ('.pdf',))):
+        stem = os.path.splitext(os.path.basename(pdf_path))[0]
+        shard = shard_by_id.get(read_article_id(pdf_path)) or shard_by_title.get(stem)
+        if not shard:
+            stats['unmatched_pdf'] += 1
+            continue
+        target = os.path.join(pdf_dir_for(shard[0], shard[1], target_layout, pdf_dir),
+                              os.path.basename(pdf_path))
+        if os.path.normpath(target) != os.path.normpath(pdf_path):
+            _move(pdf_path, target, dry_run)
+            stats['pdf'] += 1
+
+    if not dry_run:
+        for root in (markdown_dir, pdf_dir, images_dir):
+            if os.path.isdir(root):
+                _remove_empty_dirs(root)
+
+    return stats
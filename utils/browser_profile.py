@@ -0,0 +1,158 @@
+"""
+浏览器配置档模块
+按配置档持久化Playwright的 storage_state（Cookie和本地存储），新建浏览器上下文时复用，
+避免每篇文章都像第一次访问；可选地把Cookie同步给 requests 会话
+"""
+import os
+import json
+import tempfile
+import threading
+from settings import PROFILE_DIR, BROWSER_PROFILE
+
+
+_save_lock = threading.Lock()
+
+
+def storage_state_path(profile=BROWSER_PROFILE, profile_dir=PROFILE_DIR):
+    """
+    获取配置档的 storage_state 文件路径
+
+    Args:
+        profile: 配置档名称
+        profile_dir: 配置档目录
+
+    Returns:
+        str: 文件路径
+    """
+    return os.path.join(profile_dir, f"{profile}.json")
+
+
+def context_options(base_options, profile=BROWSER_PROFILE, profile_dir=PROFILE_DIR):
+    """
+    生成新建浏览器上下文的参数，已有保存的状态时一并载入
+
+    Args:
+        base_options: 基础参数（如 CONTEXT_OPTIONS）
+        profile: 配置档名称，为None时不使用配置档
+        profile_dir: 配置档目录
+
+    Returns:
+        dict: browser.new_context 的参数
+    """
+    options = dict(base_options)
+    if profile:
+        path = storage_state_path(profile, profile_dir)
+        if os.path.exists(path):
+            options['storage_state'] = path
+    return options
+
+
+def _replace_state(tmp_path, path):
+    """把临时文件替换为配置档文件（多个线程或进程同时保存时，后写入的生效）"""
+    with _save_lock:
+        os.replace(tmp_path, path)
+
+
+def _tmp_path(path):
+    """
+    为一次保存创建独立的临时文件
+
+    同一个事件循环中的多个标签页可能同时保存，临时文件名不能只按进程和线程区分。
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+    os.close(fd)
+    return tmp_path
+
+
+def _discard(tmp_path):
+    """保存失败时删除临时文件"""
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+
+
+def save_storage_state(context, profile=BROWSER_PROFILE, profile_dir=PROFILE_DIR):
+    """
+    保存浏览器上下文的状态（同步上下文）
+
+    Args:
+        context: Playwright同步浏览器上下文
+        profile: 配置档名称，为None时不保存
+        profile_dir: 配置档目录
+    """
+    if not profile:
+        return
+    os.makedirs(profile_dir, exist_ok=True)
+    path = storage_state_path(profile, profile_dir)
+    tmp_path = _tmp_path(path)
+    try:
+        context.storage_state(path=tmp_path)
+    except Exception:
+        _discard(tmp_path)
+        raise
+    _replace_state(tmp_path, path)
+
+
+async def save_storage_state_async(context, profile=BROWSER_PROFILE, profile_dir=PROFILE_DIR):
+    """保存浏览器上下文的状态（异步上下文，见 save_storage_state）"""
+    if not profile:
+        return
+    os.makedirs(profile_dir, exist_ok=True)
+    path = storage_state_path(profile, profile_dir)
+    tmp_path = _tmp_path(path)
+    try:
+        await context.storage_state(path=tmp_path)
+    except Exception:
+        _discard(tmp_path)
+        raise
+    _replace_state(tmp_path, path)
+
+
+class SessionCookieSync:
+    """把配置档中保存的浏览器Cookie同步到 requests 会话（配置档更新后自动重新载入）"""
+
+    def __init__(self, session, profile=BROWSER_PROFILE, profile_dir=PROFILE_DIR):
+        """
+        初始化同步器
+
+        Args:
+            session: requests.Session
+            profile: 配置档名称
+            profile_dir: 配置档目录
+        """
+        self.session = session
+        self.path = storage_state_path(profile, profile_dir)
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        配置档文件有变化时重新载入Cookie
+
+        Returns:
+            int: 本次载入的Cookie数（没有变化时为0）
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return 0
+        with self._lock:
+            if mtime == self._mtime:
+                return 0
+            self._mtime = mtime
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    cookies = json.load(f).get('cookies', [])
+            except (OSError, ValueError):
+                return 0
+            for cookie in cookies:
+                expires = cookie.get('expires')
+                self.session.cookies.set(
+                    cookie['name'], cookie['value'],
+                    domain=cookie.get('domain', ''),
+                    path=cookie.get('path', '/'),
+                    secure=cookie.get('secure', False),
+                    expires=int(expires) if expires and expires > 0 else None,
+                )
+            return len(cookies)
@@ -0,0 +1,62 @@
+"""
+下载字节预算模块
+统计图片下载的字节数；单篇文章的预算挂在整批任务的预算之下，任意一级用完后不再下载新的图片，
+避免个别异常文章占用整批任务的带宽。
+"""
+import threading
+
+
+class ByteBudget:
+    """下载字节预算（线程安全）"""
+
+    def __init__(self, limit=0, name='', parent=None):
+        """
+        初始化预算
+
+        Args:
+            limit: 字节数上限，0表示不限制（仍然统计）
+            name: 预算名称（用于提示信息）
+            parent: 上一级预算（如整批任务的预算），消耗时一并计入
+        """
+        self.limit = limit
+        self.name = name
+        self.parent = parent
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def consume(self, size):
+        """
+        记录已下载的字节数
+
+        Args:
+            size: 字节数
+
+        Returns:
+            bool: 本级和上级预算都未用完时返回True
+        """
+        with self._lock:
+            self.used += size
+        if self.parent is not None:
+            self.parent.consume(size)
+        return not self.exhausted()
+
+    def exhausted(self):
+        """本级或上级预算是否已用完"""
+        if self.limit and self.used >= self.limit:
+            return True
+        return self.parent is not None and self.parent.exhausted()
+
+    def exhausted_name(self):
+        """已用完的预算名称，都未用完时返回None"""
+        if self.limit and self.used >= self.limit:
+            return self.name
+        return self.parent.exhausted_name() if self.parent is not None else None
+
+
+def format_bytes(size):
+    """把字节数格式化为 KB/MB/GB"""
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.2f} GB"
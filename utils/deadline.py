@@ -0,0 +1,138 @@
+"""
+单篇文章时间预算模块
+每篇文章开始处理时创建一个截止时间，获取文章、下载图片、渲染PDF的各个阶段都按剩余时间
+缩短自己的超时和等待；时间用完时抛出 DeadlineExceeded，工作线程不会被一篇文章长时间占用。
+"""
+import time
+import asyncio
+from settings import ARTICLE_DEADLINE
+
+
+# 剩余时间少于该值时视为已用完：超时为0时 requests 会报错，Playwright 则视为不限制
+MIN_TIMEOUT = 0.05
+
+
+class DeadlineExceeded(TimeoutError):
+    """单篇文章的时间预算已用完"""
+
+
+class Deadline:
+    """
+    单篇文章的截止时间
+
+    使用墙上时间记录截止时刻，可以传给渲染子进程。
+    """
+
+    def __init__(self, seconds=ARTICLE_DEADLINE):
+        """
+        初始化截止时间
+
+        Args:
+            seconds: 时间预算（秒），为0或None时不限制
+        """
+        self.seconds = seconds
+        self.expires_at = time.time() + seconds if seconds else None
+
+    def remaining(self):
+        """
+        剩余时间
+
+        Returns:
+            float: 秒数，不限制时为 float('inf')
+        """
+        if self.expires_at is None:
+            return float('inf')
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self):
+        """时间预算是否已用完（剩余时间不足 MIN_TIMEOUT 也视为用完）"""
+        return self.remaining() < MIN_TIMEOUT
+
+    def exceeded(self, stage=''):
+        """
+        构造时间预算用完的异常
+
+        Args:
+            stage: 当前阶段（写入错误信息）
+
+        Returns:
+            DeadlineExceeded: 异常对象
+        """
+        where = f"（{stage}）" if stage else ''
+        return DeadlineExceeded(f"超过单篇文章的时间预算 {self.seconds} 秒{where}，处理超时")
+
+    def check(self, stage=''):
+        """
+        时间预算用完时抛出异常
+
+        Args:
+            stage: 当前阶段（写入错误信息）
+
+        Raises:
+            DeadlineExceeded: 时间预算已用完
+        """
+        if self.expired():
+            raise self.exceeded(stage)
+
+    def timeout(self, cap, stage=''):
+        """
+        某个操作可用的超时时间：不超过 cap，也不超过剩余时间
+
+        只读取一次剩余时间，返回值不会小于 MIN_TIMEOUT（剩余时间不足时抛出异常）。
+
+        Args:
+            cap: 该操作原本的超时时间（秒）
+            stage: 当前阶段（时间用完时写入错误信息）
+
+        Returns:
+            float: 超时时间（秒）
+
+        Raises:
+            DeadlineExceeded: 时间预算已用完
+        """
+        remaining = self.remaining()
+        if remaining < MIN_TIMEOUT:
+            raise self.exceeded(stage)
+        return min(cap, remaining)
+
+    def timeout_ms(self, cap_ms, stage=''):
+        """同 timeout，单位为毫秒（Playwright的超时参数）"""
+        return self.timeout(cap_ms / 1000, stage) * 1000
+
+    def sleep(self, seconds):
+        """
+        等待，但不超过剩余时间
+
+        Raises:
+            DeadlineExceeded: 时间预算已用完
+        """
+        time.sleep(self.timeout(seconds))
+
+    async def wait_async(self, awaitable, cap, stage=''):
+        """
+        等待异步操作完成，不超过 cap 和剩余时间（用于 page.pdf、page.evaluate 等没有超时参数的操作）
+
+        Args:
+            awaitable: 协程
+            cap: 该操作的超时时间（秒）
+            stage: 当前阶段（超时时写入错误信息）
+
+        Returns:
+            协程的返回值
+
+        Raises:
+            DeadlineExceeded: 时间预算已用完
+            TimeoutError: 操作超过 cap 仍未完成
+        """
+        try:
+            timeout = self.timeout(cap, stage)
+        except DeadlineExceeded:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            if self.expired():
+                raise self.exceeded(stage) from None
+            raise TimeoutError(f"{stage}超过 {cap} 秒仍未完成") from None
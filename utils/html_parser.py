@@ -6,39 +6,66 @@ import re
 from datetime import datetime
 from bs4 import BeautifulSoup
 import requests
-from config import USER_AGENT, REQUEST_TIMEOUT, MAX_RETRIES, RETRY_DELAY
+from settings import (
+    USER_AGENT, REQUEST_TIMEOUT, MAX_RETRIES, RETRY_DELAY, SHARE_COOKIES_WITH_REQUESTS, EXTRACT_MEDIA
+)
+from utils.browser_profile import SessionCookieSync
+from utils.quarantine import VerificationRequired, is_verification_page
+from utils.deadline import Deadline
+from utils.http_pool import mount_shared_pool
 import time
 
 
 class WeChatArticleParser:
     """微信公众号文章解析器"""
     
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, extract_media=EXTRACT_MEDIA):
+        """
+        初始化解析器
+        
+        Args:
+            extract_media: 是否把正文中嵌入的视频、音频保留为链接（见 utils.media_downloader）
+        """
+        self.extract_media = extract_media
+        self.session = mount_shared_pool(requests.Session())
         self.session.headers.update({
             'User-Agent': USER_AGENT
         })
+        # 使用浏览器配置档中保存的Cookie
+        self.cookie_sync = SessionCookieSync(self.session) if SHARE_COOKIES_WITH_REQUESTS else None
     
-    def fetch_article(self, url):
+    def fetch_article(self, url, deadline=None):
         """
         获取文章HTML内容
         
         Args:
             url: 文章URL
+            deadline: 单篇文章的截止时间（utils.deadline.Deadline），为None时不限制
             
         Returns:
             str: HTML内容
+            
+        Raises:
+            VerificationRequired: 返回的是验证页面（不重试，交给调度器稍后处理）
+            DeadlineExceeded: 时间预算已用完
         """
+        deadline = deadline or Deadline(None)
+        if self.cookie_sync:
+            self.cookie_sync.refresh()
         for attempt in range(MAX_RETRIES):
+            timeout = deadline.timeout(REQUEST_TIMEOUT, '获取文章')
             try:
-                response = self.session.get(url, timeout=REQUEST_TIMEOUT)
+                response = self.session.get(url, timeout=timeout)
                 response.raise_for_status()
                 # 强制使用UTF-8编码（微信文章都是UTF-8）
                 response.encoding = 'utf-8'
+                if is_verification_page(response.text) and 'js_content' not in response.text:
+                    raise VerificationRequired(f"检测到验证页面: {url}")
                 return response.text
             except requests.RequestException as e:
+                deadline.check('获取文章')
                 if attempt < MAX_RETRIES - 1:
-                    time.sleep(RETRY_DELAY)
+                    deadline.sleep(RETRY_DELAY)
                     continue
                 raise Exception(f"获取文章失败: {str(e)}")
     
@@ -61,6 +88,9 @@ class WeChatArticleParser:
         # 提取作者
         author = self._extract_author(soup)
         
+        # 提取公众号名称
+        account = self._extract_account(soup, html_content)
+        
         # 提取发布时间
         publish_time = self._extract_publish_time(soup)
         
@@ -70,6 +100,7 @@ class WeChatArticleParser:
         return {
             'title': title,
             'author': author,
+            'account': account,
             'publish_time': publish_time,
             'content_html': content_html,
             'url': url
@@ -119,6 +150,21 @@ class WeChatArticleParser:
         
         return "未知作者"
     
+    def _extract_account(self, soup, html_content):
+        """提取公众号名称"""
+        element = soup.select_one('#js_name') or soup.select_one('.profile_nickname')
+        if element:
+            account = element.get_text().strip()
+            if account:
+                return account
+        
+        # 页面脚本中的 var nickname = htmlDecode("xxx") 或 var nickname = "xxx"
+        match = re.search(r'var\s+nickname\s*=\s*(?:htmlDecode\()?["\']([^"\']+)["\']', html_content)
+        if match:
+            return match.group(1).strip()
+        
+        return None
+    
     def _extract_publish_time(self, soup):
         """提取发布时间"""
         time_selectors = [
@@ -174,6 +220,11 @@ class WeChatArticleParser:
             # 清理不需要的标签和属性
             content_soup = BeautifulSoup(content_html, 'lxml')
             
+            # 嵌入的音视频在清理iframe之前替换为链接
+            if self.extract_media:
+                from utils.media_downloader import mark_media
+                mark_media(content_soup)
+            
             # 移除script和style标签
             for tag in content_soup(['script', 'style', 'iframe']):
                 tag.decompose()
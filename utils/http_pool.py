@@ -0,0 +1,279 @@
+"""
+共享HTTP连接池模块
+获取文章、下载图片和音视频的 requests 会话挂载同一个传输适配器，按主机保持长连接
+（每个主机的连接数可配置，空闲连接开启TCP keepalive），并发下载时不再因为默认的10个连接
+不够用而反复丢弃和新建连接。
+开启 HTTP2 且安装了 httpx 时改用 httpx 的HTTP/2客户端，同一主机的并发请求在一个连接上多路复用。
+各会话仍保留自己的请求头和Cookie，只共享连接。
+"""
+import socket
+import threading
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3 import PoolManager
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from settings import HTTP_POOL_HOSTS, HTTP_POOL_SIZE, HTTP_POOL_HOST_SIZES, HTTP2
+
+
+# HTTP/2不允许发送的逐跳请求头
+HOP_BY_HOP_HEADERS = ('connection', 'keep-alive', 'proxy-connection', 'transfer-encoding', 'upgrade')
+
+
+class PoolStats:
+    """连接复用统计（线程安全）"""
+
+    def __init__(self):
+        self.requests = 0  # 发出的请求数
+        self.connections = 0  # 新建的连接数
+        self._lock = threading.Lock()
+
+    def request(self):
+        with self._lock:
+            self.requests += 1
+
+    def connected(self):
+        with self._lock:
+            self.connections += 1
+
+    def snapshot(self):
+        """
+        当前的统计
+
+        Returns:
+            dict: requests、connections、reused（复用已有连接的请求数）、reuse_rate（0-1，没有请求时为None）
+        """
+        with self._lock:
+            requests_count, connections = self.requests, self.connections
+        reused = max(0, requests_count - connections)
+        return {
+            'requests': requests_count,
+            'connections': connections,
+            'reused': reused,
+            'reuse_rate': reused / requests_count if requests_count else None,
+        }
+
+
+# 进程内所有共享会话的统计
+POOL_STATS = PoolStats()
+
+
+class _CountingHTTPConnection(HTTPConnection):
+    def connect(self):
+        POOL_STATS.connected()
+        super().connect()
+
+
+class _CountingHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        POOL_STATS.connected()
+        super().connect()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+
+class _HostPoolManager(PoolManager):
+    """按主机设置连接数的 PoolManager"""
+
+    def __init__(self, host_sizes=None, **kwargs):
+        super().__init__(**kwargs)
+        self.host_sizes = host_sizes or {}
+        self.pool_classes_by_scheme = {'http': _CountingHTTPConnectionPool, 'https': _CountingHTTPSConnectionPool}
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        request_context = dict(request_context if request_context is not None else self.connection_pool_kw)
+        if host in self.host_sizes:
+            request_context['maxsize'] = self.host_sizes[host]
+        return super()._new_pool(scheme, host, port, request_context)
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTP/1.1连接池适配器：按主机设置连接数，统计连接复用"""
+
+    def __init__(self, pool_hosts=HTTP_POOL_HOSTS, pool_size=HTTP_POOL_SIZE, host_sizes=HTTP_POOL_HOST_SIZES):
+        """
+        初始化适配器
+
+        Args:
+            pool_hosts: 保留连接池的主机数
+            pool_size: 每个主机保留的空闲连接数
+            host_sizes: 主机名 -> 该主机的连接数
+        """
+        self.host_sizes = dict(host_sizes or {})
+        super().__init__(pool_connections=pool_hosts, pool_maxsize=pool_size)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        # 空闲的长连接开启TCP keepalive，避免被中间设备静默断开
+        socket_options = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        self.poolmanager = _HostPoolManager(
+            host_sizes=self.host_sizes, num_pools=connections, maxsize=maxsize, block=block,
+            socket_options=socket_options, **pool_kwargs
+        )
+
+    def send(self, request, *args, **kwargs):
+        POOL_STATS.request()
+        return super().send(request, *args, **kwargs)
+
+
+def load_httpx():
+    """
+    导入 httpx（HTTP/2需要 h2）
+
+    Returns:
+        httpx 模块
+    """
+    try:
+        import httpx
+        import h2  # noqa: F401
+    except ImportError:
+        raise ImportError('未安装 httpx，请先运行: pip install "httpx[http2]"') from None
+    return httpx
+
+
+class _HttpxStream:
+    """把 httpx 的流式响应包装为 requests 使用的 raw 对象"""
+
+    def __init__(self, response, httpx):
+        self._response = response
+        self._httpx = httpx
+
+    def stream(self, chunk_size, decode_content=True):
+        try:
+            yield from self._response.iter_bytes(chunk_size)
+        except self._httpx.TimeoutException as e:
+            raise requests.exceptions.ConnectionError(e) from None
+        except self._httpx.TransportError as e:
+            raise requests.exceptions.ChunkedEncodingError(e) from None
+
+    def read(self, amt=None):
+        return self._response.read()
+
+    def close(self):
+        self._response.close()
+
+
+class Http2Adapter(BaseAdapter):
+    """
+    基于 httpx 的HTTP/2适配器
+
+    返回普通的 requests.Response，调用方不需要改动；重定向和Cookie仍由 requests 会话处理
+    （响应中的Set-Cookie不会写回会话，本项目只使用从浏览器配置档同步的Cookie）。
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE):
+        """
+        初始化适配器
+
+        Args:
+            pool_size: 保留的空闲连接总数（HTTP/2下同一主机的请求共用一个连接）
+        """
+        super().__init__()
+        self.httpx = load_httpx()
+        limits = self.httpx.Limits(max_connections=None, max_keepalive_connections=pool_size)
+        self.client = self.httpx.Client(http2=True, limits=limits, follow_redirects=False)
+
+    @staticmethod
+    def _trace(event, info):
+        if event == 'connection.connect_tcp.complete':
+            POOL_STATS.connected()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        POOL_STATS.request()
+        if isinstance(timeout, tuple):
+            connect_timeout, read_timeout = timeout
+        else:
+            connect_timeout = read_timeout = timeout
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS]
+        httpx_request = self.client.build_request(
+            request.method, request.url, headers=headers, content=request.body,
+            timeout=self.httpx.Timeout(read_timeout, connect=connect_timeout),
+            extensions={'trace': self._trace}
+        )
+        try:
+            httpx_response = self.client.send(httpx_request, stream=True)
+        except self.httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(e, request=request) from None
+        except self.httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(e, request=request) from None
+
+        response = requests.Response()
+        response.status_code = httpx_response.status_code
+        response.reason = httpx_response.reason_phrase
+        response.headers = CaseInsensitiveDict(httpx_response.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = _HttpxStream(httpx_response, self.httpx)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        self.client.close()
+
+
+_shared_adapter = None
+_shared_lock = threading.Lock()
+
+
+def shared_adapter():
+    """
+    进程内共享的传输适配器（首次使用时创建）
+
+    Returns:
+        BaseAdapter: 开启HTTP2且安装了httpx时为 Http2Adapter，否则为 PooledAdapter
+    """
+    global _shared_adapter
+    if _shared_adapter is None:
+        with _shared_lock:
+            if _shared_adapter is None:
+                adapter = None
+                if HTTP2:
+                    try:
+                        adapter = Http2Adapter()
+                    except ImportError as e:
+                        print(f"警告: {e}，使用HTTP/1.1")
+                _shared_adapter = adapter or PooledAdapter()
+    return _shared_adapter
+
+
+def mount_shared_pool(session):
+    """
+    让会话使用共享的连接池
+
+    Args:
+        session: requests.Session
+
+    Returns:
+        requests.Session: 传入的会话
+    """
+    adapter = shared_adapter()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def format_pool_stats(stats=None):
+    """
+    格式化连接复用统计
+
+    Args:
+        stats: POOL_STATS.snapshot() 的结果，为None时取当前统计
+
+    Returns:
+        str: 如 "92.5%（请求 200 次，新建连接 15 个）"，没有请求时返回None
+    """
+    stats = stats or POOL_STATS.snapshot()
+    if not stats['requests']:
+        return None
+    return f"{stats['reuse_rate']:.1%}（请求 {stats['requests']} 次，新建连接 {stats['connections']} 个）"
@@ -0,0 +1,175 @@
+"""
+图片缓存索引模块
+以规范化后的图片URL为键，记录已下载图片的本地路径、大小和缓存校验头（ETag、Last-Modified）。
+下载前先查索引，重新处理文章或其他文章引用同一张图片时直接复用本地文件，不再发出请求。
+索引为JSON Lines追加日志，启动时回放。
+"""
+import os
+import json
+import threading
+from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from settings import IMAGES_DIR, IMAGE_CACHE_FILE
+from utils.layout import image_relpath
+
+
+# 不影响图片内容的查询参数（懒加载、来源统计等）
+IGNORED_IMAGE_PARAMS = ('wxfrom', 'wx_lazy', 'wx_co', 'from', 'tp')
+
+
+def normalize_image_url(url):
+    """
+    规范化图片URL：统一为https、域名小写、去掉片段和不影响内容的参数、参数排序
+
+    Args:
+        url: 图片URL
+
+    Returns:
+        str: 规范化后的URL
+    """
+    if url.startswith('//'):
+        url = 'https:' + url
+    parts = urlsplit(url)
+    scheme = 'https' if parts.scheme in ('http', 'https') else parts.scheme
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k not in IGNORED_IMAGE_PARAMS)
+    return urlunsplit((scheme, parts.netloc.lower(), parts.path, urlencode(query), ''))
+
+
+class ImageCache:
+    """已下载图片的持久化索引"""
+
+    def __init__(self, index_path=IMAGE_CACHE_FILE, images_dir=IMAGES_DIR):
+        """
+        初始化图片缓存
+
+        Args:
+            index_path: 索引文件路径
+            images_dir: 图片目录（索引中的路径相对于该目录）
+        """
+        self.index_path = index_path
+        self.images_dir = images_dir
+        self.entries = {}  # 规范化URL -> 记录
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+        index_dir = os.path.dirname(index_path)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """回放索引文件，同一URL以最后一条记录为准"""
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 中断时可能留下写了一半的最后一行
+                    continue
+                if entry.get('url'):
+                    self.entries[entry['url']] = entry
+
+    def locate(self, entry):
+        """
+        找到记录对应的本地文件（迁移过布局的图片按当前布局重新定位）
+
+        Returns:
+            str: 图片相对于图片目录的路径，文件不存在时返回None
+        """
+        relpath = entry['path']
+        for candidate in (relpath, image_relpath(os.path.basename(relpath))):
+            if os.path.isfile(os.path.join(self.images_dir, candidate)):
+                return candidate
+        return None
+
+    def _local_path(self, entry):
+        """
+        找到记录对应的本地文件
+
+        Returns:
+            str: 图片相对于图片目录的路径，文件不存在或大小不符时返回None
+        """
+        relpath = self.locate(entry)
+        if relpath is None or os.path.getsize(os.path.join(self.images_dir, relpath)) != entry.get('size'):
+            return None
+        return relpath
+
+    def lookup(self, url):
+        """
+        查询图片是否已下载
+
+        Args:
+            url: 图片URL
+
+        Returns:
+            str: 图片相对于图片目录的路径（使用 / 分隔），未缓存或本地文件已失效时返回None
+        """
+        key = normalize_image_url(url)
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        relpath = self._local_path(entry)
+        if relpath is None:
+            with self._lock:
+                self.entries.pop(key, None)
+            return None
+        with self._lock:
+            self.hits += 1
+        return relpath.replace(os.sep, '/')
+
+    def add(self, url, relpath, headers=None):
+        """
+        记录一张已下载的图片
+
+        Args:
+            url: 图片URL
+            relpath: 图片相对于图片目录的路径
+            headers: 下载时的响应头（记录 ETag、Last-Modified、Content-Type），可为None
+        """
+        headers = headers or {}
+        entry = {
+            'url': normalize_image_url(url),
+            'source': url,
+            'path': relpath,
+            'size': os.path.getsize(os.path.join(self.images_dir, relpath)),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'content_type': headers.get('Content-Type'),
+            'ts': datetime.now().isoformat(timespec='seconds'),
+        }
+        entry = {k: v for k, v in entry.items() if v is not None}
+        with self._lock:
+            self.entries[entry['url']] = entry
+            if self._file is None:
+                self._file = open(self.index_path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._file.flush()
+
+    def refresh(self, relpath, new_relpath=None):
+        """
+        图片文件被替换或改名后（如链接到近似重复的图片、GIF转为WebP）重新记录引用该文件的条目
+
+        Args:
+            relpath: 图片相对于图片目录的路径
+            new_relpath: 改名后的路径，为None时只更新大小
+        """
+        with self._lock:
+            matches = [(entry.get('source', url), entry) for url, entry in self.entries.items()
+                       if entry['path'] == relpath]
+        for url, entry in matches:
+            self.add(url, new_relpath or relpath, {
+                'ETag': entry.get('etag'), 'Last-Modified': entry.get('last_modified'),
+                'Content-Type': entry.get('content_type'),
+            })
+
+    def close(self):
+        """关闭索引文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
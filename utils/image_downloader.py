@@ -6,25 +6,93 @@ import os
 import re
 import time
 import requests
-from urllib.parse import urlparse
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import urlparse, urlsplit, urlunsplit, parse_qsl, urlencode
 from bs4 import BeautifulSoup
-from config import (
+from settings import (
     IMAGES_DIR, USER_AGENT, 
-    IMAGE_TIMEOUT, IMAGE_MAX_SIZE, INVALID_CHARS
+    IMAGE_TIMEOUT, IMAGE_MAX_SIZE, INVALID_CHARS,
+    SHARE_COOKIES_WITH_REQUESTS, IMAGE_CACHE, IMAGE_CACHE_FILE, IMAGE_QUALITY,
+    IMAGE_HASH, IMAGE_HASH_FILE, IMAGE_DEDUP
 )
+from utils.layout import image_relpath
+from utils.browser_profile import SessionCookieSync
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.http_pool import mount_shared_pool
+from utils.image_cache import ImageCache
+from utils.image_hash import ImageHashIndex
+from utils.byte_budget import format_bytes
+from utils.image_optimizer import ImageOptimizer
+from utils.image_integrity import SNIFF_BYTES, sniff_image_format, sniff_file_format, check_image
+
+
+# 微信图片CDN，链接形如 https://mmbiz.qpic.cn/mmbiz_jpg/<ID>/640?wx_fmt=jpeg
+MMBIZ_HOSTS = ('mmbiz.qpic.cn', 'mmbiz.qlogo.cn')
+QUALITY_ORIGINAL = 'original'
+QUALITY_WEBP = 'webp'
+IMAGE_QUALITIES = (QUALITY_ORIGINAL, '1080', '640', QUALITY_WEBP)
+# 微信图片链接的 wx_fmt 参数 -> 扩展名
+WX_FMT_EXTENSIONS = {'jpeg': '.jpg', 'jpg': '.jpg', 'png': '.png', 'gif': '.gif', 'webp': '.webp', 'bmp': '.bmp'}
+
+
+def image_variant_url(url, quality=IMAGE_QUALITY):
+    """
+    把微信图片CDN的链接改写为指定质量的版本
+
+    宽度档位替换路径最后的尺寸段（/0 表示原图，/640 表示宽度640），webp 档位添加 tp=webp 参数。
+
+    Args:
+        url: 图片URL
+        quality: 图片质量（见 IMAGE_QUALITIES）
+
+    Returns:
+        str: 改写后的URL，不需要或无法改写时返回原URL
+    """
+    if quality == QUALITY_ORIGINAL:
+        return url
+    parts = urlsplit(url)
+    if parts.hostname not in MMBIZ_HOSTS:
+        return url
+    if quality == QUALITY_WEBP:
+        query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != 'tp']
+        query.append(('tp', 'webp'))
+        return urlunsplit(parts._replace(query=urlencode(query)))
+    segments = parts.path.rstrip('/').split('/')
+    if not segments[-1].isdigit():
+        return url
+    segments[-1] = quality
+    return urlunsplit(parts._replace(path='/'.join(segments)))
 
 
 class ImageDownloader:
     """图片下载器"""
     
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, quality=IMAGE_QUALITY):
+        """
+        初始化图片下载器
+        
+        Args:
+            quality: 图片质量（original、1080、640、webp，见 image_variant_url）
+        """
+        self.quality = quality
+        # 与文章解析器共用连接池
+        self.session = mount_shared_pool(requests.Session())
         self.session.headers.update({
             'User-Agent': USER_AGENT
         })
+        # 使用浏览器配置档中保存的Cookie
+        self.cookie_sync = SessionCookieSync(self.session) if SHARE_COOKIES_WITH_REQUESTS else None
         
         # 确保图片目录存在
         os.makedirs(IMAGES_DIR, exist_ok=True)
+        # 已下载图片的持久化索引
+        self.cache = ImageCache(IMAGE_CACHE_FILE, IMAGES_DIR) if IMAGE_CACHE else None
+        # 感知哈希索引，dedup为True时近似重复的图片改用已有的文件
+        self.hashes = ImageHashIndex(IMAGE_HASH_FILE, IMAGES_DIR) if IMAGE_HASH else None
+        self.dedup = IMAGE_DEDUP
+        # 下载后的格式转换和缩小（未配置时为None）
+        optimizer = ImageOptimizer()
+        self.optimizer = optimizer if optimizer.enabled else None
     
     def sanitize_filename(self, filename):
         """
@@ -55,6 +123,7 @@ class ImageDownloader:
         """
         # 从Content-Type获取
         if content_type:
+            content_type = content_type.split(';')[0].strip().lower()
             type_map = {
                 'image/jpeg': '.jpg',
                 'image/jpg': '.jpg',
@@ -74,23 +143,40 @@ class ImageDownloader:
             if ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp']:
                 return ext
         
+        # 微信图片链接的路径没有扩展名，格式写在 wx_fmt 参数中
+        wx_fmt = dict(parse_qsl(parsed.query)).get('wx_fmt', '').lower()
+        if wx_fmt in WX_FMT_EXTENSIONS:
+            return WX_FMT_EXTENSIONS[wx_fmt]
+        
         # 默认返回.jpg
         return '.jpg'
     
-    def download_image(self, url, save_path):
+    def download_image(self, url, save_path, deadline=None, headers=None, budget=None):
         """
         下载单张图片
         
+        边下载边计数，超过 IMAGE_MAX_SIZE 或下载量预算用完时立即断开连接并删除已写入的部分；
+        开头的字节不是图片、或下载结束后文件不完整（长度与Content-Length不符、缺少结束标记）时也视为失败。
+        
         Args:
             url: 图片URL
             save_path: 保存路径
+            deadline: 单篇文章的截止时间，为None时不限制
+            headers: 可选字典，下载成功时写入响应头（供图片缓存记录校验信息）
+            budget: 下载量预算（ByteBudget），为None时不限制
             
         Returns:
             bool: 是否成功
+            
+        Raises:
+            DeadlineExceeded: 时间预算已用完（已删除下载了一半的文件）
         """
+        deadline = deadline or Deadline(None)
         try:
-            response = self.session.get(url, timeout=IMAGE_TIMEOUT, stream=True)
+            response = self.session.get(url, timeout=deadline.timeout(IMAGE_TIMEOUT, '下载图片'), stream=True)
             response.raise_for_status()
+            if headers is not None:
+                headers.update(response.headers)
             
             # 检查文件大小
             content_length = response.headers.get('Content-Length')
@@ -98,24 +184,84 @@ class ImageDownloader:
                 print(f"警告: 图片过大，跳过 {url}")
                 return False
             
-            # 下载图片
+            # 下载图片（没有Content-Length时也不会把过大的图片完整下载下来）
+            size = 0
+            head = b''
+            aborted = None
             with open(save_path, 'wb') as f:
                 for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+                    deadline.check('下载图片')
+                    if not chunk:
+                        continue
+                    if budget is not None:
+                        if budget.exhausted():
+                            aborted = f"{budget.exhausted_name()}的图片下载量预算已用完"
+                            break
+                        budget.consume(len(chunk))
+                    size += len(chunk)
+                    if size > IMAGE_MAX_SIZE:
+                        aborted = "图片过大"
+                        break
+                    f.write(chunk)
+                    # 收到文件头后立即识别格式，服务器返回的错误页面不再完整下载
+                    if len(head) < SNIFF_BYTES:
+                        head += chunk[:SNIFF_BYTES - len(head)]
+                        if len(head) >= SNIFF_BYTES and sniff_image_format(head) is None:
+                            aborted = "返回的内容不是图片"
+                            break
             
-            # 验证文件大小
-            if os.path.getsize(save_path) > IMAGE_MAX_SIZE:
+            if not aborted:
+                if content_length and 'Content-Encoding' not in response.headers and size != int(content_length):
+                    aborted = f"下载不完整（{size}/{content_length} 字节）"
+                else:
+                    aborted = check_image(save_path)
+            
+            if aborted:
+                response.close()
                 os.remove(save_path)
-                print(f"警告: 下载的图片过大，已删除 {save_path}")
+                print(f"警告: {aborted}，已中止下载 {url}")
                 return False
             
             return True
+        except DeadlineExceeded:
+            if os.path.exists(save_path):
+                os.remove(save_path)
+            raise
         except Exception as e:
+            deadline.check('下载图片')
             print(f"下载图片失败 {url}: {str(e)}")
             return False
     
-    def download_images_from_html(self, html_content, article_title, article_index=0):
+    def download_preferred(self, url, save_path, deadline=None, headers=None, budget=None):
+        """
+        按配置的图片质量下载，改写后的链接失败时改用原始链接
+        
+        Args:
+            url: HTML中的图片URL
+            save_path: 保存路径
+            deadline: 单篇文章的截止时间，为None时不限制
+            headers: 可选字典，下载成功时写入响应头
+            budget: 下载量预算（ByteBudget），为None时不限制
+            
+        Returns:
+            bool: 是否成功
+        """
+        variant = image_variant_url(url, self.quality)
+        if variant != url:
+            variant_headers = CaseInsensitiveDict()
+            if self.download_image(variant, save_path, deadline, variant_headers, budget):
+                if variant_headers.get('Content-Type', 'image/').startswith('image/'):
+                    if headers is not None:
+                        headers.update(variant_headers)
+                    return True
+                os.remove(save_path)
+            if budget is not None and budget.exhausted():
+                return False
+            print(f"  {self.quality} 版本下载失败，改用原图: {url}")
+        return self.download_image(url, save_path, deadline, headers, budget)
+    
+    def download_images_from_html(self, html_content, article_title, article_index=0, failed=None, deadline=None,
+                                  budget=None):
         """
         从HTML中提取并下载所有图片
         
@@ -123,10 +269,18 @@ class ImageDownloader:
             html_content: HTML内容
             article_title: 文章标题（用于命名）
             article_index: 文章索引（用于区分多篇文章）
+            failed: 可选列表，下载失败的图片URL会追加到其中
+            deadline: 单篇文章的截止时间，为None时不限制
+            budget: 下载量预算（ByteBudget），用完后其余图片保留原URL并计入失败
             
         Returns:
             tuple: (更新后的HTML内容, 图片路径映射字典)
+            
+        Raises:
+            DeadlineExceeded: 时间预算已用完
         """
+        if self.cookie_sync:
+            self.cookie_sync.refresh()
         soup = BeautifulSoup(html_content, 'lxml')
         images = soup.find_all('img')
         
@@ -137,51 +291,232 @@ class ImageDownloader:
         
         image_map = {}  # 原始URL -> 本地路径的映射
         image_counter = 0
+        cache_hits = 0
+        over_budget = 0
+        duplicates = self.hashes.duplicates if self.hashes else 0
+        optimizing = []  # 正在后处理的图片：(Future, URL, 相对路径, 响应头)
         
-        for img in images:
-            src = img.get('src') or img.get('data-src')
-            if not src:
-                continue
-            
-            # 处理相对URL
-            original_src = src
-            if src.startswith('//'):
-                src = 'https:' + src
-            elif src.startswith('/'):
-                src = 'https://mp.weixin.qq.com' + src
-            
-            # 跳过data URI和内联图片
-            if src.startswith('data:'):
-                continue
-            
-            # 如果已经下载过，直接使用
-            if original_src in image_map:
-                local_path = image_map[original_src]
-            else:
-                # 下载图片
-                image_counter += 1
-                ext = self.get_image_extension(src)
-                filename = f"{safe_title}_{article_index:03d}_{image_counter:03d}{ext}"
-                save_path = os.path.join(IMAGES_DIR, filename)
+        try:
+            for img in images:
+                src = img.get('src') or img.get('data-src')
+                if not src:
+                    continue
+                
+                # 处理相对URL
+                original_src = src
+                src = self._absolute_url(src)
+                
+                # 跳过data URI和内联图片
+                if src.startswith('data:'):
+                    continue
                 
-                if self.download_image(src, save_path):
-                    # 使用相对路径
-                    local_path = f"images/{filename}"
-                    image_map[original_src] = local_path
-                    # 也映射处理后的URL
-                    if src != original_src:
-                        image_map[src] = local_path
+                # 如果已经下载过，直接使用
+                if original_src in image_map:
+                    local_path = image_map[original_src]
                 else:
-                    # 下载失败，保持原URL
-                    local_path = original_src
+                    image_counter += 1
+                    relpath = self.cache.lookup(src) if self.cache else None
+                    if relpath:
+                        # 之前的运行或其他文章已经下载过这张图片
+                        cache_hits += 1
+                        downloaded = True
+                    elif budget is not None and budget.exhausted():
+                        # 下载量预算已用完，不再发出请求
+                        over_budget += 1
+                        downloaded = False
+                    else:
+                        # 下载图片（同名文件可能属于缓存中的其他图片，不覆盖）
+                        ext = self.get_image_extension(src)
+                        filename = self._unused_filename(f"{safe_title}_{article_index:03d}_{image_counter:03d}", ext)
+                        relpath = image_relpath(filename)
+                        save_path = os.path.join(IMAGES_DIR, relpath)
+                        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+                        
+                        response_headers = CaseInsensitiveDict()
+                        downloaded = self.download_preferred(src, save_path, deadline, response_headers, budget)
+                        if downloaded:
+                            relpath = self._fix_extension(src, relpath, response_headers.get('Content-Type'))
+                            if self.optimizer:
+                                # 在进程池中压缩，同时继续下载下一张
+                                future = self.optimizer.submit(os.path.join(IMAGES_DIR, relpath))
+                                optimizing.append((future, src, relpath, response_headers))
+                            else:
+                                relpath = self._store(src, relpath, response_headers)
+                    
+                    if downloaded:
+                        # 使用相对路径
+                        local_path = f"images/{relpath}"
+                        image_map[original_src] = local_path
+                        # 也映射处理后的URL
+                        if src != original_src:
+                            image_map[src] = local_path
+                    else:
+                        # 下载失败，保持原URL
+                        local_path = original_src
+                        if failed is not None:
+                            failed.append(src)
+                
+                # 更新img标签的src
+                img['src'] = local_path
+                # 移除data-src属性（如果存在）
+                if 'data-src' in img.attrs:
+                    del img['data-src']
+        finally:
+            # 后面的图片超时或出错时，已下载的图片也要等后处理完成并写入缓存和哈希索引，
+            # 否则下次运行会以新文件名重新下载，留下孤立文件
+            if optimizing:
+                self._apply_optimized(soup, image_map, optimizing)
+        
+        if cache_hits:
+            print(f"  图片缓存命中 {cache_hits} 张，未重新下载")
+        if over_budget:
+            print(f"  {budget.exhausted_name()}的图片下载量预算已用完，{over_budget} 张图片保留原链接")
+        if self.hashes and self.hashes.duplicates > duplicates:
+            print(f"  {self.hashes.duplicates - duplicates} 张图片与已有图片近似重复，已改用已有图片"
+                  f"（累计节省 {format_bytes(self.hashes.reclaimed)}）")
+        return str(soup), image_map
+    
+    def prepare_deferred(self, html_content):
+        """
+        延后下载图片：把图片链接统一为远程绝对URL（src），不下载
+        
+        Args:
+            html_content: HTML内容
             
-            # 更新img标签的src
-            img['src'] = local_path
-            # 移除data-src属性（如果存在）
+        Returns:
+            tuple: (更新后的HTML内容, 去重后的图片URL列表)
+        """
+        soup = BeautifulSoup(html_content, 'lxml')
+        urls = []
+        for img in soup.find_all('img'):
+            src = img.get('src') or img.get('data-src')
+            if not src or src.startswith('data:'):
+                continue
+            src = self._absolute_url(src)
+            img['src'] = src
             if 'data-src' in img.attrs:
                 del img['data-src']
+            if src not in urls:
+                urls.append(src)
+        return str(soup), urls
+    
+    def _absolute_url(self, src):
+        """把协议相对和站内相对的图片链接补全为绝对URL"""
+        if src.startswith('//'):
+            return 'https:' + src
+        if src.startswith('/'):
+            return 'https://mp.weixin.qq.com' + src
+        return src
+    
+    def _apply_optimized(self, soup, image_map, optimizing):
+        """
+        等待后处理完成，把改了扩展名的图片更新到HTML和路径映射中
         
-        return str(soup), image_map
+        Args:
+            soup: 文章的BeautifulSoup对象
+            image_map: 图片路径映射字典
+            optimizing: 正在后处理的图片列表
+        """
+        renamed = {}  # 旧的本地路径 -> 新的本地路径
+        for future, url, relpath, headers in optimizing:
+            new_path = self.optimizer.result(future, os.path.join(IMAGES_DIR, relpath))
+            new_relpath = os.path.relpath(new_path, IMAGES_DIR).replace(os.sep, '/')
+            new_relpath = self._store(url, new_relpath, headers)
+            if new_relpath != relpath:
+                renamed[f"images/{relpath}"] = f"images/{new_relpath}"
+        
+        for key, local_path in image_map.items():
+            image_map[key] = renamed.get(local_path, local_path)
+        for img in soup.find_all('img'):
+            if img.get('src') in renamed:
+                img['src'] = renamed[img['src']]
+        print(f"  已压缩 {len(optimizing)} 张图片（累计节省 {self.optimizer.saved_bytes / 1024 / 1024:.1f} MB）")
+    
+    def redownload(self, queue):
+        """
+        重新下载队列中的图片，写回原来的路径（Markdown中的链接不需要改动）
+        
+        下载到临时文件，通过完整性检查后才替换原文件并更新缓存索引；失败的图片留在队列中。
+        
+        Args:
+            queue: RedownloadQueue
+            
+        Returns:
+            tuple: (成功数, 失败数)
+        """
+        if self.cookie_sync:
+            self.cookie_sync.refresh()
+        fixed = failed = 0
+        for entry in list(queue.entries.values()):
+            save_path = os.path.join(IMAGES_DIR, entry['path'])
+            tmp_path = save_path + '.part'
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            response_headers = CaseInsensitiveDict()
+            if self.download_image(entry['url'], tmp_path, headers=response_headers):
+                os.replace(tmp_path, save_path)
+                if self.cache:
+                    self.cache.add(entry['url'], entry['path'], response_headers)
+                queue.remove(entry['url'])
+                fixed += 1
+            else:
+                failed += 1
+            queue.save()
+        return fixed, failed
+    
+    def _store(self, url, relpath, headers):
+        """
+        记录下载完成的图片：写入感知哈希索引（开启去重时近似重复的图片改用已有文件）和缓存索引
+        
+        Returns:
+            str: 文章中应使用的图片相对路径
+        """
+        if self.hashes:
+            relpath = self.hashes.store(relpath, link=self.dedup)
+        if self.cache:
+            self.cache.add(url, relpath, headers)
+        return relpath
+    
+    def close(self):
+        """关闭后处理进程池、缓存索引和哈希索引"""
+        if self.optimizer:
+            self.optimizer.close()
+        if self.cache:
+            self.cache.close()
+        if self.hashes:
+            self.hashes.close()
+    
+    def _fix_extension(self, url, relpath, content_type):
+        """
+        按文件头（识别不出时按响应的Content-Type）修正扩展名（例如CDN返回了WebP）
+        
+        Returns:
+            str: 修正后图片相对于图片目录的路径
+        """
+        stem, ext = os.path.splitext(os.path.basename(relpath))
+        actual_ext = sniff_file_format(os.path.join(IMAGES_DIR, relpath)) or \
+            self.get_image_extension(url, content_type)
+        if actual_ext == ext:
+            return relpath
+        new_relpath = image_relpath(self._unused_filename(stem, actual_ext))
+        new_path = os.path.join(IMAGES_DIR, new_relpath)
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        os.replace(os.path.join(IMAGES_DIR, relpath), new_path)
+        return new_relpath
+    
+    def _unused_filename(self, stem, ext):
+        """
+        生成图片目录中尚未使用的文件名
+        
+        没有缓存时沿用原来的命名（同名文件会被覆盖）。
+        """
+        filename = f"{stem}{ext}"
+        if not self.cache:
+            return filename
+        suffix = 1
+        while os.path.exists(os.path.join(IMAGES_DIR, image_relpath(filename))):
+            filename = f"{stem}_{suffix}{ext}"
+            suffix += 1
+        return filename
     
     def update_html_images(self, html_content, image_map):
         """
@@ -0,0 +1,332 @@
+"""
+图片感知哈希模块
+为每张图片计算 aHash 和 dHash（各64位），记录在索引中，用于找出重新压缩过、字节不同但内容相同的图片
+（公众号反复上传的横幅、二维码、模板图）。
+近似查找使用分段索引：两个哈希的汉明距离不超过 d 时，把64位分成 d+1 段，至少有一段完全相同，
+因此只需比较至少一段相同的候选，不需要两两比较。
+索引为JSON Lines追加日志，启动时回放。
+"""
+import os
+import json
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from settings import IMAGES_DIR, IMAGE_HASH_FILE, IMAGE_HASH_DISTANCE
+from utils.layout import iter_files
+from utils.archive_index import IMAGE_EXTENSIONS
+
+
+HASH_SIZE = 8  # 哈希边长，8x8 = 64位
+HASH_BITS = HASH_SIZE * HASH_SIZE
+# 两张图片宽高比相差超过该比例时不视为重复
+MAX_ASPECT_DIFF = 0.02
+# 两张图片平均颜色的任一通道相差超过该值时不视为重复（纯色图片的哈希都相同）
+MAX_COLOR_DIFF = 16
+
+
+def image_hashes(path):
+    """
+    计算图片的感知哈希（可在工作进程中运行）
+
+    JPEG使用draft模式按缩小的比例解码，不需要解码整张大图。
+
+    Args:
+        path: 图片路径
+
+    Returns:
+        dict: ahash、dhash（十六进制字符串）、color（平均颜色）、width、height、size（字节数）
+    """
+    from PIL import Image
+
+    with Image.open(path) as image:
+        width, height = image.size
+        image.draft('RGB', (HASH_SIZE * 4, HASH_SIZE * 4))
+        rgb = image.convert('RGB')
+        color = rgb.resize((1, 1), Image.BOX).getpixel((0, 0))
+        gray = rgb.convert('L')
+        pixels = list(gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR).getdata())
+        small = list(gray.resize((HASH_SIZE, HASH_SIZE), Image.BILINEAR).getdata())
+
+    dhash = 0
+    for row in range(HASH_SIZE):
+        line = pixels[row * (HASH_SIZE + 1):(row + 1) * (HASH_SIZE + 1)]
+        for left, right in zip(line, line[1:]):
+            dhash = (dhash << 1) | (left > right)
+    mean = sum(small) / len(small)
+    ahash = 0
+    for value in small:
+        ahash = (ahash << 1) | (value > mean)
+    return {
+        'ahash': f"{ahash:016x}",
+        'dhash': f"{dhash:016x}",
+        'color': '%02x%02x%02x' % color,
+        'width': width,
+        'height': height,
+        'size': os.path.getsize(path),
+    }
+
+
+def _hash_file(path):
+    """进程池中计算哈希，无法识别的文件返回None"""
+    try:
+        return image_hashes(path)
+    except Exception:
+        return None
+
+
+def hamming(a, b):
+    """两个十六进制哈希的汉明距离"""
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+class ImageHashIndex:
+    """图片感知哈希索引（线程安全）"""
+
+    def __init__(self, index_path=IMAGE_HASH_FILE, images_dir=IMAGES_DIR, max_distance=IMAGE_HASH_DISTANCE):
+        """
+        初始化索引
+
+        Args:
+            index_path: 索引文件路径
+            images_dir: 图片目录（索引中的路径相对于该目录）
+            max_distance: aHash和dHash的汉明距离都不超过该值时视为重复
+        """
+        self.index_path = index_path
+        self.images_dir = images_dir
+        self.max_distance = max_distance
+        self.entries = {}  # 相对路径 -> 记录
+        self.duplicates = 0  # 本次运行链接到已有图片的重复图片数
+        self.reclaimed = 0  # 本次运行节省的字节数
+        self._bands = self._band_slices()
+        self._buckets = [{} for _ in self._bands]  # 每段的值 -> 相对路径集合
+        self._lock = threading.Lock()
+        self._file = None
+
+        index_dir = os.path.dirname(index_path)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 中断时可能留下写了一半的最后一行
+                        continue
+                    if entry.get('path'):
+                        self._put(entry)
+
+    def _band_slices(self):
+        """把64位分为 max_distance+1 段，返回每段的 (位移, 掩码)"""
+        count = min(self.max_distance + 1, HASH_BITS)
+        bands, start = [], 0
+        for i in range(count):
+            width = HASH_BITS // count + (1 if i < HASH_BITS % count else 0)
+            bands.append((start, (1 << width) - 1))
+            start += width
+        return bands
+
+    def _put(self, entry):
+        """放入内存索引（调用方持有锁或在初始化中）"""
+        old = self.entries.get(entry['path'])
+        if old is not None:
+            self._unbucket(old)
+        self.entries[entry['path']] = entry
+        if entry.get('canonical'):
+            # 已链接到其他图片的记录不作为查找目标
+            return
+        value = int(entry['dhash'], 16)
+        for bucket, (shift, mask) in zip(self._buckets, self._bands):
+            bucket.setdefault((value >> shift) & mask, set()).add(entry['path'])
+
+    def _unbucket(self, entry):
+        value = int(entry['dhash'], 16)
+        for bucket, (shift, mask) in zip(self._buckets, self._bands):
+            bucket.get((value >> shift) & mask, set()).discard(entry['path'])
+
+    def _append(self, entry):
+        """写入索引文件（调用方持有锁）"""
+        if self._file is None:
+            self._file = open(self.index_path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def find_duplicate(self, entry):
+        """
+        在索引中查找与记录近似重复的图片
+
+        Args:
+            entry: 图片记录（见 image_hashes）
+
+        Returns:
+            str: 已有图片的相对路径，没有时返回None
+        """
+        best = None
+        for relpath in sorted(self._candidates(entry)):
+            other = self.entries[relpath]
+            if relpath == entry.get('path') or not self._similar(entry, other):
+                continue
+            if not os.path.exists(os.path.join(self.images_dir, relpath)):
+                continue
+            distance = hamming(entry['dhash'], other['dhash']) + hamming(entry['ahash'], other['ahash'])
+            if best is None or distance < best[0]:
+                best = (distance, relpath)
+        return best[1] if best else None
+
+    def _similar(self, a, b):
+        """两条记录的哈希、平均颜色和宽高比是否都足够接近"""
+        if hamming(a['dhash'], b['dhash']) > self.max_distance:
+            return False
+        if hamming(a['ahash'], b['ahash']) > self.max_distance:
+            return False
+        color_a, color_b = bytes.fromhex(a['color']), bytes.fromhex(b['color'])
+        if any(abs(x - y) > MAX_COLOR_DIFF for x, y in zip(color_a, color_b)):
+            return False
+        ratio_a = a['width'] / max(1, a['height'])
+        ratio_b = b['width'] / max(1, b['height'])
+        return abs(ratio_a - ratio_b) <= MAX_ASPECT_DIFF * max(ratio_a, ratio_b)
+
+    def add(self, relpath, hashes=None):
+        """
+        记录一张图片
+
+        Args:
+            relpath: 图片相对于图片目录的路径（使用 / 分隔）
+            hashes: 已计算的哈希（见 image_hashes），为None时现在计算
+
+        Returns:
+            dict: 索引中的记录
+        """
+        if hashes is None:
+            hashes = image_hashes(os.path.join(self.images_dir, relpath))
+        entry = dict(hashes, path=relpath)
+        with self._lock:
+            self._put(entry)
+            self._append(entry)
+        return entry
+
+    def store(self, relpath, link=False):
+        """
+        记录新下载的图片；link为True且已有近似重复的图片时删除新文件，改用已有的图片
+
+        Args:
+            relpath: 图片相对于图片目录的路径（使用 / 分隔）
+            link: 是否把近似重复的图片链接到已有的图片
+
+        Returns:
+            str: 文章中应使用的图片相对路径
+        """
+        full_path = os.path.join(self.images_dir, relpath)
+        try:
+            hashes = image_hashes(full_path)
+        except Exception:
+            # 无法解码的图片（如SVG）不记录
+            return relpath
+        entry = dict(hashes, path=relpath)
+        with self._lock:
+            canonical = self.find_duplicate(entry) if link else None
+            if canonical is None:
+                self._put(entry)
+                self._append(entry)
+                return relpath
+            self.duplicates += 1
+            self.reclaimed += entry['size']
+        os.remove(full_path)
+        return canonical
+
+    def backfill(self, processes=None):
+        """
+        为图片目录中尚未记录的图片批量计算哈希（多进程）
+
+        Args:
+            processes: 进程数，None表示CPU核数
+
+        Returns:
+            int: 新记录的图片数
+        """
+        missing = []
+        for path in iter_files(self.images_dir, IMAGE_EXTENSIONS):
+            relpath = os.path.relpath(path, self.images_dir).replace(os.sep, '/')
+            entry = self.entries.get(relpath)
+            if entry is None or entry.get('size') != os.path.getsize(path):
+                missing.append(relpath)
+        if not missing:
+            return 0
+        paths = [os.path.join(self.images_dir, relpath) for relpath in missing]
+        # 与其他进程池一样使用spawn；每批多张图片，减少进程间通信
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = list(pool.map(_hash_file, paths, chunksize=64))
+        added = 0
+        for relpath, hashes in zip(missing, results):
+            if hashes is not None:
+                self.add(relpath, hashes)
+                added += 1
+        return added
+
+    def duplicate_groups(self):
+        """
+        找出近似重复的图片组
+
+        每组以最早记录的图片为保留的图片，已经是硬链接的图片不再计入。
+
+        Returns:
+            dict: 保留的图片相对路径 -> 重复图片相对路径列表
+        """
+        groups = {}
+        grouped = set()
+        for relpath, entry in list(self.entries.items()):
+            if relpath in grouped or entry.get('canonical'):
+                continue
+            full_path = os.path.join(self.images_dir, relpath)
+            if not os.path.exists(full_path):
+                continue
+            for other in sorted(self._candidates(entry)):
+                if other == relpath or other in grouped or other in groups:
+                    continue
+                other_path = os.path.join(self.images_dir, other)
+                if not os.path.exists(other_path) or not self._similar(entry, self.entries[other]):
+                    continue
+                if os.path.samefile(full_path, other_path):
+                    continue
+                groups.setdefault(relpath, []).append(other)
+                grouped.add(other)
+        return groups
+
+    def _candidates(self, entry):
+        """与记录至少有一段dHash相同的图片"""
+        value = int(entry['dhash'], 16)
+        candidates = set()
+        for bucket, (shift, mask) in zip(self._buckets, self._bands):
+            candidates |= bucket.get((value >> shift) & mask, set())
+        return candidates
+
+    def link(self, canonical, relpath):
+        """
+        把重复图片替换为指向保留图片的硬链接（Markdown中的链接不变）
+
+        Args:
+            canonical: 保留的图片相对路径
+            relpath: 重复图片相对路径
+
+        Returns:
+            int: 节省的字节数
+        """
+        full_path = os.path.join(self.images_dir, relpath)
+        size = os.path.getsize(full_path)
+        tmp_path = full_path + '.link'
+        os.link(os.path.join(self.images_dir, canonical), tmp_path)
+        os.replace(tmp_path, full_path)
+        entry = dict(self.entries[canonical], path=relpath, canonical=canonical)
+        with self._lock:
+            self._put(entry)
+            self._append(entry)
+            self.duplicates += 1
+            self.reclaimed += size
+        return size
+
+    def close(self):
+        """关闭索引文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
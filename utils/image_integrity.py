@@ -0,0 +1,169 @@
+"""
+图片完整性检查模块
+按文件头（magic bytes）识别图片格式，并只读取文件头尾检查图片是否完整
+（JPEG结束标记、PNG的IEND块、GIF结束符、WebP/BMP头中记录的长度）。
+下载时用来修正扩展名、丢弃截断的图片；audit-images 只检查本地文件，损坏的图片放入重新下载队列，
+不需要重新下载整个归档。
+"""
+import os
+import json
+import struct
+from settings import IMAGE_REDOWNLOAD_FILE
+
+
+# 识别格式需要的文件头长度
+SNIFF_BYTES = 16
+# 检查结束标记时读取的文件尾长度（JPEG结束标记后可能还有少量填充）
+TAIL_BYTES = 1024
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_IEND = b'IEND\xaeB`\x82'
+
+
+def sniff_image_format(head):
+    """
+    根据文件头识别图片格式
+
+    Args:
+        head: 文件开头的字节（至少 SNIFF_BYTES 字节时结果最可靠）
+
+    Returns:
+        str: 扩展名（如 .png），无法识别时返回None
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return '.jpg'
+    if head.startswith(PNG_SIGNATURE):
+        return '.png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return '.gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    if head[:2] == b'BM':
+        return '.bmp'
+    if head[4:8] == b'ftyp' and head[8:12] in (b'avif', b'avis'):
+        return '.avif'
+    return None
+
+
+def sniff_file_format(path):
+    """读取文件头识别图片格式，见 sniff_image_format"""
+    with open(path, 'rb') as f:
+        return sniff_image_format(f.read(SNIFF_BYTES))
+
+
+def check_image(path):
+    """
+    检查图片文件是否完整（只读取文件头尾，不解码图片）
+
+    Args:
+        path: 图片路径
+
+    Returns:
+        str: 问题描述，图片完整时返回None
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return '文件不存在'
+    if size == 0:
+        return '空文件'
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+        f.seek(max(0, size - TAIL_BYTES))
+        tail = f.read()
+
+    ext = sniff_image_format(head)
+    if ext is None:
+        return '无法识别的文件头（不是图片）'
+    if ext == '.jpg' and b'\xff\xd9' not in tail:
+        return 'JPEG缺少结束标记（下载不完整）'
+    if ext == '.png' and PNG_IEND not in tail:
+        return 'PNG缺少IEND块（下载不完整）'
+    if ext == '.gif' and not tail.rstrip(b'\x00').endswith(b'\x3b'):
+        return 'GIF缺少结束符（下载不完整）'
+    if ext == '.webp' and len(head) >= 8 and struct.unpack('<I', head[4:8])[0] + 8 > size:
+        return 'WebP长度不足（下载不完整）'
+    if ext == '.bmp' and len(head) >= 6 and struct.unpack('<I', head[2:6])[0] > size:
+        return 'BMP长度不足（下载不完整）'
+    return None
+
+
+class RedownloadQueue:
+    """
+    需要重新下载的图片
+
+    保存为JSON Lines文件，每行一张图片：url、path（相对于图片目录，重新下载时写回原路径，
+    Markdown中的链接不需要改动）和 reason。重新下载成功的图片从队列中移除。
+    """
+
+    def __init__(self, path=IMAGE_REDOWNLOAD_FILE):
+        """
+        初始化队列
+
+        Args:
+            path: 队列文件路径
+        """
+        self.path = path
+        self.entries = {}  # URL -> 记录
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get('url'):
+                        self.entries[entry['url']] = entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, url, relpath, reason):
+        """加入一张需要重新下载的图片"""
+        self.entries[url] = {'url': url, 'path': relpath, 'reason': reason}
+
+    def remove(self, url):
+        """移除已重新下载的图片"""
+        self.entries.pop(url, None)
+
+    def save(self):
+        """写回队列文件（先写临时文件再替换，中断时不会留下半个文件）"""
+        queue_dir = os.path.dirname(self.path)
+        if queue_dir:
+            os.makedirs(queue_dir, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+
+
+def audit_images(cache, queue):
+    """
+    检查图片缓存索引中的所有本地图片，缺失、大小不符或不完整的放入重新下载队列
+
+    Args:
+        cache: ImageCache
+        queue: RedownloadQueue
+
+    Returns:
+        dict: checked（检查的图片数）、queued（本次放入队列的图片数）
+    """
+    stats = {'checked': 0, 'queued': 0}
+    for url, entry in list(cache.entries.items()):
+        stats['checked'] += 1
+        relpath = cache.locate(entry)
+        if relpath is None:
+            reason = '文件不存在'
+            relpath = entry['path']
+        else:
+            full_path = os.path.join(cache.images_dir, relpath)
+            if os.path.getsize(full_path) != entry.get('size'):
+                reason = '大小与下载时不符'
+            else:
+                reason = check_image(full_path)
+        if reason:
+            # 规范化的URL可能已去掉协议等信息，优先使用下载时的原始URL
+            queue.add(entry.get('source', url), relpath.replace(os.sep, '/'), reason)
+            stats['queued'] += 1
+    return stats
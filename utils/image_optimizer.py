@@ -0,0 +1,320 @@
+"""
+图片后处理模块
+下载完成后用Pillow把PNG/BMP/JPEG转为WebP或AVIF、限制最大尺寸并去掉EXIF等元数据，
+可选把GIF动图转为WebP动图。
+压缩在进程池中进行，与其他图片的下载同时进行；压缩后体积没有变小时保留原图。
+"""
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from utils.layout import iter_files
+from settings import (
+    IMAGE_OPTIMIZE_FORMAT, IMAGE_MAX_DIMENSION, IMAGE_OPTIMIZE_QUALITY, IMAGE_OPTIMIZE_PROCESSES,
+    IMAGE_GIF_TO_WEBP, IMAGE_GIF_KEEP_ORIGINAL
+)
+
+
+FORMAT_WEBP = 'webp'
+FORMAT_AVIF = 'avif'
+OPTIMIZE_FORMATS = (FORMAT_WEBP, FORMAT_AVIF)
+
+# 需要处理的原图格式（GIF等动图不处理）
+OPTIMIZABLE_FORMATS = ('PNG', 'BMP', 'JPEG', 'MPO', 'WEBP')
+
+
+def _unused_path(path):
+    """path已存在时在文件名后加序号"""
+    stem, ext = os.path.splitext(path)
+    suffix = 1
+    while os.path.exists(path):
+        path = f"{stem}_{suffix}{ext}"
+        suffix += 1
+    return path
+
+
+def convert_animated_gif(path, quality=IMAGE_OPTIMIZE_QUALITY, keep_original=IMAGE_GIF_KEEP_ORIGINAL):
+    """
+    把GIF动图转换为WebP动图，保留每帧的时长和循环次数（在工作进程中运行）
+
+    Args:
+        path: GIF路径
+        quality: 有损压缩质量（1-100）
+        keep_original: 转换后是否保留原GIF
+
+    Returns:
+        dict: 同 optimize_image；不是动图或转换后没有变小时 path 不变
+    """
+    from PIL import Image, ImageSequence
+
+    before = os.path.getsize(path)
+    result = {'path': path, 'before': before, 'after': before}
+    tmp_path = path + '.optimizing'
+    with Image.open(path) as image:
+        if image.format != 'GIF' or not getattr(image, 'is_animated', False):
+            return result
+        durations = [frame.info.get('duration', 100) for frame in ImageSequence.Iterator(image)]
+        image.seek(0)
+        try:
+            image.save(tmp_path, format='WEBP', save_all=True, duration=durations,
+                       loop=image.info.get('loop', 0), quality=quality, method=4)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    after = os.path.getsize(tmp_path)
+    if after >= before:
+        os.remove(tmp_path)
+        return result
+    new_path = _unused_path(os.path.splitext(path)[0] + '.webp')
+    os.replace(tmp_path, new_path)
+    if not keep_original:
+        os.remove(path)
+    return {'path': new_path, 'before': before, 'after': after}
+
+
+def optimize_image(path, target_format=IMAGE_OPTIMIZE_FORMAT, max_dimension=IMAGE_MAX_DIMENSION,
+                   quality=IMAGE_OPTIMIZE_QUALITY, animated_gif=False, keep_original=IMAGE_GIF_KEEP_ORIGINAL):
+    """
+    转换格式、限制尺寸并去掉元数据（在工作进程中运行）
+
+    Args:
+        path: 图片路径
+        target_format: 目标格式（webp、avif），为None时只限制尺寸
+        max_dimension: 最长边的像素上限，0表示不限制
+        quality: 有损压缩质量（1-100）
+        animated_gif: 是否把GIF动图转换为WebP动图（见 convert_animated_gif）
+        keep_original: 转换GIF动图后是否保留原GIF
+
+    Returns:
+        dict: path（处理后的路径，可能与原路径不同）、before、after（处理前后的字节数）
+    """
+    from PIL import Image, ImageOps
+
+    before = os.path.getsize(path)
+    result = {'path': path, 'before': before, 'after': before}
+    with Image.open(path) as image:
+        source_format = image.format
+        if source_format == 'GIF' and animated_gif:
+            return convert_animated_gif(path, quality, keep_original)
+        if source_format not in OPTIMIZABLE_FORMATS:
+            return result
+        image = ImageOps.exif_transpose(image)
+        resized = bool(max_dimension) and max(image.size) > max_dimension
+        if resized:
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        if not target_format and not resized:
+            return result
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.mode or 'transparency' in image.info else 'RGB')
+
+        save_format = (target_format or source_format).upper()
+        if save_format == 'MPO':
+            save_format = 'JPEG'
+        ext = '.jpg' if save_format == 'JPEG' else f".{save_format.lower()}"
+        if save_format == 'JPEG' and image.mode == 'RGBA':
+            image = image.convert('RGB')
+        tmp_path = path + '.optimizing'
+        options = {'quality': quality} if save_format in ('WEBP', 'AVIF', 'JPEG') else {}
+        try:
+            # 不传 exif/icc_profile，元数据不会写入新文件
+            image.save(tmp_path, format=save_format, **options)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    after = os.path.getsize(tmp_path)
+    if after >= before and not resized:
+        os.remove(tmp_path)
+        return result
+
+    stem, old_ext = os.path.splitext(path)
+    new_path = path if old_ext.lower() == ext else _unused_path(stem + ext)
+    os.replace(tmp_path, new_path)
+    if new_path != path:
+        os.remove(path)
+    return {'path': new_path, 'before': before, 'after': after}
+
+
+def animated_webp_supported():
+    """当前Pillow是否支持写入WebP动图"""
+    from PIL import features
+    # Pillow 11 起WebP总是支持动图，不再单独列出 webp_anim
+    if features.check('webp') and ('webp_anim' not in features.features or features.check('webp_anim')):
+        return True
+    print("警告: 当前Pillow不支持WebP动图，不转换GIF")
+    return False
+
+
+def resolve_format(target_format):
+    """
+    检查Pillow是否支持目标格式，不支持AVIF时改用WebP
+
+    Returns:
+        str: 实际使用的格式，为None时不转换格式
+    """
+    if not target_format:
+        return None
+    if target_format not in OPTIMIZE_FORMATS:
+        raise ValueError(f"不支持的图片格式: {target_format}（可选 {', '.join(OPTIMIZE_FORMATS)}）")
+    from PIL import features
+    if target_format == FORMAT_AVIF and not features.check('avif'):
+        print("警告: 当前Pillow不支持AVIF，改为WebP")
+        return FORMAT_WEBP
+    return target_format
+
+
+class ImageOptimizer:
+    """图片后处理进程池"""
+
+    def __init__(self, target_format=IMAGE_OPTIMIZE_FORMAT, max_dimension=IMAGE_MAX_DIMENSION,
+                 quality=IMAGE_OPTIMIZE_QUALITY, processes=IMAGE_OPTIMIZE_PROCESSES,
+                 animated_gif=IMAGE_GIF_TO_WEBP, keep_original=IMAGE_GIF_KEEP_ORIGINAL):
+        """
+        初始化后处理器
+
+        Args:
+            target_format: 目标格式（webp、avif），为None时只限制尺寸
+            max_dimension: 最长边的像素上限，0表示不限制
+            quality: 有损压缩质量（1-100）
+            processes: 工作进程数，0表示在调用线程中处理
+            animated_gif: 是否把GIF动图转换为WebP动图
+            keep_original: 转换GIF动图后是否保留原GIF
+        """
+        self.target_format = resolve_format(target_format)
+        self.animated_gif = bool(animated_gif) and animated_webp_supported()
+        self.keep_original = keep_original
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.processes = processes
+        self._executor = None
+        self._lock = threading.Lock()
+        self.saved_bytes = 0
+
+    @property
+    def enabled(self):
+        """是否需要处理图片"""
+        return bool(self.target_format or self.max_dimension or self.animated_gif)
+
+    def submit(self, path):
+        """
+        提交一张图片（第一次提交时启动进程池）
+
+        Args:
+            path: 图片路径
+
+        Returns:
+            Future: 结果见 optimize_image
+        """
+        with self._lock:
+            if self._executor is None:
+                if self.processes > 0:
+                    # 与PDF渲染进程池一样使用spawn，避免在多线程进程中fork
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.processes, mp_context=multiprocessing.get_context('spawn')
+                    )
+                else:
+                    self._executor = _InlineExecutor()
+        return self._executor.submit(optimize_image, path, self.target_format, self.max_dimension, self.quality,
+                                     self.animated_gif, self.keep_original)
+
+    def result(self, future, path):
+        """
+        取得处理结果，处理失败时保留原图
+
+        Returns:
+            str: 处理后的图片路径
+        """
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"警告: 图片压缩失败，保留原图 {path}: {str(e)}")
+            return path
+        with self._lock:
+            self.saved_bytes += result['before'] - result['after']
+        return result['path']
+
+    def close(self):
+        """关闭进程池"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+def compact_gifs(images_dir, markdown_dir, optimizer, cache=None, keep_original=False, dry_run=False):
+    """
+    把已有归档中的GIF动图转换为WebP动图，改写Markdown中的链接并更新图片缓存
+
+    先生成WebP、改写链接、更新缓存，最后才删除原GIF；中断后重新运行时，
+    已有同名WebP的GIF视为已转换，只补做后面的步骤。
+
+    Args:
+        images_dir: 图片目录
+        markdown_dir: Markdown目录
+        optimizer: 开启了 animated_gif 的 ImageOptimizer
+        cache: ImageCache，为None时不更新缓存
+        keep_original: 是否保留原GIF
+        dry_run: 只统计，不转换
+
+    Returns:
+        dict: todo（待转换数）、converted（已转换数）、unchanged（不是动图或没有变小的GIF数）、
+            saved（节省的字节数）、markdown、links（改写的文件数和链接数）
+    """
+    from utils.archive_index import rewrite_image_links
+
+    converted = {}  # GIF绝对路径 -> WebP绝对路径
+    todo = []
+    for path in iter_files(images_dir, ('.gif',)):
+        webp_path = os.path.splitext(path)[0] + '.webp'
+        if os.path.exists(webp_path):
+            converted[os.path.abspath(path)] = os.path.abspath(webp_path)
+        else:
+            todo.append(path)
+    stats = {'todo': len(todo), 'converted': len(converted), 'unchanged': 0, 'saved': 0,
+             'markdown': 0, 'links': 0}
+    if dry_run:
+        return stats
+
+    # 先保留原GIF，链接改写完成后再删除
+    keep = optimizer.keep_original
+    optimizer.keep_original = True
+    saved_before = optimizer.saved_bytes
+    try:
+        futures = [(optimizer.submit(path), path) for path in todo]
+        for future, path in futures:
+            new_path = optimizer.result(future, path)
+            if new_path == path:
+                stats['unchanged'] += 1
+            else:
+                converted[os.path.abspath(path)] = os.path.abspath(new_path)
+    finally:
+        optimizer.keep_original = keep
+    stats['saved'] = optimizer.saved_bytes - saved_before
+
+    stats.update(rewrite_image_links(markdown_dir, converted))
+    for gif_path, webp_path in converted.items():
+        if cache is not None:
+            cache.refresh(os.path.relpath(gif_path, images_dir).replace(os.sep, '/'),
+                          os.path.relpath(webp_path, images_dir).replace(os.sep, '/'))
+        if not keep_original:
+            os.remove(gif_path)
+    stats['converted'] = len(converted)
+    return stats
+
+
+class _InlineExecutor:
+    """不使用进程池时在调用线程中直接处理"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self):
+        pass
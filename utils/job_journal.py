@@ -0,0 +1,220 @@
+"""
+任务日志模块
+以追加写入（write-ahead）的方式记录每篇文章在各阶段的状态，用于中断后恢复批量任务
+"""
+import os
+import json
+import threading
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from utils.quarantine import VerificationRequired
+
+
+# 文章处理阶段（按先后顺序）
+STAGE_QUEUED = 'queued'
+STAGE_FETCHED = 'fetched'
+STAGE_IMAGES = 'images'
+STAGE_MD = 'md'
+STAGE_PDF = 'pdf'
+STAGE_QUARANTINED = 'quarantined'  # 遇到验证页面，等待冷却后重试
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+STAGES = (STAGE_QUEUED, STAGE_FETCHED, STAGE_IMAGES, STAGE_MD, STAGE_PDF)
+TERMINAL_STATES = (STATE_DONE, STATE_FAILED)
+
+# 任务离开失败状态时清除的字段
+FAILURE_FIELDS = ('error', 'error_class', 'failed_stage')
+
+# 失败分类
+ERROR_VERIFICATION = 'verification'
+ERROR_TIMEOUT = 'timeout'
+ERROR_NETWORK = 'network'
+ERROR_PARTIAL_IMAGES = 'partial_images'
+ERROR_MISSING_PDF = 'missing_pdf'
+ERROR_UNKNOWN = 'unknown'
+
+
+def get_article_id(url):
+    """
+    从文章URL中提取文章ID
+
+    短链接（/s/xxx）直接使用路径中的ID，长链接使用 __biz、mid、idx 组合
+
+    Args:
+        url: 文章URL
+
+    Returns:
+        str: 文章ID，无法识别时返回None
+    """
+    try:
+        parsed = urlparse(url)
+    except Exception:
+        return None
+
+    if '/s/' in parsed.path:
+        article_id = parsed.path.split('/s/')[-1].strip('/')
+        if article_id:
+            return article_id
+
+    query = parse_qs(parsed.query)
+    biz = query.get('__biz', [''])[0]
+    mid = query.get('mid', [''])[0]
+    idx = query.get('idx', [''])[0]
+    if biz and mid:
+        return f"{biz}_{mid}_{idx or '1'}"
+    return None
+
+
+def classify_error(error):
+    """
+    根据异常推断失败分类
+
+    Args:
+        error: 异常对象或错误信息
+
+    Returns:
+        str: 失败分类
+    """
+    if isinstance(error, VerificationRequired):
+        return ERROR_VERIFICATION
+    message = str(error)
+    lowered = message.lower()
+
+    if '环境异常' in message or '验证' in message or 'verification' in lowered:
+        return ERROR_VERIFICATION
+    if isinstance(error, TimeoutError) or 'timeout' in lowered or 'timed out' in lowered or '超时' in message:
+        return ERROR_TIMEOUT
+    if isinstance(error, (ConnectionError, OSError)) or 'connection' in lowered or '获取文章失败' in message:
+        return ERROR_NETWORK
+    return ERROR_UNKNOWN
+
+
+def _merge(record, entry):
+    """
+    把一条状态变更合并到任务记录中（记录和回放日志时相同）
+
+    Args:
+        record: 任务记录（原地修改）
+        entry: 状态变更
+    """
+    if entry.get('state') != STATE_FAILED:
+        # 状态前进后清除上一次的失败信息
+        for key in FAILURE_FIELDS:
+            record.pop(key, None)
+    record.update(entry)
+
+
+class JobJournal:
+    """批量任务日志（JSON Lines，每行一条状态变更）"""
+
+    def __init__(self, journal_path):
+        """
+        初始化任务日志
+
+        Args:
+            journal_path: 日志文件路径
+        """
+        self.journal_path = journal_path
+        self.jobs = {}  # URL -> 最新状态记录
+        self._lock = threading.Lock()
+        self._file = None
+
+        journal_dir = os.path.dirname(journal_path)
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """回放日志文件，恢复每个URL的最新状态"""
+        if not os.path.exists(self.journal_path):
+            return
+
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 中断时可能留下写了一半的最后一行，直接忽略
+                    continue
+                url = entry.get('url')
+                if not url:
+                    continue
+                _merge(self.jobs.setdefault(url, {}), entry)
+
+    def _open(self):
+        """以追加模式打开日志文件"""
+        if self._file is None:
+            self._file = open(self.journal_path, 'a', encoding='utf-8')
+        return self._file
+
+    def record(self, url, state, **fields):
+        """
+        记录一次状态变更
+
+        Args:
+            url: 文章URL
+            state: 新状态（阶段名、done 或 failed）
+            **fields: 附加字段（如 error_class、md_path、pdf_path）
+        """
+        entry = {'url': url, 'state': state, 'ts': datetime.now().isoformat(timespec='seconds')}
+        entry.update({k: v for k, v in fields.items() if v is not None})
+
+        with self._lock:
+            _merge(self.jobs.setdefault(url, {}), entry)
+
+            f = self._open()
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            if state in TERMINAL_STATES:
+                os.fsync(f.fileno())
+
+    def get(self, url):
+        """获取URL的最新状态记录"""
+        with self._lock:
+            record = self.jobs.get(url)
+            return dict(record) if record else None
+
+    def get_state(self, url):
+        """获取URL的最新状态"""
+        record = self.get(url)
+        return record.get('state') if record else None
+
+    def is_finished(self, url):
+        """URL是否已处于终态（完成或失败）"""
+        return self.get_state(url) in TERMINAL_STATES
+
+    def failures(self, error_classes=None):
+        """
+        获取失败的任务
+
+        Args:
+            error_classes: 只返回这些失败分类（None表示全部）
+
+        Returns:
+            list: 失败任务记录列表
+        """
+        with self._lock:
+            records = [dict(r) for r in self.jobs.values() if r.get('state') == STATE_FAILED]
+        if error_classes:
+            records = [r for r in records if r.get('error_class') in error_classes]
+        return records
+
+    def flush(self):
+        """将日志刷写到磁盘"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        """刷写并关闭日志文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
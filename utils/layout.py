@@ -0,0 +1,115 @@
+"""
+输出目录布局模块
+决定Markdown、PDF和图片的存放位置，支持平铺（flat）和分片（sharded）两种布局
+"""
+import os
+import re
+import hashlib
+from datetime import datetime
+from settings import MARKDOWN_DIR, IMAGES_DIR, PDF_DIR, INVALID_CHARS, OUTPUT_LAYOUT
+
+
+LAYOUT_FLAT = 'flat'
+LAYOUT_SHARDED = 'sharded'
+LAYOUTS = (LAYOUT_FLAT, LAYOUT_SHARDED)
+
+# 未知公众号或发布时间时使用的分片名
+UNKNOWN_SHARD = '_unknown'
+
+
+def iter_files(root, suffixes):
+    """
+    递归遍历目录下指定后缀的文件
+
+    Args:
+        root: 根目录
+        suffixes: 文件后缀元组（小写）
+
+    Yields:
+        str: 文件路径
+    """
+    if not os.path.isdir(root):
+        return
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        with os.scandir(current) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(suffixes):
+                    yield entry.path
+
+
+def _safe_component(name):
+    """把公众号名称等转换为安全的目录名"""
+    for char in INVALID_CHARS:
+        name = name.replace(char, '_')
+    name = re.sub(r'[_\s]+', '_', name).strip('_.')
+    return name[:50] or UNKNOWN_SHARD
+
+
+def article_shard(account, publish_time):
+    """
+    计算文章所在的分片目录（公众号/年-月）
+
+    Args:
+        account: 公众号名称
+        publish_time: 发布时间（%Y-%m-%d %H:%M:%S）
+
+    Returns:
+        str: 相对分片路径
+    """
+    try:
+        month = datetime.strptime(publish_time, '%Y-%m-%d %H:%M:%S').strftime('%Y-%m')
+    except (TypeError, ValueError):
+        month = UNKNOWN_SHARD
+    return os.path.join(_safe_component(account or ''), month)
+
+
+def markdown_dir_for(account, publish_time, layout=OUTPUT_LAYOUT, markdown_dir=MARKDOWN_DIR):
+    """获取文章Markdown文件所在目录"""
+    if layout == LAYOUT_SHARDED:
+        return os.path.join(markdown_dir, article_shard(account, publish_time))
+    return markdown_dir
+
+
+def pdf_dir_for(account, publish_time, layout=OUTPUT_LAYOUT, pdf_dir=PDF_DIR):
+    """获取文章PDF文件所在目录"""
+    if layout == LAYOUT_SHARDED:
+        return os.path.join(pdf_dir, article_shard(account, publish_time))
+    return pdf_dir
+
+
+def image_relpath(filename, layout=OUTPUT_LAYOUT):
+    """
+    获取图片相对于图片目录的路径
+
+    分片布局按文件名哈希的前两位分到256个子目录
+
+    Args:
+        filename: 图片文件名
+
+    Returns:
+        str: 相对路径（使用 / 分隔）
+    """
+    if layout == LAYOUT_SHARDED:
+        bucket = hashlib.md5(filename.encode('utf-8')).hexdigest()[:2]
+        return f"{bucket}/{filename}"
+    return filename
+
+
+def image_link_prefix(md_dir, images_dir=IMAGES_DIR):
+    """
+    获取Markdown中引用 images/ 时需要的相对前缀
+
+    Args:
+        md_dir: Markdown文件所在目录
+
+    Returns:
+        str: 前缀（如 ../）
+    """
+    rel = os.path.relpath(os.path.dirname(os.path.abspath(images_dir)), os.path.abspath(md_dir))
+    if rel == '.':
+        return ''
+    return rel.replace(os.sep, '/') + '/'
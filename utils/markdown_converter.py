@@ -18,12 +18,13 @@ class MarkdownConverter:
             'bullets': '-',  # 使用 - 作为列表符号
         }
     
-    def html_to_markdown(self, html_content):
+    def html_to_markdown(self, html_content, image_prefix='../'):
         """
         将HTML转换为Markdown
         
         Args:
             html_content: HTML内容
+            image_prefix: 从Markdown文件所在目录到images/所在目录的相对前缀
             
         Returns:
             str: Markdown内容
@@ -95,9 +96,13 @@ class MarkdownConverter:
         # 匹配块级公式 $$...$$，允许前面有空白字符
         markdown_content = re.sub(r'[ \xa0]*\$\$\s*\n(.*?)\n\s*\$\$', fix_block_formula, markdown_content, flags=re.DOTALL)
         
-        # 修复图片路径：markdown文件在markdown/目录，图片在images/目录
-        # 需要将 images/ 改为 ../images/
-        markdown_content = re.sub(r'!\[([^\]]*)\]\(images/([^)]+)\)', r'![\1](../images/\2)', markdown_content)
+        # 修复图片路径：markdown文件在markdown/目录（分片布局下更深），图片在images/目录
+        # 需要将 images/ 改为 ../images/ 等相对路径
+        markdown_content = re.sub(
+            r'!\[([^\]]*)\]\(images/([^)]+)\)',
+            lambda m: f'![{m.group(1)}]({image_prefix}images/{m.group(2)})',
+            markdown_content
+        )
         
         # 修复KaTeX格式错误：修复数字后跟中文冒号和公式的错误格式
         # 1. 修复 "数字：$$" 格式（中文冒号改为英文点号）
@@ -136,8 +141,8 @@ class MarkdownConverter:
                 # 块级公式：使用$$...$$
                 markdown_formula = f"$$\n{formula}\n$$"
             else:
-                # 行内公式：使用$...$
-                markdown_formula = f"${formula}$"
+                # 行内公式：使用$...$（去掉首尾空白，$ 紧挨公式才会被识别为公式）
+                markdown_formula = f"${formula.strip()}$"
             
             # 替换mjx-container标签为Markdown公式
             # 创建一个新的文本节点
@@ -300,7 +305,7 @@ class MarkdownConverter:
         
         return '\n'.join(cleaned_lines)
     
-    def add_metadata(self, markdown_content, title, author, publish_time, url=None):
+    def add_metadata(self, markdown_content, title, author, publish_time, url=None, account=None):
         """
         在Markdown末尾添加元数据
         
@@ -310,6 +315,7 @@ class MarkdownConverter:
             author: 作者
             publish_time: 发布时间
             url: 文章URL（可选）
+            account: 公众号名称（可选）
             
         Returns:
             str: 添加元数据后的Markdown内容
@@ -323,6 +329,8 @@ class MarkdownConverter:
         # 元数据放在末尾
         result += "\n\n---\n\n"
         result += f"**作者**: {author}  \n"
+        if account:
+            result += f"**公众号**: {account}  \n"
         result += f"**发布时间**: {publish_time}  \n"
         if url:
             result += f"**原文链接**: {url}  \n"
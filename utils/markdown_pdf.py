@@ -0,0 +1,368 @@
+"""
+离线Markdown转PDF模块
+把 MarkdownConverter 生成的Markdown渲染为HTML（图片引用解析为本地文件，公式离线排版为MathML），
+再在浏览器中打印为PDF。全程不访问网络，每篇文章一两秒即可完成，也不会触发微信的验证。
+"""
+import os
+import re
+import html
+import time
+import asyncio
+import tempfile
+from pathlib import Path
+from urllib.parse import unquote
+from settings import IMAGES_DIR, PDF_PRINT_BACKEND
+from utils.pdf_stream import print_pdf_streamed, print_pdf_streamed_async
+from utils.wechat_to_pdf_perfect import (
+    BROWSER_ARGS, CONTEXT_OPTIONS, PDF_OPTIONS, IMAGE_STATUS_JS, PRINT_BACKEND_STREAM,
+    load_sync_playwright, resolve_pdf_path, skip_existing_pdf, finalize_pdf, get_url_from_markdown,
+)
+
+
+MARKDOWN_EXTENSIONS = ['tables', 'fenced_code', 'sane_lists']
+
+# 块级公式 $$...$$ 和行内公式 $...$（格式与 MarkdownConverter 的输出一致）
+BLOCK_FORMULA_PATTERN = re.compile(r'\$\$\s*\n?(.+?)\n?\s*\$\$', re.DOTALL)
+# 行内公式按 pandoc 的 tex_math_dollars 规则：开头的 $ 后面不是空白，结尾的 $ 前面不是空白、后面不是数字，
+# 避免把 "售价 $5，折后 $3" 这样的金额当作公式
+INLINE_FORMULA_PATTERN = re.compile(r'(?<![\\$])\$(?![\s$])([^$\n]*?[^\s$\\])\$(?!\d)')
+# 围栏代码块和行内代码，其中的 $ 不是公式（未闭合的代码块到文档末尾为止）
+CODE_PATTERN = re.compile(
+    r'^(`{3,}|~{3,})[^\n]*\n.*?(?:^\1[ \t]*$|\Z)'
+    r'|(`+)(?!`)(?:[^\n]|\n(?!\s*\n))+?(?<!`)\2(?!`)',
+    re.MULTILINE | re.DOTALL
+)
+FORMULA_PLACEHOLDER = 'WXMATHFORMULA{}END'
+FORMULA_PLACEHOLDER_PATTERN = re.compile(r'(<p>)?WXMATHFORMULA(\d+)END(</p>)?')
+
+# Markdown中图片的引用路径（../images/xxx.jpg）
+IMAGE_SRC_PATTERN = re.compile(r'(<img\b[^>]*?\bsrc=")([^"]+)(")')
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{
+    font-family: -apple-system, "PingFang SC", "Hiragino Sans GB", "Microsoft YaHei", "Noto Sans CJK SC", sans-serif;
+    font-size: 15px; line-height: 1.75; color: #333; max-width: 680px; margin: 0 auto;
+}}
+h1 {{ font-size: 22px; line-height: 1.4; }}
+h2, h3, h4 {{ line-height: 1.4; }}
+img {{ max-width: 100%; height: auto; display: block; margin: 12px auto; page-break-inside: avoid; }}
+blockquote {{ margin: 1em 0; padding: 0 1em; color: #666; border-left: 3px solid #ddd; }}
+pre {{ background: #f6f8fa; padding: 12px; overflow-x: auto; white-space: pre-wrap; word-break: break-all; }}
+code {{ font-family: Menlo, Consolas, monospace; font-size: 13px; }}
+table {{ border-collapse: collapse; margin: 1em 0; }}
+th, td {{ border: 1px solid #ddd; padding: 6px 10px; }}
+a {{ color: #576b95; word-break: break-all; }}
+.math-block {{ margin: 1em 0; text-align: center; overflow-x: auto; }}
+code.math {{ background: none; color: #444; }}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+def load_markdown():
+    """
+    导入 markdown 库
+
+    Returns:
+        markdown 模块
+    """
+    try:
+        import markdown
+    except ImportError:
+        raise ImportError(
+            "未安装 markdown，请先运行: python wechat_article_downloader.py install-deps"
+        ) from None
+    return markdown
+
+
+def typeset_formula(tex, display=False):
+    """
+    把LaTeX公式离线排版为MathML（Chromium原生支持，不需要加载MathJax）
+
+    未安装 latex2mathml 或公式无法解析时，保留LaTeX源码显示。
+
+    Args:
+        tex: LaTeX公式
+        display: 是否是块级公式
+
+    Returns:
+        str: HTML片段
+    """
+    try:
+        from latex2mathml.converter import convert
+        mathml = convert(tex, display='block' if display else 'inline')
+    except Exception:
+        mathml = f'<code class="math">{html.escape(tex)}</code>'
+    if display:
+        return f'<div class="math-block">{mathml}</div>'
+    return mathml
+
+
+def _extract_formulas(markdown_content):
+    """
+    把公式替换为占位符，避免Markdown把公式中的 _ 和 * 当作强调（代码块和行内代码中的 $ 保持不变）
+
+    Returns:
+        tuple: (替换后的Markdown, 公式列表[(LaTeX, 是否块级)])
+    """
+    formulas = []
+
+    def replace(match, display):
+        formulas.append((match.group(1).strip(), display))
+        placeholder = FORMULA_PLACEHOLDER.format(len(formulas) - 1)
+        return f"\n\n{placeholder}\n\n" if display else placeholder
+
+    def replace_in_text(text):
+        text = BLOCK_FORMULA_PATTERN.sub(lambda m: replace(m, True), text)
+        return INLINE_FORMULA_PATTERN.sub(lambda m: replace(m, False), text)
+
+    # 只替换代码块和行内代码之外的部分
+    parts = []
+    position = 0
+    for code in CODE_PATTERN.finditer(markdown_content):
+        parts.append(replace_in_text(markdown_content[position:code.start()]))
+        parts.append(code.group(0))
+        position = code.end()
+    parts.append(replace_in_text(markdown_content[position:]))
+    return ''.join(parts), formulas
+
+
+def _restore_formulas(body, formulas):
+    """把占位符替换为排版后的公式"""
+    def replace(match):
+        tex, display = formulas[int(match.group(2))]
+        typeset = typeset_formula(tex, display)
+        if display:
+            return typeset
+        return (match.group(1) or '') + typeset + (match.group(3) or '')
+    return FORMULA_PLACEHOLDER_PATTERN.sub(replace, body)
+
+
+def resolve_image_src(src, md_dir, images_dir=IMAGES_DIR):
+    """
+    把Markdown中的图片引用解析为本地文件URL
+
+    优先按 images/ 之后的相对路径在图片目录中查找（Markdown移动过位置也能找到），
+    找不到时再相对Markdown所在目录解析。网络图片保持不变（打印时会被拦截）。
+
+    Args:
+        src: 图片引用（如 ../images/xxx.jpg）
+        md_dir: Markdown文件所在目录
+        images_dir: 图片目录
+
+    Returns:
+        str: file:// URL，找不到文件时返回原引用
+    """
+    if re.match(r'^[a-zA-Z][a-zA-Z0-9+.-]*:', src):
+        return src
+    path = unquote(src)
+    candidates = []
+    if 'images/' in path:
+        candidates.append(os.path.join(images_dir, path.split('images/', 1)[1]))
+    candidates.append(os.path.join(md_dir, path))
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return Path(os.path.abspath(candidate)).as_uri()
+    return src
+
+
+def markdown_to_html(markdown_content, md_dir, images_dir=IMAGES_DIR):
+    """
+    把Markdown渲染为完整的HTML文档
+
+    Args:
+        markdown_content: Markdown内容
+        md_dir: Markdown文件所在目录（用于解析图片的相对路径）
+        images_dir: 图片目录
+
+    Returns:
+        tuple: (HTML文档, 标题)
+    """
+    markdown = load_markdown()
+    markdown_content, formulas = _extract_formulas(markdown_content)
+    body = markdown.markdown(markdown_content, extensions=MARKDOWN_EXTENSIONS)
+    body = _restore_formulas(body, formulas)
+    body = IMAGE_SRC_PATTERN.sub(
+        lambda m: m.group(1) + html.escape(resolve_image_src(html.unescape(m.group(2)), md_dir, images_dir))
+        + m.group(3),
+        body
+    )
+
+    title_match = re.search(r'^#\s+(.+?)\s*$', markdown_content, re.MULTILINE)
+    title = title_match.group(1) if title_match else ''
+    return HTML_TEMPLATE.format(title=html.escape(title), body=body), title
+
+
+def write_html(md_file, images_dir=IMAGES_DIR, html_dir=None):
+    """
+    把Markdown文件渲染为临时HTML文件（使用完后由调用方删除）
+
+    HTML必须以 file:// 打开，页面中的本地图片才能加载。
+
+    Args:
+        md_file: Markdown文件路径
+        images_dir: 图片目录
+        html_dir: HTML临时文件目录，默认系统临时目录
+
+    Returns:
+        tuple: (HTML文件路径, 标题)
+    """
+    with open(md_file, 'r', encoding='utf-8') as f:
+        markdown_content = f.read()
+    document, title = markdown_to_html(markdown_content, os.path.dirname(os.path.abspath(md_file)), images_dir)
+    if not title:
+        title = os.path.splitext(os.path.basename(md_file))[0]
+    fd, html_path = tempfile.mkstemp(suffix='.html', prefix='md_to_pdf_', dir=html_dir)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(document)
+    return html_path, title
+
+
+def _resolve_output(pdf_output, title):
+    """pdf_output 是完整的PDF路径时直接使用，是目录时按标题命名"""
+    if pdf_output.endswith('.pdf'):
+        return pdf_output
+    return resolve_pdf_path(pdf_output, title)[0]
+
+
+def _block_network(route):
+    """只放行本地文件"""
+    if route.request.url.startswith('file:'):
+        return route.continue_()
+    return route.abort()
+
+
+async def _block_network_async(route):
+    """只放行本地文件（异步页面）"""
+    if route.request.url.startswith('file:'):
+        await route.continue_()
+    else:
+        await route.abort()
+
+
+def render_markdown(browser, md_file, pdf_output, images_dir=IMAGES_DIR, print_backend=PDF_PRINT_BACKEND):
+    """
+    在已启动的浏览器中把Markdown文件打印为PDF（不访问网络）
+
+    Args:
+        browser: Playwright同步浏览器对象
+        md_file: Markdown文件路径
+        pdf_output: PDF输出目录或完整路径
+        images_dir: 图片目录
+        print_backend: PDF输出方式（page 或 stream）
+
+    Returns:
+        str: 成功时返回PDF文件路径，失败返回False
+    """
+    html_path, title = write_html(md_file, images_dir)
+    try:
+        output_path = _resolve_output(pdf_output, title)
+        if os.path.exists(output_path):
+            return skip_existing_pdf(output_path)
+
+        start = time.time()
+        context = browser.new_context(**CONTEXT_OPTIONS)
+        try:
+            page = context.new_page()
+            page.route('**/*', _block_network)
+            page.goto(Path(html_path).as_uri(), wait_until='load', timeout=60000)
+            image_status = page.evaluate(IMAGE_STATUS_JS)
+
+            print(f"生成PDF: {output_path}")
+            if print_backend == PRINT_BACKEND_STREAM:
+                print_pdf_streamed(page, output_path)
+            else:
+                page.pdf(path=output_path, **PDF_OPTIONS)
+        finally:
+            context.close()
+    finally:
+        os.remove(html_path)
+
+    print(f"   用时 {time.time() - start:.1f} 秒，本地图片 {image_status['loaded']}/{image_status['total']}")
+    return _finalize(md_file, output_path, title, image_status)
+
+
+async def render_markdown_async(browser, md_file, pdf_output, images_dir=IMAGES_DIR,
+                                print_backend=PDF_PRINT_BACKEND):
+    """
+    在已启动的浏览器中用一个新标签页把Markdown文件打印为PDF（异步版本，见 render_markdown）
+
+    Args:
+        browser: Playwright异步浏览器对象
+        md_file: Markdown文件路径
+        pdf_output: PDF输出目录或完整路径
+        images_dir: 图片目录
+        print_backend: PDF输出方式（page 或 stream）
+
+    Returns:
+        str: 成功时返回PDF文件路径，失败返回False
+    """
+    # 读写文件在线程中进行，不阻塞同一浏览器中的其他标签页
+    html_path, title = await asyncio.to_thread(write_html, md_file, images_dir)
+    try:
+        output_path = _resolve_output(pdf_output, title)
+        if await asyncio.to_thread(os.path.exists, output_path):
+            return await asyncio.to_thread(skip_existing_pdf, output_path)
+
+        start = time.time()
+        context = await browser.new_context(**CONTEXT_OPTIONS)
+        try:
+            page = await context.new_page()
+            await page.route('**/*', _block_network_async)
+            await page.goto(Path(html_path).as_uri(), wait_until='load', timeout=60000)
+            image_status = await page.evaluate(IMAGE_STATUS_JS)
+
+            print(f"生成PDF: {output_path}")
+            if print_backend == PRINT_BACKEND_STREAM:
+                await print_pdf_streamed_async(page, output_path)
+            else:
+                await page.pdf(path=output_path, **PDF_OPTIONS)
+        finally:
+            await context.close()
+    finally:
+        await asyncio.to_thread(os.remove, html_path)
+
+    print(f"   用时 {time.time() - start:.1f} 秒，本地图片 {image_status['loaded']}/{image_status['total']}")
+    return await asyncio.to_thread(_finalize, md_file, output_path, title, image_status)
+
+
+def _finalize(md_file, output_path, title, image_status):
+    """写入文章ID（Markdown中有原文链接时）并检查PDF"""
+    images_loaded = image_status['loaded'] == image_status['total']
+    url = get_url_from_markdown(md_file)
+    if url:
+        return finalize_pdf(url, output_path, title, images_loaded)
+    return output_path if os.path.exists(output_path) else False
+
+
+def convert_md_to_pdf_with_local_images(md_file, pdf_output, images_dir=IMAGES_DIR):
+    """
+    把Markdown文件转换为PDF（启动一个浏览器，只处理这一篇）
+
+    Args:
+        md_file: Markdown文件路径
+        pdf_output: PDF输出目录或完整路径
+        images_dir: 图片目录
+
+    Returns:
+        str: 成功时返回PDF文件路径，失败返回False
+    """
+    try:
+        with load_sync_playwright()() as p:
+            browser = p.chromium.launch(headless=True, args=BROWSER_ARGS)
+            try:
+                return render_markdown(browser, md_file, pdf_output, images_dir)
+            finally:
+                browser.close()
+    except Exception as e:
+        print(f"\n❌ Markdown转PDF失败 {md_file}: {str(e)}")
+        return False
@@ -0,0 +1,283 @@
+"""
+音视频下载模块
+从正文中找出嵌入的视频和音频（<video>/<audio>、微信语音 mpvoice、直接指向媒体文件的 iframe），
+用多个HTTP Range分段并行下载，下载进度记录在 .part.json 中，中断后只下载未完成的分段。
+服务器不支持Range时退回单连接下载。
+"""
+import os
+import re
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import requests
+from bs4 import BeautifulSoup
+from settings import (
+    USER_AGENT, INVALID_CHARS, MEDIA_DIR, MEDIA_TIMEOUT, MEDIA_SEGMENT_SIZE, MEDIA_SEGMENTS, MEDIA_MAX_SIZE
+)
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.http_pool import mount_shared_pool
+
+
+MEDIA_VIDEO = 'video'
+MEDIA_AUDIO = 'audio'
+MEDIA_LABELS = {MEDIA_VIDEO: '视频', MEDIA_AUDIO: '音频'}
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.aac', '.amr', '.ogg', '.wav')
+MEDIA_EXTENSIONS = ('.mp4', '.m4v', '.mov', '.webm') + AUDIO_EXTENSIONS
+# 微信语音的下载地址
+VOICE_URL = 'https://res.wx.qq.com/voice/getvoice?mediaid={}'
+
+
+def _media_type(url, default=MEDIA_VIDEO):
+    """按扩展名区分视频和音频"""
+    ext = os.path.splitext(urlsplit(url).path)[1].lower()
+    return MEDIA_AUDIO if ext in AUDIO_EXTENSIONS else default
+
+
+def _safe_title(title):
+    """文件名中使用的标题（与图片命名一致）"""
+    for char in INVALID_CHARS:
+        title = title.replace(char, '_')
+    return re.sub(r'[_\s]+', '_', title).strip('_')[:50]
+
+
+def mark_media(soup):
+    """
+    把正文中嵌入的音视频替换为链接 <a data-media="video|audio" href="URL">，其余媒体标签保持不变
+
+    在清理 iframe 等标签之前调用，链接会保留到Markdown中（下载后改为本地路径）。
+
+    Args:
+        soup: 正文的BeautifulSoup对象
+
+    Returns:
+        int: 找到的音视频数
+    """
+    found = []
+    for tag in soup.find_all(['video', 'audio']):
+        source = tag.find('source')
+        url = tag.get('src') or tag.get('data-src') or (source and source.get('src'))
+        if url:
+            found.append((tag, url, tag.name, tag.get('title') or ''))
+    for tag in soup.find_all(['mpvoice', 'mp-common-mpaudio']):
+        fileid = tag.get('voice_encode_fileid')
+        if fileid:
+            found.append((tag, VOICE_URL.format(fileid), MEDIA_AUDIO, tag.get('name') or ''))
+    for tag in soup.find_all(['iframe', 'mpvideo']):
+        url = tag.get('data-src') or tag.get('src') or ''
+        # 视频号、腾讯视频等播放页需要执行脚本才能取得地址，只处理直接指向媒体文件的链接
+        if os.path.splitext(urlsplit(url).path)[1].lower() in MEDIA_EXTENSIONS:
+            found.append((tag, url, _media_type(url), tag.get('title') or ''))
+
+    for tag, url, media_type, name in found:
+        if url.startswith('//'):
+            url = 'https:' + url
+        link = soup.new_tag('a', href=url)
+        link['data-media'] = media_type
+        link.string = f"{MEDIA_LABELS[media_type]}: {name}" if name else MEDIA_LABELS[media_type]
+        paragraph = soup.new_tag('p')
+        paragraph.append(link)
+        tag.replace_with(paragraph)
+    return len(found)
+
+
+class MediaDownloader:
+    """音视频分段下载器"""
+
+    def __init__(self, segments=MEDIA_SEGMENTS, segment_size=MEDIA_SEGMENT_SIZE, media_dir=MEDIA_DIR):
+        """
+        初始化下载器
+
+        Args:
+            segments: 同时下载的分段数
+            segment_size: 每段的字节数
+            media_dir: 音视频保存目录
+        """
+        self.segments = max(1, segments)
+        self.segment_size = segment_size
+        self.media_dir = media_dir
+        # 共享连接池（每个主机的连接数 HTTP_POOL_SIZE 应不小于分段数）
+        self.session = mount_shared_pool(requests.Session())
+        self.session.headers.update({'User-Agent': USER_AGENT})
+        os.makedirs(media_dir, exist_ok=True)
+
+    def _probe(self, url, deadline):
+        """
+        请求第一个字节，确认文件大小和是否支持Range
+
+        Returns:
+            tuple: (总字节数, 校验值)，不支持Range或大小未知时总字节数为None
+        """
+        response = self.session.get(url, headers={'Range': 'bytes=0-0'}, stream=True,
+                                    timeout=deadline.timeout(MEDIA_TIMEOUT, '下载音视频'))
+        try:
+            response.raise_for_status()
+            validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+            content_range = response.headers.get('Content-Range', '')
+            if response.status_code != 206 or '/' not in content_range:
+                return None, validator
+            total = content_range.rsplit('/', 1)[1]
+            return (int(total) if total.isdigit() else None), validator
+        finally:
+            response.close()
+
+    def download(self, url, save_path, deadline=None):
+        """
+        下载一个音视频文件（支持Range时分段并行下载，可断点续传）
+
+        Args:
+            url: 媒体URL
+            save_path: 保存路径
+            deadline: 单篇文章的截止时间，为None时不限制
+
+        Returns:
+            bool: 是否成功
+
+        Raises:
+            DeadlineExceeded: 时间预算已用完（已完成的分段保留，下次继续）
+        """
+        deadline = deadline or Deadline(None)
+        if os.path.exists(save_path):
+            return True
+        try:
+            total, validator = self._probe(url, deadline)
+            if total is not None and total > MEDIA_MAX_SIZE:
+                print(f"警告: 音视频过大（{total} 字节），跳过 {url}")
+                return False
+            if total is None:
+                return self._download_single(url, save_path, deadline)
+            return self._download_segments(url, save_path, total, validator, deadline)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            deadline.check('下载音视频')
+            print(f"下载音视频失败 {url}: {str(e)}")
+            return False
+
+    def _download_single(self, url, save_path, deadline):
+        """服务器不支持Range时单连接下载"""
+        part_path = save_path + '.part'
+        size = 0
+        with self.session.get(url, stream=True, timeout=deadline.timeout(MEDIA_TIMEOUT, '下载音视频')) as response:
+            response.raise_for_status()
+            with open(part_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=65536):
+                    deadline.check('下载音视频')
+                    size += len(chunk)
+                    if size > MEDIA_MAX_SIZE:
+                        break
+                    f.write(chunk)
+        if size > MEDIA_MAX_SIZE:
+            os.remove(part_path)
+            print(f"警告: 音视频过大，已中止下载 {url}")
+            return False
+        os.replace(part_path, save_path)
+        return True
+
+    def _download_segments(self, url, save_path, total, validator, deadline):
+        """按Range分段并行下载到 .part 文件，已完成的分段记录在 .part.json 中"""
+        part_path = save_path + '.part'
+        state_path = part_path + '.json'
+        count = max(1, -(-total // self.segment_size))
+        state = {'url': url, 'total': total, 'segment_size': self.segment_size, 'validator': validator, 'done': []}
+        if os.path.exists(part_path) and os.path.exists(state_path):
+            try:
+                with open(state_path, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+                # 文件在服务器上变化过时重新下载
+                if all(saved.get(k) == state[k] for k in ('url', 'total', 'segment_size', 'validator')):
+                    state = saved
+            except ValueError:
+                pass
+        if not state['done'] or not os.path.exists(part_path):
+            state['done'] = []
+            with open(part_path, 'wb') as f:
+                f.truncate(total)
+
+        done = set(state['done'])
+        todo = [i for i in range(count) if i not in done]
+        if done:
+            print(f"  继续下载: 已完成 {len(done)}/{count} 段")
+        lock = threading.Lock()
+
+        def fetch(index):
+            start = index * self.segment_size
+            end = min(total, start + self.segment_size) - 1
+            headers = {'Range': f'bytes={start}-{end}'}
+            if validator:
+                # 文件在下载过程中变化时服务器返回整个文件（200），该段视为失败
+                headers['If-Range'] = validator
+            with self.session.get(url, headers=headers, stream=True,
+                                  timeout=deadline.timeout(MEDIA_TIMEOUT, '下载音视频')) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise ValueError(f"服务器未返回分段（HTTP {response.status_code}）")
+                with open(part_path, 'r+b') as f:
+                    f.seek(start)
+                    written = 0
+                    for chunk in response.iter_content(chunk_size=65536):
+                        deadline.check('下载音视频')
+                        f.write(chunk)
+                        written += len(chunk)
+            if written != end - start + 1:
+                raise ValueError(f"分段 {index} 不完整（{written}/{end - start + 1} 字节）")
+            with lock:
+                done.add(index)
+                state['done'] = sorted(done)
+                tmp_path = state_path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, state_path)
+
+        with ThreadPoolExecutor(max_workers=self.segments) as executor:
+            futures = [executor.submit(fetch, index) for index in todo]
+            errors = []
+            for future in futures:
+                try:
+                    future.result()
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    errors.append(str(e))
+        if errors:
+            print(f"下载音视频失败 {url}: {len(errors)} 段失败（{errors[0]}），已完成的分段下次继续")
+            return False
+        os.replace(part_path, save_path)
+        os.remove(state_path)
+        return True
+
+    def download_media_from_html(self, html_content, article_title, article_index=0, link_prefix='',
+                                 failed=None, deadline=None):
+        """
+        下载 mark_media 标记的音视频，把链接改为本地路径
+
+        Args:
+            html_content: HTML内容
+            article_title: 文章标题（用于命名）
+            article_index: 文章索引
+            link_prefix: 从Markdown所在目录到音视频目录的相对前缀（如 ../media/）
+            failed: 可选列表，下载失败的URL会追加到其中（链接保持远程URL）
+            deadline: 单篇文章的截止时间，为None时不限制
+
+        Returns:
+            tuple: (更新后的HTML内容, 已下载的文件数)
+
+        Raises:
+            DeadlineExceeded: 时间预算已用完
+        """
+        soup = BeautifulSoup(html_content, 'lxml')
+        safe_title = _safe_title(article_title)
+        downloaded = 0
+        for counter, link in enumerate(soup.find_all('a', attrs={'data-media': True}), 1):
+            url = link['href']
+            ext = os.path.splitext(urlsplit(url).path)[1].lower()
+            if ext not in MEDIA_EXTENSIONS:
+                ext = '.mp3' if link['data-media'] == MEDIA_AUDIO else '.mp4'
+            filename = f"{safe_title}_{article_index:03d}_media{counter:02d}{ext}"
+            print(f"  下载{MEDIA_LABELS.get(link['data-media'], '音视频')}: {url}")
+            if self.download(url, os.path.join(self.media_dir, filename), deadline):
+                link['href'] = link_prefix + filename
+                downloaded += 1
+            elif failed is not None:
+                failed.append(url)
+        return str(soup), downloaded
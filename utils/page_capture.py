@@ -0,0 +1,136 @@
+"""
+页面快照模块
+一次页面加载同时输出多种产物：整页截图（PNG）、MHTML快照和渲染后的HTML。
+快照以文章ID命名保存在 SNAPSHOT_DIR 中，之后可以不联网从MHTML快照重新生成PDF。
+"""
+import os
+import re
+import asyncio
+from settings import SNAPSHOT_DIR
+from utils.job_journal import get_article_id
+
+
+CAPTURE_PNG = 'png'
+CAPTURE_MHTML = 'mhtml'
+CAPTURE_HTML = 'html'
+CAPTURE_KINDS = (CAPTURE_PNG, CAPTURE_MHTML, CAPTURE_HTML)
+
+# MHTML头部记录的原始URL
+SNAPSHOT_LOCATION_PATTERN = re.compile(r'^Snapshot-Content-Location:\s*(\S+)', re.MULTILINE)
+
+
+def snapshot_path(url, kind, fallback_name, snapshot_dir=SNAPSHOT_DIR):
+    """
+    获取快照文件路径（优先用文章ID命名）
+
+    Args:
+        url: 文章URL
+        kind: 快照类型（png、mhtml、html）
+        fallback_name: 无法识别文章ID时使用的文件名
+        snapshot_dir: 快照目录
+
+    Returns:
+        str: 快照文件路径
+    """
+    name = get_article_id(url) or fallback_name
+    return os.path.join(snapshot_dir, f"{name}.{kind}")
+
+
+def _write_text(path, text):
+    """原子地写入文本文件"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def capture_artifacts(page, url, capture, fallback_name, artifacts=None, snapshot_dir=SNAPSHOT_DIR):
+    """
+    从已加载的页面输出快照（同步页面）
+
+    Args:
+        page: Playwright同步页面对象
+        url: 文章URL
+        capture: 需要保存的快照类型
+        fallback_name: 无法识别文章ID时使用的文件名
+        artifacts: 接收结果的字典（快照类型 -> 文件路径，html_content -> 渲染后的HTML），可为None
+        snapshot_dir: 快照目录
+    """
+    if not capture and artifacts is None:
+        return
+    html_content = page.content()
+    if artifacts is not None:
+        artifacts['html_content'] = html_content
+    if not capture:
+        return
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    saved = {}
+    if CAPTURE_PNG in capture:
+        saved[CAPTURE_PNG] = snapshot_path(url, CAPTURE_PNG, fallback_name, snapshot_dir)
+        page.screenshot(path=saved[CAPTURE_PNG], full_page=True)
+    if CAPTURE_MHTML in capture:
+        saved[CAPTURE_MHTML] = snapshot_path(url, CAPTURE_MHTML, fallback_name, snapshot_dir)
+        session = page.context.new_cdp_session(page)
+        try:
+            _write_text(saved[CAPTURE_MHTML], session.send('Page.captureSnapshot', {'format': 'mhtml'})['data'])
+        finally:
+            session.detach()
+    if CAPTURE_HTML in capture:
+        saved[CAPTURE_HTML] = snapshot_path(url, CAPTURE_HTML, fallback_name, snapshot_dir)
+        _write_text(saved[CAPTURE_HTML], html_content)
+    _report(saved, artifacts)
+
+
+async def capture_artifacts_async(page, url, capture, fallback_name, artifacts=None, snapshot_dir=SNAPSHOT_DIR):
+    """从已加载的页面输出快照（异步页面，见 capture_artifacts）"""
+    if not capture and artifacts is None:
+        return
+    html_content = await page.content()
+    if artifacts is not None:
+        artifacts['html_content'] = html_content
+    if not capture:
+        return
+
+    # 写文件在线程中进行，不阻塞同一事件循环中的其他标签页
+    await asyncio.to_thread(os.makedirs, snapshot_dir, exist_ok=True)
+    saved = {}
+    if CAPTURE_PNG in capture:
+        saved[CAPTURE_PNG] = snapshot_path(url, CAPTURE_PNG, fallback_name, snapshot_dir)
+        await page.screenshot(path=saved[CAPTURE_PNG], full_page=True)
+    if CAPTURE_MHTML in capture:
+        saved[CAPTURE_MHTML] = snapshot_path(url, CAPTURE_MHTML, fallback_name, snapshot_dir)
+        session = await page.context.new_cdp_session(page)
+        try:
+            snapshot = await session.send('Page.captureSnapshot', {'format': 'mhtml'})
+            await asyncio.to_thread(_write_text, saved[CAPTURE_MHTML], snapshot['data'])
+        finally:
+            await session.detach()
+    if CAPTURE_HTML in capture:
+        saved[CAPTURE_HTML] = snapshot_path(url, CAPTURE_HTML, fallback_name, snapshot_dir)
+        await asyncio.to_thread(_write_text, saved[CAPTURE_HTML], html_content)
+    _report(saved, artifacts)
+
+
+def _report(saved, artifacts):
+    """输出已保存的快照并写入结果字典"""
+    for kind, path in saved.items():
+        print(f"    已保存{kind.upper()}快照: {path}")
+    if artifacts is not None:
+        artifacts.update(saved)
+
+
+def read_snapshot_url(mhtml_path):
+    """
+    读取MHTML快照中记录的原始URL
+
+    Args:
+        mhtml_path: MHTML文件路径
+
+    Returns:
+        str: 原始URL，未找到时返回None
+    """
+    with open(mhtml_path, 'r', encoding='utf-8', errors='replace') as f:
+        header = f.read(4096)
+    match = SNAPSHOT_LOCATION_PATTERN.search(header)
+    return match.group(1) if match else None
@@ -0,0 +1,149 @@
+"""
+PDF元数据模块
+在生成的PDF中写入文章ID，并能在不解析整个文件的情况下读回
+"""
+import os
+import re
+
+
+# 写入PDF Subject字段的前缀，用于识别本工具写入的文章ID
+SUBJECT_PREFIX = 'wechat-article:'
+
+# 读取PDF末尾的字节数（trailer和追加的Info对象都在文件末尾）
+TAIL_SIZE = 8192
+
+
+def sanitize_filename(filename):
+    """清理文件名，移除非法字符"""
+    # 移除Markdown标题标记
+    filename = re.sub(r'^#+\s*', '', filename)  # 移除 # 标题标记
+    filename = filename.strip()
+
+    # 替换非法字符
+    illegal_chars = ['/', '\\', ':', '*', '?', '"', '<', '>', '|']
+    for char in illegal_chars:
+        filename = filename.replace(char, '_')
+
+    # 移除多余的空格和下划线
+    filename = re.sub(r'[\s_]+', '_', filename)
+    filename = filename.strip('_')
+
+    # 限制文件名长度
+    if len(filename) > 200:
+        filename = filename[:200]
+
+    return filename
+
+
+def _pdf_text(value):
+    """将字符串编码为PDF十六进制文本字符串（UTF-16BE，带BOM）"""
+    return '<FEFF' + value.encode('utf-16-be').hex().upper() + '>'
+
+
+def _decode_pdf_text(raw):
+    """解码PDF文本字符串（十六进制或字面量形式）"""
+    raw = raw.strip()
+    if raw.startswith('<'):
+        data = bytes.fromhex(re.sub(r'\s', '', raw[1:-1]))
+        if data.startswith(b'\xfe\xff'):
+            return data[2:].decode('utf-16-be', errors='replace')
+        return data.decode('latin-1')
+    return raw[1:-1].replace('\\(', '(').replace('\\)', ')').replace('\\\\', '\\')
+
+
+def _read_tail(pdf_path):
+    """读取PDF文件末尾的内容"""
+    with open(pdf_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - TAIL_SIZE))
+        return size, f.read().decode('latin-1')
+
+
+def stamp_article_metadata(pdf_path, article_id, title=None, url=None):
+    """
+    以增量更新的方式在PDF的Info字典中写入文章ID
+
+    只追加内容，不改写原有字节。只支持传统xref表（Chromium生成的PDF即为此格式）。
+
+    Args:
+        pdf_path: PDF文件路径
+        article_id: 文章ID
+        title: 文章标题（可选）
+        url: 文章URL（可选）
+
+    Returns:
+        bool: 是否写入成功
+    """
+    try:
+        size, tail = _read_tail(pdf_path)
+        trailer_pos = tail.rfind('trailer')
+        startxref = re.findall(r'startxref\s+(\d+)', tail)
+        if trailer_pos < 0 or not startxref:
+            return False
+        trailer = tail[trailer_pos:]
+        root = re.search(r'/Root\s+(\d+\s+\d+\s+R)', trailer)
+        obj_count = re.search(r'/Size\s+(\d+)', trailer)
+        if not root or not obj_count:
+            return False
+        doc_id = re.search(r'/ID\s*\[[^\]]*\]', trailer)
+
+        info_num = int(obj_count.group(1))
+        fields = [f"/Subject {_pdf_text(SUBJECT_PREFIX + article_id)}"]
+        if title:
+            fields.append(f"/Title {_pdf_text(title)}")
+        if url:
+            fields.append(f"/Keywords {_pdf_text(url)}")
+
+        prefix = '\n' if not tail.endswith('\n') else ''
+        info_offset = size + len(prefix)
+        info_obj = f"{info_num} 0 obj\n<< {' '.join(fields)} >>\nendobj\n"
+        xref_offset = info_offset + len(info_obj)
+        trailer_fields = f"/Size {info_num + 1} /Root {root.group(1)} /Info {info_num} 0 R /Prev {startxref[-1]}"
+        if doc_id:
+            trailer_fields += ' ' + doc_id.group(0)
+        update = (
+            prefix + info_obj
+            + f"xref\n{info_num} 1\n{info_offset:010d} 00000 n \n"
+            + f"trailer\n<< {trailer_fields} >>\nstartxref\n{xref_offset}\n%%EOF\n"
+        )
+
+        with open(pdf_path, 'ab') as f:
+            f.write(update.encode('latin-1'))
+        return True
+    except Exception as e:
+        print(f"    ⚠️  写入PDF元数据失败: {str(e)}")
+        return False
+
+
+def read_article_id(pdf_path):
+    """
+    读取 stamp_article_metadata 写入的文章ID
+
+    只读取文件末尾，与PDF大小无关。
+
+    Args:
+        pdf_path: PDF文件路径
+
+    Returns:
+        str: 文章ID，未写入时返回None
+    """
+    try:
+        _, tail = _read_tail(pdf_path)
+    except OSError:
+        return None
+
+    info_ref = re.findall(r'/Info\s+(\d+)\s+(\d+)\s+R', tail)
+    if not info_ref:
+        return None
+    num, gen = info_ref[-1]
+    obj = re.search(rf'(?<!\d){num}\s+{gen}\s+obj\s*<<(.*?)>>\s*endobj', tail, re.DOTALL)
+    if not obj:
+        return None
+    subject = re.search(r'/Subject\s*(<[0-9A-Fa-f\s]*>|\((?:\\.|[^\\)])*\))', obj.group(1))
+    if not subject:
+        return None
+    value = _decode_pdf_text(subject.group(1))
+    if value.startswith(SUBJECT_PREFIX):
+        return value[len(SUBJECT_PREFIX):]
+    return None
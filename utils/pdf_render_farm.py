@@ -0,0 +1,433 @@
+"""
+多进程PDF渲染模块
+启动K个工作进程，每个进程拥有自己的Chromium，主进程把文章逐个分派给空闲的工作进程渲染。
+每篇文章完成后检查进程（含浏览器子进程）的常驻内存，超过上限时退出并由主进程重新启动，
+渲染失败和进程异常退出都会报告给主进程。
+"""
+import os
+import queue
+import signal
+import threading
+import traceback
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from settings import IMAGES_DIR
+from utils.quarantine import VerificationRequired
+from utils.deadline import DeadlineExceeded
+
+
+# 任务类型：加载文章页面打印，或把本地Markdown离线打印（见 utils.markdown_pdf）
+TASK_ARTICLE = 'article'
+TASK_MARKDOWN = 'markdown'
+
+# 工作进程发给主进程的消息类型
+MSG_STARTED = 'started'
+MSG_FINISHED = 'finished'
+MSG_RECYCLE = 'recycle'
+
+# 工作进程中的异常按类型名在主进程中重建，调度器据此隔离验证页面、按超时失败
+REMOTE_ERRORS = {
+    'VerificationRequired': VerificationRequired,
+    'DeadlineExceeded': DeadlineExceeded,
+}
+
+# 超过文章截止时间后最多再等待工作进程多少秒（工作进程按截止时间自行结束，这里只是兜底）
+RESULT_GRACE = 30
+
+# 连续多少次工作进程异常退出（中间没有完成任何任务）后放弃重启
+MAX_CONSECUTIVE_CRASHES = 3
+
+
+def process_tree_rss(pid):
+    """
+    统计进程及其所有子孙进程的常驻内存（读取 /proc，仅Linux可用）
+
+    Args:
+        pid: 根进程ID
+
+    Returns:
+        int: 常驻内存字节数，无法读取时返回None
+    """
+    if not os.path.isdir('/proc'):
+        return None
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    children = {}
+    rss = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # 进程名可能包含空格和括号，从最后一个右括号之后开始解析
+        fields = stat[stat.rfind(')') + 2:].split()
+        child_pid, parent_pid = int(entry), int(fields[1])
+        children.setdefault(parent_pid, []).append(child_pid)
+        rss[child_pid] = int(fields[21]) * page_size
+
+    if pid not in rss:
+        return None
+    total = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        total += rss.get(current, 0)
+        stack.extend(children.get(current, []))
+    return total
+
+
+def remote_error(error):
+    """
+    把工作进程报告的错误重建为异常
+
+    Args:
+        error: (异常类型名, 错误信息)
+
+    Returns:
+        Exception: VerificationRequired、DeadlineExceeded 保持原类型，其余为 RuntimeError
+    """
+    name, message = error
+    if name in REMOTE_ERRORS:
+        return REMOTE_ERRORS[name](message)
+    return RuntimeError(f"{name}: {message}")
+
+
+def _worker_main(worker_id, tasks, results, max_rss):
+    """
+    工作进程入口：启动浏览器后循环领取任务，内存超限时退出
+
+    Args:
+        worker_id: 工作进程编号
+        tasks: 本进程的任务队列，元素为 (任务ID, 任务类型, URL或Markdown路径, 输出路径, 选项, 截止时间)，None表示退出
+        results: 结果队列，渲染出错时结果中的错误为 (异常类型名, 错误信息)
+        max_rss: 常驻内存上限（字节），0表示不限制
+    """
+    from utils.wechat_to_pdf_perfect import load_sync_playwright, render_article, BROWSER_ARGS
+    from utils.markdown_pdf import render_markdown
+
+    # Ctrl+C 由主进程处理：主进程停止提交新任务并在关闭时发送退出信号
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    pid = os.getpid()
+    playwright = None
+    browser = None
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            job_id, kind, target, output_path, options, deadline = task
+            results.put((MSG_STARTED, worker_id, pid, job_id))
+            pdf_path, error = False, None
+            artifacts = {} if options.get('artifacts') else None
+            try:
+                if browser is None:
+                    if playwright is None:
+                        playwright = load_sync_playwright()().start()
+                    browser = playwright.chromium.launch(headless=True, args=BROWSER_ARGS)
+                if kind == TASK_MARKDOWN:
+                    pdf_path = render_markdown(browser, target, output_path, options['images_dir'])
+                else:
+                    pdf_path = render_article(browser, target, output_path, artifacts=artifacts, deadline=deadline)
+            except Exception as e:
+                # 调用栈只打印在输出中，不写入任务日志
+                if type(e).__name__ not in REMOTE_ERRORS:
+                    traceback.print_exc()
+                error = (type(e).__name__, str(e))
+
+            # 先报告回收再报告完成，主进程不会再给即将退出的进程分派任务
+            rss = process_tree_rss(pid) if max_rss else None
+            recycle = rss is not None and rss > max_rss
+            if recycle:
+                results.put((MSG_RECYCLE, worker_id, pid, rss))
+            results.put((MSG_FINISHED, worker_id, pid, job_id, (pdf_path, artifacts), error))
+            if recycle:
+                break
+    finally:
+        try:
+            if browser is not None:
+                browser.close()
+            if playwright is not None:
+                playwright.stop()
+        except Exception:
+            pass
+
+
+class PdfRenderFarm:
+    """
+    多进程PDF渲染池
+
+    接口与 PdfRenderPool 相同：批量下载的工作线程调用 render() 时阻塞等待结果。
+    主进程把任务逐个分派到空闲工作进程各自的队列，分派时即记录任务所在的进程，
+    进程在任何时刻退出都能找到它手上的任务。
+    """
+
+    def __init__(self, processes, max_rss_mb=0, worker=_worker_main):
+        """
+        初始化渲染池并启动工作进程
+
+        Args:
+            processes: 工作进程数（每个进程一个Chromium）
+            max_rss_mb: 单个工作进程（含浏览器）的常驻内存上限（MB），超过后回收重启，0表示不限制
+            worker: 工作进程入口（参数和消息格式见 _worker_main）
+        """
+        self._worker = worker
+        # 使用spawn，避免在多线程的主进程中fork
+        self._mp = multiprocessing.get_context('spawn')
+        self.processes = max(1, processes)
+        self.max_rss = int(max_rss_mb * 1024 * 1024)
+        self._results = self._mp.Queue()
+        self._lock = threading.Lock()
+        self._futures = {}  # 任务ID -> Future
+        self._pending = deque()  # 等待分派的任务
+        self._task_queues = {}  # 工作进程编号 -> 该进程的任务队列
+        self._idle = set()  # 空闲的工作进程编号
+        self._running = {}  # 工作进程编号 -> 已分派给它的任务
+        self._started = set()  # 已开始渲染的任务ID
+        self._stopping = set()  # 即将退出（内存超限或已发送退出信号）的工作进程编号
+        self._workers = {}  # 工作进程编号 -> Process
+        self._next_job_id = 0
+        self._closing = False
+        self._broken = None  # 工作进程反复启动失败时的错误信息
+        self._crashes = 0
+        self.recycled = 0
+
+        for worker_id in range(self.processes):
+            self._start_worker(worker_id)
+        self._monitor = threading.Thread(target=self._monitor_loop, name='pdf-render-farm', daemon=True)
+        self._monitor.start()
+        print(f"  已启动 {self.processes} 个PDF渲染进程")
+
+    def _start_worker(self, worker_id):
+        """启动（或重启）一个工作进程（调用时需持有锁或尚未启动监视线程）"""
+        tasks = self._mp.Queue()
+        process = self._mp.Process(
+            target=self._worker,
+            args=(worker_id, tasks, self._results, self.max_rss),
+            name=f'pdf-render-{worker_id}',
+            daemon=True,
+        )
+        process.start()
+        self._workers[worker_id] = process
+        self._task_queues[worker_id] = tasks
+        self._idle.add(worker_id)
+
+    def _dispatch(self):
+        """把等待的任务分派给空闲的工作进程，关闭时给空闲进程发送退出信号（调用时需持有锁）"""
+        for worker_id in sorted(self._idle):
+            if self._pending:
+                task = self._pending.popleft()
+                self._idle.discard(worker_id)
+                self._running[worker_id] = task
+                self._task_queues[worker_id].put(task)
+            elif self._closing and worker_id not in self._stopping:
+                self._stopping.add(worker_id)
+                self._task_queues[worker_id].put(None)
+
+    def submit(self, url, output_path, want_artifacts=False, deadline=None):
+        """
+        提交一篇文章
+
+        Args:
+            url: 文章URL
+            output_path: PDF输出目录或路径
+            want_artifacts: 是否返回快照路径和渲染后的HTML
+            deadline: 单篇文章的截止时间（随任务传给工作进程，排队时间也计算在内），为None时不限制
+
+        Returns:
+            Future: 结果为 (PDF文件路径或False, 快照字典或None)；渲染出错时为异常
+        """
+        return self._submit(TASK_ARTICLE, url, output_path, {'artifacts': want_artifacts}, deadline)
+
+    def _submit(self, kind, target, output_path, options, deadline=None):
+        """提交一个任务（参数见 _worker_main 的任务格式）"""
+        future = Future()
+        if self._broken:
+            future.set_exception(RuntimeError(self._broken))
+            return future
+        with self._lock:
+            job_id = self._next_job_id
+            self._next_job_id += 1
+            self._futures[job_id] = future
+            self._pending.append((job_id, kind, target, output_path, options, deadline))
+            self._dispatch()
+        return future
+
+    def render(self, url, output_path, artifacts=None, deadline=None):
+        """
+        渲染一篇文章（阻塞直到完成）
+
+        Args:
+            url: 文章URL
+            output_path: PDF输出目录或路径
+            artifacts: 接收快照路径和渲染后HTML的字典，可为None
+            deadline: 单篇文章的截止时间，为None时不限制；超过截止时间 RESULT_GRACE 秒仍未返回时不再等待
+
+        Returns:
+            str: 成功时返回PDF文件路径，失败返回False
+
+        Raises:
+            VerificationRequired: 页面被验证页面拦截
+            DeadlineExceeded: 时间预算已用完
+            RuntimeError: 工作进程中渲染出错或进程异常退出
+        """
+        future = self.submit(url, output_path, artifacts is not None, deadline)
+        timeout = None
+        if deadline is not None and deadline.expires_at is not None:
+            timeout = deadline.remaining() + RESULT_GRACE
+        try:
+            pdf_path, result_artifacts = future.result(timeout)
+        except FutureTimeoutError:
+            if future.done():
+                # 工作进程报告的 DeadlineExceeded 也是 TimeoutError
+                raise
+            # 工作进程卡在没有超时参数的操作中（如打印PDF），结束该进程，由监视线程重启
+            self._kill_worker_of(future)
+            raise DeadlineExceeded(
+                f"超过单篇文章的时间预算 {deadline.seconds} 秒后 {RESULT_GRACE} 秒PDF渲染进程仍未返回，处理超时"
+            ) from None
+        if artifacts is not None and result_artifacts:
+            artifacts.update(result_artifacts)
+        return pdf_path
+
+    def render_markdown(self, md_file, pdf_output, images_dir=IMAGES_DIR):
+        """
+        在工作进程的浏览器中把本地Markdown文件打印为PDF（阻塞直到完成，不访问网络，见 utils.markdown_pdf）
+
+        Args:
+            md_file: Markdown文件路径
+            pdf_output: PDF输出目录或完整路径
+            images_dir: 图片目录
+
+        Returns:
+            str: 成功时返回PDF文件路径，失败返回False
+        """
+        try:
+            pdf_path, _ = self._submit(TASK_MARKDOWN, md_file, pdf_output, {'images_dir': images_dir}).result()
+            return pdf_path
+        except Exception as e:
+            print(f"\n❌ Markdown转PDF错误 {md_file}: {str(e)}")
+            return False
+
+    def _kill_worker_of(self, future):
+        """结束正在处理该任务的工作进程"""
+        with self._lock:
+            job_ids = [job_id for job_id, f in self._futures.items() if f is future]
+            for worker_id, task in self._running.items():
+                if job_ids and task[0] == job_ids[0]:
+                    print(f"  ⚠️  PDF渲染进程 {self._workers[worker_id].pid} 超过截止时间仍未返回，结束该进程")
+                    self._workers[worker_id].kill()
+
+    def _resolve(self, job_id, result=(False, None), error=None):
+        """把任务结果交给等待的线程（error为异常对象）"""
+        with self._lock:
+            future = self._futures.pop(job_id, None)
+            self._started.discard(job_id)
+        if future is None:
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _handle_message(self, message):
+        """处理工作进程发来的一条消息"""
+        kind, worker_id = message[0], message[1]
+        if kind == MSG_STARTED:
+            with self._lock:
+                self._started.add(message[3])
+        elif kind == MSG_FINISHED:
+            error = message[5]
+            self._resolve(message[3], message[4], remote_error(error) if error else None)
+            with self._lock:
+                self._crashes = 0
+                self._running.pop(worker_id, None)
+                if worker_id not in self._stopping:
+                    self._idle.add(worker_id)
+                self._dispatch()
+        elif kind == MSG_RECYCLE:
+            with self._lock:
+                self._stopping.add(worker_id)
+            self.recycled += 1
+            print(f"  ♻️  PDF渲染进程 {message[2]} 内存 {message[3] / 1024 / 1024:.0f} MB 超过上限，重新启动")
+
+    def _reap(self, worker_id, process):
+        """
+        处理一个已退出的工作进程：已开始渲染的任务报告失败，尚未开始的任务重新排队，然后按需重启
+        """
+        process.join()
+        with self._lock:
+            task = self._running.pop(worker_id, None)
+            self._idle.discard(worker_id)
+            self._stopping.discard(worker_id)
+            tasks = self._task_queues.pop(worker_id)
+            lost = None
+            if task is not None:
+                if task[0] in self._started:
+                    lost = task[0]
+                else:
+                    # 进程在开始渲染前退出（如被系统杀死），任务交给新进程
+                    self._pending.appendleft(task)
+            if process.exitcode != 0:
+                self._crashes += 1
+        tasks.cancel_join_thread()
+        tasks.close()
+        if lost is not None:
+            self._resolve(lost, error=RuntimeError(f"PDF渲染进程异常退出（退出码 {process.exitcode}）"))
+
+        if self._crashes >= MAX_CONSECUTIVE_CRASHES * self.processes and not self._broken:
+            self._broken = f"PDF渲染进程连续 {self._crashes} 次异常退出（退出码 {process.exitcode}），已停止重启"
+            print(f"  ❌ {self._broken}")
+            self._fail_pending(self._broken)
+        with self._lock:
+            if self._broken or (self._closing and not self._pending):
+                del self._workers[worker_id]
+            else:
+                self._start_worker(worker_id)
+            self._dispatch()
+
+    def _monitor_loop(self):
+        """接收工作进程的消息，发现退出的进程时处理其任务并重启"""
+        while True:
+            # 先取完所有消息再检查进程状态，退出的进程发出的消息不会被遗漏
+            messages = []
+            try:
+                messages.append(self._results.get(timeout=1))
+                while True:
+                    messages.append(self._results.get_nowait())
+            except queue.Empty:
+                pass
+            except (EOFError, OSError):
+                break
+
+            for message in messages:
+                self._handle_message(message)
+
+            for worker_id, process in list(self._workers.items()):
+                if not process.is_alive():
+                    self._reap(worker_id, process)
+
+            if (self._closing or self._broken) and not self._workers:
+                break
+
+    def _fail_pending(self, error):
+        """把所有未完成的任务标记为失败"""
+        with self._lock:
+            self._pending.clear()
+            remaining = list(self._futures)
+        for job_id in remaining:
+            self._resolve(job_id, error=RuntimeError(error))
+
+    def close(self):
+        """等待队列中的任务完成后关闭所有工作进程"""
+        with self._lock:
+            if self._closing:
+                return
+            self._closing = True
+            self._dispatch()
+        self._monitor.join()
+        # 仍未完成的任务（如进程全部退出）标记为失败
+        self._fail_pending("PDF渲染进程已关闭")
+        self._results.close()
@@ -0,0 +1,350 @@
+"""
+多标签页PDF渲染模块
+使用 playwright.async_api 在同一个浏览器中同时打开多个标签页，
+每个标签页独立完成 加载 → 懒加载 → 打印。渲染大部分时间在等待网络，
+一个Chromium进程即可同时服务多篇文章，内存远小于启动多个浏览器。
+"""
+import os
+import time
+import asyncio
+import threading
+from settings import IMAGES_DIR, PDF_BLOCK_RESOURCES, PDF_PRINT_BACKEND, PDF_CAPTURE_ARTIFACTS, BROWSER_PROFILE
+from utils import resource_policy, browser_profile
+from utils.page_capture import capture_artifacts_async
+from utils.quarantine import VerificationRequired, is_verification_page
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.pdf_stream import print_pdf_streamed_async
+from utils.wechat_to_pdf_perfect import (
+    BROWSER_ARGS, CONTEXT_OPTIONS, PDF_OPTIONS,
+    IMAGE_STATUS_JS, FORCE_LOAD_IMAGES_JS, HAS_ARTICLE_CONTENT_JS,
+    SCROLL_TO_BOTTOM_JS, SCROLL_TO_TOP_JS, SCROLL_TO_MIDDLE_JS,
+    check_image_status, report_image_timeout,
+    resolve_pdf_path, remove_stale_pdfs, skip_existing_pdf, finalize_pdf, PRINT_BACKEND_STREAM,
+    PRINT_TIMEOUT, EVALUATE_TIMEOUT,
+)
+
+
+def load_async_playwright():
+    """
+    导入 playwright.async_api.async_playwright
+
+    Returns:
+        async_playwright 函数
+    """
+    try:
+        from playwright.async_api import async_playwright
+    except ImportError:
+        raise ImportError(
+            "未安装 playwright，请先运行: python wechat_article_downloader.py install-deps"
+        ) from None
+    return async_playwright
+
+
+async def evaluate(page, script, deadline):
+    """
+    执行页面脚本，不超过 EVALUATE_TIMEOUT 和文章剩余时间（page.evaluate 没有超时参数）
+
+    Args:
+        page: Playwright异步页面对象
+        script: 页面脚本
+        deadline: 单篇文章的截止时间
+
+    Returns:
+        脚本的返回值
+    """
+    return await deadline.wait_async(page.evaluate(script), EVALUATE_TIMEOUT, '执行页面脚本')
+
+
+async def wait_for_all_images_loaded_async(page, max_wait_time=30, show_details=False, deadline=None):
+    """
+    等待所有图片加载完成（异步版本，见 wait_for_all_images_loaded）
+
+    Args:
+        page: Playwright异步页面对象
+        max_wait_time: 最大等待时间（秒）
+        show_details: 是否显示未加载图片的详情
+        deadline: 单篇文章的截止时间，为None时不限制
+    """
+    deadline = deadline or Deadline(None)
+    start_time = time.time()
+    image_status = None
+
+    while time.time() - start_time < max_wait_time:
+        image_status = await evaluate(page, IMAGE_STATUS_JS, deadline)
+        if check_image_status(image_status, time.time() - start_time, show_details):
+            return True
+        await asyncio.sleep(1)
+
+    return report_image_timeout(image_status, show_details)
+
+
+async def render_article_async(browser, url, output_path, block_resources=PDF_BLOCK_RESOURCES,
+                               print_backend=PDF_PRINT_BACKEND, capture=PDF_CAPTURE_ARTIFACTS, artifacts=None,
+                               profile=BROWSER_PROFILE, deadline=None):
+    """
+    在已启动的浏览器中用一个新标签页渲染文章并生成PDF（流程同 render_article）
+
+    Args:
+        browser: Playwright异步浏览器对象
+        url: 文章URL
+        output_path: PDF输出目录或路径
+        block_resources: 是否只放行文档、CSS和正文图片
+        print_backend: PDF输出方式（page 或 stream）
+        capture: 同一次加载中额外保存的快照类型
+        artifacts: 接收快照路径和渲染后HTML的字典，可为None
+        profile: 载入和保存Cookie/本地存储的浏览器配置档，None表示不使用
+        deadline: 单篇文章的截止时间（见 utils.deadline），为None时不限制
+
+    Returns:
+        str: 成功时返回PDF文件路径，失败返回False
+    """
+    deadline = deadline or Deadline(None)
+    context = await browser.new_context(**browser_profile.context_options(CONTEXT_OPTIONS, profile))
+    try:
+        page = await context.new_page()
+        policy = None
+        if block_resources:
+            policy = resource_policy.ResourcePolicy()
+            await resource_policy.install_async(page, policy)
+
+        print(f"  [标签页] 加载页面: {url}")
+        goto_timeout = deadline.timeout_ms(60000, '加载页面')
+        try:
+            await page.goto(url, wait_until='domcontentloaded', timeout=goto_timeout)
+        except Exception as e:
+            print(f"    ⚠️  页面加载警告: {str(e)}")
+        await asyncio.sleep(deadline.timeout(3))
+
+        # 滚动页面以触发懒加载
+        for _ in range(3):
+            await evaluate(page, SCROLL_TO_BOTTOM_JS, deadline)
+            await asyncio.sleep(deadline.timeout(2))
+            await evaluate(page, SCROLL_TO_TOP_JS, deadline)
+            await asyncio.sleep(deadline.timeout(1))
+            await evaluate(page, SCROLL_TO_MIDDLE_JS, deadline)
+            await asyncio.sleep(deadline.timeout(1))
+
+        await evaluate(page, FORCE_LOAD_IMAGES_JS, deadline)
+        if policy:
+            await evaluate(page, resource_policy.REVEAL_CONTENT_JS, deadline)
+        await asyncio.sleep(deadline.timeout(2))
+
+        images_loaded = await wait_for_all_images_loaded_async(
+            page, max_wait_time=deadline.timeout(30, '等待图片'), deadline=deadline
+        )
+        if not images_loaded:
+            for _ in range(2):
+                await evaluate(page, SCROLL_TO_BOTTOM_JS, deadline)
+                await asyncio.sleep(deadline.timeout(2))
+                await evaluate(page, SCROLL_TO_TOP_JS, deadline)
+                await asyncio.sleep(deadline.timeout(1))
+            images_loaded = await wait_for_all_images_loaded_async(
+                page, max_wait_time=deadline.timeout(20, '等待图片'), show_details=True, deadline=deadline
+            )
+
+        if not images_loaded:
+            percentage = (await evaluate(page, IMAGE_STATUS_JS, deadline))['percentage']
+            if percentage >= 70:
+                print(f"    ⚠️  图片加载 {percentage}%，继续处理...")
+                images_loaded = True
+
+        idle_start = time.time()
+        idle_timeout = deadline.timeout_ms(10000, '等待网络空闲')
+        try:
+            await page.wait_for_load_state('networkidle', timeout=idle_timeout)
+        except Exception:
+            pass
+        if policy:
+            print(f"    请求拦截 {url}: {policy.summary()}，等待网络空闲 {time.time() - idle_start:.1f} 秒")
+        await asyncio.sleep(deadline.timeout(3))
+
+        page_title = await page.title()
+        output_path, safe_title = resolve_pdf_path(output_path, page_title)
+        pdf_exists = await asyncio.to_thread(os.path.exists, output_path)
+        if pdf_exists and not capture and artifacts is None:
+            return await asyncio.to_thread(skip_existing_pdf, output_path)
+
+        if not await evaluate(page, HAS_ARTICLE_CONTENT_JS, deadline):
+            screenshot_path = output_path.replace('.pdf', '_screenshot.png')
+            await page.screenshot(path=screenshot_path, full_page=True)
+            if is_verification_page(await page.content()):
+                print(f"    ⚠️  检测到验证页面，已保存截图: {screenshot_path}")
+                raise VerificationRequired(f"检测到验证页面: {url}")
+            print(f"    ⚠️  未检测到文章内容，可能页面未正确加载: {url}")
+            print(f"    已保存截图用于调试: {screenshot_path}")
+            return False
+
+        try:
+            await browser_profile.save_storage_state_async(context, profile)
+        except Exception as e:
+            print(f"    ⚠️  保存浏览器状态失败: {str(e)}")
+
+        await capture_artifacts_async(page, url, capture, safe_title, artifacts)
+        if pdf_exists:
+            return await asyncio.to_thread(skip_existing_pdf, output_path)
+        await asyncio.to_thread(remove_stale_pdfs, output_path, url)
+
+        deadline.check('生成PDF')
+        print(f"\n生成PDF: {output_path}")
+        if print_backend == PRINT_BACKEND_STREAM:
+            printing = print_pdf_streamed_async(page, output_path)
+        else:
+            printing = page.pdf(path=output_path, **PDF_OPTIONS)
+        await deadline.wait_async(printing, PRINT_TIMEOUT, '生成PDF')
+    finally:
+        await context.close()
+
+    # 读写文件在线程中进行，不阻塞其他标签页
+    return await asyncio.to_thread(finalize_pdf, url, output_path, page_title, images_loaded)
+
+
+class AsyncPdfRenderer:
+    """在一个浏览器中用最多 tabs 个标签页并发渲染PDF"""
+
+    def __init__(self, tabs=1):
+        """
+        初始化渲染器
+
+        Args:
+            tabs: 同时打开的标签页数
+        """
+        self.tabs = max(1, tabs)
+        self._semaphore = None
+        self._start_lock = None
+        self._playwright = None
+        self._browser = None
+
+    async def _ensure_browser(self):
+        """第一次渲染时启动浏览器"""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+            self._semaphore = asyncio.Semaphore(self.tabs)
+        async with self._start_lock:
+            if self._browser is None:
+                async_playwright = load_async_playwright()
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=True, args=BROWSER_ARGS)
+                print(f"  已启动浏览器（最多 {self.tabs} 个标签页同时渲染）")
+
+    async def render(self, url, output_path, artifacts=None, deadline=None):
+        """
+        渲染一篇文章，超过标签页数时排队等待
+
+        Args:
+            url: 文章URL
+            output_path: PDF输出目录或路径
+            artifacts: 接收快照路径和渲染后HTML的字典，可为None
+            deadline: 单篇文章的截止时间（排队等待的时间也计算在内），为None时不限制
+
+        Returns:
+            str: 成功时返回PDF文件路径，失败返回False
+        """
+        await self._ensure_browser()
+        async with self._semaphore:
+            try:
+                return await render_article_async(self._browser, url, output_path, artifacts=artifacts,
+                                                  deadline=deadline)
+            except (VerificationRequired, DeadlineExceeded):
+                raise
+            except Exception as e:
+                print(f"\n❌ PDF渲染错误 {url}: {str(e)}")
+                return False
+
+    async def render_markdown(self, md_file, pdf_output, images_dir=IMAGES_DIR):
+        """
+        把本地Markdown文件打印为PDF（不访问网络，见 utils.markdown_pdf）
+
+        Args:
+            md_file: Markdown文件路径
+            pdf_output: PDF输出目录或完整路径
+            images_dir: 图片目录
+
+        Returns:
+            str: 成功时返回PDF文件路径，失败返回False
+        """
+        from utils.markdown_pdf import render_markdown_async
+        await self._ensure_browser()
+        async with self._semaphore:
+            try:
+                return await render_markdown_async(self._browser, md_file, pdf_output, images_dir)
+            except Exception as e:
+                print(f"\n❌ Markdown转PDF错误 {md_file}: {str(e)}")
+                return False
+
+    async def close(self):
+        """关闭浏览器"""
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+class PdfRenderPool:
+    """
+    AsyncPdfRenderer 的同步封装
+
+    事件循环运行在后台线程中，批量下载的工作线程调用 render() 时阻塞等待结果，
+    多个线程同时调用时在同一个浏览器中并发渲染。
+    """
+
+    def __init__(self, tabs=1):
+        """
+        初始化渲染池
+
+        Args:
+            tabs: 同时打开的标签页数
+        """
+        self.renderer = AsyncPdfRenderer(tabs)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='pdf-render-loop', daemon=True)
+        self._thread.start()
+
+    def render(self, url, output_path, artifacts=None, deadline=None):
+        """
+        渲染一篇文章（阻塞直到完成）
+
+        Args:
+            url: 文章URL
+            output_path: PDF输出目录或路径
+            artifacts: 接收快照路径和渲染后HTML的字典，可为None
+            deadline: 单篇文章的截止时间，为None时不限制
+
+        Returns:
+            str: 成功时返回PDF文件路径，失败返回False
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.renderer.render(url, output_path, artifacts, deadline), self._loop
+        )
+        return future.result()
+
+    def render_markdown(self, md_file, pdf_output, images_dir=IMAGES_DIR):
+        """
+        把本地Markdown文件打印为PDF（阻塞直到完成）
+
+        Args:
+            md_file: Markdown文件路径
+            pdf_output: PDF输出目录或完整路径
+            images_dir: 图片目录
+
+        Returns:
+            str: 成功时返回PDF文件路径，失败返回False
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.renderer.render_markdown(md_file, pdf_output, images_dir), self._loop
+        )
+        return future.result()
+
+    def close(self):
+        """关闭浏览器并停止事件循环"""
+        if not self._thread.is_alive():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.renderer.close(), self._loop).result(timeout=30)
+        except Exception as e:
+            print(f"警告: 关闭PDF渲染浏览器失败: {str(e)}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -0,0 +1,112 @@
+"""
+流式PDF输出模块
+通过CDP的 Page.printToPDF（transferMode=ReturnAsStream）分块读取PDF并直接写入临时文件，
+完成后原子地重命名。浏览器和Python端都不需要在内存中保存整个PDF，
+长文章生成几十到上百MB的PDF时内存峰值保持在一个分块的大小。仅支持Chromium。
+"""
+import os
+import asyncio
+import base64
+
+
+# 每次从流中读取的最大字节数
+CHUNK_SIZE = 1024 * 1024
+
+# 与 PDF_OPTIONS 对应的 Page.printToPDF 参数（A4，1cm页边距，尺寸单位为英寸）
+CM_PER_INCH = 2.54
+PRINT_TO_PDF_PARAMS = {
+    'paperWidth': 21.0 / CM_PER_INCH,
+    'paperHeight': 29.7 / CM_PER_INCH,
+    'marginTop': 1 / CM_PER_INCH,
+    'marginRight': 1 / CM_PER_INCH,
+    'marginBottom': 1 / CM_PER_INCH,
+    'marginLeft': 1 / CM_PER_INCH,
+    'printBackground': True,
+    'preferCSSPageSize': False,
+    'scale': 1.0,
+    'transferMode': 'ReturnAsStream',
+}
+
+
+def _decode_chunk(chunk):
+    """把 IO.read 返回的数据解码为字节"""
+    data = chunk.get('data', '')
+    if chunk.get('base64Encoded'):
+        return base64.b64decode(data)
+    return data.encode('utf-8')
+
+
+def print_pdf_streamed(page, output_path, chunk_size=CHUNK_SIZE):
+    """
+    使用CDP流式生成PDF（同步页面）
+
+    Args:
+        page: Playwright同步页面对象（Chromium）
+        output_path: PDF文件路径
+        chunk_size: 每次读取的最大字节数
+
+    Returns:
+        int: 写入的字节数
+    """
+    session = page.context.new_cdp_session(page)
+    tmp_path = output_path + '.part'
+    written = 0
+    try:
+        handle = session.send('Page.printToPDF', PRINT_TO_PDF_PARAMS)['stream']
+        try:
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    chunk = session.send('IO.read', {'handle': handle, 'size': chunk_size})
+                    data = _decode_chunk(chunk)
+                    f.write(data)
+                    written += len(data)
+                    if chunk.get('eof'):
+                        break
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            session.send('IO.close', {'handle': handle})
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        session.detach()
+    return written
+
+
+async def print_pdf_streamed_async(page, output_path, chunk_size=CHUNK_SIZE):
+    """
+    使用CDP流式生成PDF（异步页面，见 print_pdf_streamed）
+
+    Args:
+        page: Playwright异步页面对象（Chromium）
+        output_path: PDF文件路径
+        chunk_size: 每次读取的最大字节数
+
+    Returns:
+        int: 写入的字节数
+    """
+    session = await page.context.new_cdp_session(page)
+    tmp_path = output_path + '.part'
+    written = 0
+    try:
+        handle = (await session.send('Page.printToPDF', PRINT_TO_PDF_PARAMS))['stream']
+        try:
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    chunk = await session.send('IO.read', {'handle': handle, 'size': chunk_size})
+                    data = _decode_chunk(chunk)
+                    f.write(data)
+                    written += len(data)
+                    if chunk.get('eof'):
+                        break
+                f.flush()
+                await asyncio.to_thread(os.fsync, f.fileno())
+        finally:
+            await session.send('IO.close', {'handle': handle})
+        await asyncio.to_thread(os.replace, tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        await session.detach()
+    return written
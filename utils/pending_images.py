@@ -0,0 +1,133 @@
+"""
+延后下载的图片模块
+--images deferred 模式下文章先保存为引用远程图片的Markdown，图片链接记录在待下载列表中；
+hydrate-images 子命令之后再并发下载这些图片，并把Markdown中的链接原地改为本地路径。
+列表为JSON Lines文件，每行一篇文章，同一Markdown以最后一条记录为准。
+"""
+import os
+import re
+import json
+import threading
+from html import escape
+from settings import PENDING_IMAGES_FILE, IMAGES_DIR
+from utils import layout
+
+
+class PendingImages:
+    """待下载图片列表（线程安全）"""
+
+    def __init__(self, path=PENDING_IMAGES_FILE):
+        """
+        初始化待下载列表
+
+        Args:
+            path: 列表文件路径
+        """
+        self.path = path
+        self.entries = {}  # Markdown路径 -> 记录
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 中断时可能留下写了一半的最后一行
+                        continue
+                    if entry.get('md_path'):
+                        self.entries[entry['md_path']] = entry
+        self.entries = {md_path: entry for md_path, entry in self.entries.items() if entry.get('images')}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, md_path, title, article_index, urls):
+        """
+        记录一篇文章中延后下载的图片
+
+        Args:
+            md_path: Markdown文件路径
+            title: 文章标题（下载时用于图片命名）
+            article_index: 文章索引（下载时用于图片命名）
+            urls: 图片URL列表（与Markdown中的链接一致）
+        """
+        entry = {'md_path': md_path, 'title': title, 'article_index': article_index, 'images': list(urls)}
+        with self._lock:
+            self.entries[md_path] = entry
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def update(self, md_path, remaining):
+        """
+        更新一篇文章仍未下载的图片并写回列表文件
+
+        Args:
+            md_path: Markdown文件路径
+            remaining: 仍未下载的图片URL列表，为空时从列表中移除该文章
+        """
+        with self._lock:
+            if remaining:
+                self.entries[md_path] = dict(self.entries[md_path], images=list(remaining))
+            else:
+                self.entries.pop(md_path, None)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.path)
+
+
+def replace_image_links(markdown_content, links):
+    """
+    替换Markdown中的图片链接
+
+    Args:
+        markdown_content: Markdown内容
+        links: 原链接 -> 新链接
+
+    Returns:
+        str: 替换后的Markdown内容
+    """
+    for old, new in links.items():
+        # 只替换 ![...](链接) 中的链接，链接后可能跟着标题
+        markdown_content = re.sub(r'(!\[[^\]]*\]\()' + re.escape(old) + r'(?=[)\s])',
+                                  lambda m: m.group(1) + new, markdown_content)
+    return markdown_content
+
+
+def hydrate_article(image_downloader, entry, images_dir=IMAGES_DIR):
+    """
+    下载一篇文章延后的图片，并把Markdown中的链接原地改为本地路径
+
+    Args:
+        image_downloader: ImageDownloader
+        entry: 待下载列表中的记录
+        images_dir: 图片目录（用于计算Markdown中的相对链接）
+
+    Returns:
+        tuple: (已下载的图片数, 仍未下载的图片URL列表)
+    """
+    md_path = entry['md_path']
+    if not os.path.exists(md_path):
+        print(f"警告: Markdown文件不存在，跳过 {md_path}")
+        return 0, []
+
+    # 复用文章下载时的流程（缓存、图片质量、完整性检查、压缩）
+    html = ''.join(f'<img src="{escape(url)}">' for url in entry['images'])
+    failed = []
+    _, image_map = image_downloader.download_images_from_html(
+        html, entry.get('title', ''), entry.get('article_index', 0), failed=failed
+    )
+    prefix = layout.image_link_prefix(os.path.dirname(md_path), images_dir)
+    links = {url: prefix + image_map[url] for url in entry['images'] if url in image_map}
+    if links:
+        with open(md_path, 'r', encoding='utf-8') as f:
+            markdown_content = f.read()
+        tmp_path = md_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(replace_image_links(markdown_content, links))
+        os.replace(tmp_path, md_path)
+    return len(links), [url for url in entry['images'] if url not in links]
@@ -0,0 +1,196 @@
+"""
+进度发布模块
+下载过程中把各阶段计数、进行中的任务、吞吐量和预计剩余时间原子地写入状态文件
+"""
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+
+# 任务结束状态
+PROGRESS_FINISHED = 'finished'
+PROGRESS_INTERRUPTED = 'interrupted'  # 收到Ctrl+C等信号后停止
+PROGRESS_BUDGET_EXHAUSTED = 'budget_exhausted'  # 整批任务的图片下载量预算用完后停止，可用 --resume 继续
+
+
+class ProgressReporter:
+    """批量任务进度发布器"""
+
+    def __init__(self, status_path, total=0, min_interval=1.0):
+        """
+        初始化进度发布器
+
+        Args:
+            status_path: 状态文件路径
+            total: 本次任务的文章总数
+            min_interval: 两次写入状态文件的最小间隔（秒）
+        """
+        self.status_path = status_path
+        self.total = total
+        self.min_interval = min_interval
+        self.started_at = time.time()
+        self.stage_counts = {}  # 阶段 -> 经过该阶段的文章数
+        self.in_flight = {}  # URL -> {'stage': 阶段, 'since': 开始时间}
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.state = 'running'
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+        status_dir = os.path.dirname(status_path)
+        if status_dir:
+            os.makedirs(status_dir, exist_ok=True)
+
+    def update(self, url, state):
+        """
+        记录文章进入新的阶段
+
+        Args:
+            url: 文章URL
+            state: 阶段名、done 或 failed
+        """
+        with self._lock:
+            self.stage_counts[state] = self.stage_counts.get(state, 0) + 1
+            if state == 'done':
+                self.in_flight.pop(url, None)
+                self.succeeded += 1
+            elif state == 'failed':
+                self.in_flight.pop(url, None)
+                self.failed += 1
+            else:
+                job = self.in_flight.setdefault(url, {'since': time.time()})
+                job['stage'] = state
+        self.write()
+
+    def requeue(self, url):
+        """
+        失败的文章重新排队（如遇到验证页面后进入隔离队列），撤销失败计数
+
+        Args:
+            url: 文章URL
+        """
+        with self._lock:
+            self.failed = max(0, self.failed - 1)
+            self.stage_counts['quarantined'] = self.stage_counts.get('quarantined', 0) + 1
+            self.in_flight[url] = {'stage': 'quarantined', 'since': time.time()}
+        self.write()
+
+    def skip(self, url):
+        """记录跳过的文章"""
+        with self._lock:
+            self.in_flight.pop(url, None)
+            self.skipped += 1
+        self.write()
+
+    def finish(self, state=PROGRESS_FINISHED):
+        """
+        标记任务结束并立即写入状态文件
+
+        Args:
+            state: 结束状态（finished、interrupted 或 budget_exhausted）
+        """
+        with self._lock:
+            self.state = state
+        self.write(force=True)
+
+    def snapshot(self):
+        """
+        生成当前进度快照
+
+        Returns:
+            dict: 进度信息
+        """
+        with self._lock:
+            now = time.time()
+            elapsed = now - self.started_at
+            processed = self.succeeded + self.failed
+            completed = processed + self.skipped
+            rate = processed / elapsed * 60 if elapsed > 0 else 0.0
+            remaining = max(0, self.total - completed)
+            eta = remaining / rate * 60 if rate > 0 else None
+            return {
+                'pid': os.getpid(),
+                'state': self.state,
+                'started_at': datetime.fromtimestamp(self.started_at).isoformat(timespec='seconds'),
+                'updated_at': datetime.fromtimestamp(now).isoformat(timespec='seconds'),
+                'elapsed_seconds': round(elapsed, 1),
+                'total': self.total,
+                'completed': completed,
+                'succeeded': self.succeeded,
+                'failed': self.failed,
+                'skipped': self.skipped,
+                'stages': dict(self.stage_counts),
+                'in_flight': [
+                    {'url': url, 'stage': job.get('stage'), 'seconds': round(now - job['since'], 1)}
+                    for url, job in self.in_flight.items()
+                ],
+                'throughput_per_minute': round(rate, 2),
+                'eta_seconds': round(eta) if eta is not None else None,
+            }
+
+    def write(self, force=False):
+        """
+        原子地写入状态文件（先写临时文件再替换）
+
+        Args:
+            force: 是否忽略最小写入间隔
+        """
+        now = time.time()
+        if not force and now - self._last_write < self.min_interval:
+            return
+        self._last_write = now
+
+        status = self.snapshot()
+        tmp_path = f"{self.status_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(status, f, ensure_ascii=False)
+            os.replace(tmp_path, self.status_path)
+        except OSError as e:
+            print(f"警告: 写入进度文件失败 {self.status_path}: {str(e)}")
+
+
+def read_status(status_path):
+    """
+    读取状态文件
+
+    Args:
+        status_path: 状态文件路径
+
+    Returns:
+        dict: 进度信息，文件不存在或正在替换时返回None
+    """
+    try:
+        with open(status_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def format_status(status):
+    """
+    把进度信息格式化为一行文字
+
+    Args:
+        status: read_status 返回的进度信息
+
+    Returns:
+        str: 进度描述
+    """
+    total = status.get('total') or 0
+    completed = status.get('completed', 0)
+    percentage = completed / total * 100 if total else 0.0
+    eta = status.get('eta_seconds')
+    eta_str = f"{eta // 3600}:{eta % 3600 // 60:02d}:{eta % 60:02d}" if eta is not None else '--'
+    stages = status.get('stages', {})
+    stage_str = ' '.join(f"{name}:{stages[name]}" for name in ('fetched', 'images', 'md', 'pdf', 'quarantined') if name in stages)
+    return (
+        f"[{status.get('updated_at', '')}] {status.get('state', '')} "
+        f"{completed}/{total} ({percentage:.1f}%) | "
+        f"成功 {status.get('succeeded', 0)} 失败 {status.get('failed', 0)} 跳过 {status.get('skipped', 0)} | "
+        f"进行中 {len(status.get('in_flight', []))} | "
+        f"{status.get('throughput_per_minute', 0)} 篇/分钟 | 剩余 {eta_str} | {stage_str}"
+    )
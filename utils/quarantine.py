@@ -0,0 +1,87 @@
+"""
+验证页面隔离模块
+识别微信的环境异常/验证页面；遇到验证的文章放入隔离队列，按指数退避的冷却时间稍后重试，
+批量任务中的其他文章不受影响
+"""
+import time
+import heapq
+import itertools
+from settings import QUARANTINE_BASE_DELAY, QUARANTINE_MAX_DELAY, QUARANTINE_MAX_ATTEMPTS
+
+
+# 验证页面特有的文字（正文中偶尔出现的“验证”二字不算）
+VERIFICATION_MARKERS = ('环境异常', '完成验证')
+
+
+class VerificationRequired(Exception):
+    """页面被微信的环境异常/验证页面拦截"""
+
+
+def is_verification_page(page_content):
+    """判断页面是否是微信的环境异常/验证页面"""
+    return any(marker in page_content for marker in VERIFICATION_MARKERS)
+
+
+class QuarantineQueue:
+    """按冷却时间排序的隔离队列"""
+
+    def __init__(self, base_delay=QUARANTINE_BASE_DELAY, max_delay=QUARANTINE_MAX_DELAY,
+                 max_attempts=QUARANTINE_MAX_ATTEMPTS):
+        """
+        初始化隔离队列
+
+        Args:
+            base_delay: 第一次隔离的冷却时间（秒），之后每次翻倍
+            max_delay: 冷却时间上限（秒）
+            max_attempts: 每篇文章最多隔离的次数，超过后不再重试
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.attempts = {}  # URL -> 已隔离次数
+        self._heap = []  # (可重试时间, 序号, 任务)
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def add(self, url, job):
+        """
+        隔离一个任务
+
+        Args:
+            url: 文章URL
+            job: 重试时重新提交的任务
+
+        Returns:
+            float: 冷却时间（秒），超过最大隔离次数时返回None
+        """
+        attempts = self.attempts.get(url, 0)
+        if attempts >= self.max_attempts:
+            return None
+        self.attempts[url] = attempts + 1
+        delay = min(self.base_delay * (2 ** attempts), self.max_delay)
+        heapq.heappush(self._heap, (time.time() + delay, next(self._counter), job))
+        return delay
+
+    def pop_due(self):
+        """
+        取出一个冷却时间已过的任务
+
+        Returns:
+            任务，没有到期的任务时返回None
+        """
+        if self._heap and self._heap[0][0] <= time.time():
+            return heapq.heappop(self._heap)[2]
+        return None
+
+    def seconds_until_due(self):
+        """
+        距离下一个任务冷却结束的时间
+
+        Returns:
+            float: 秒数，队列为空时返回None
+        """
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - time.time())
@@ -0,0 +1,115 @@
+"""
+PDF渲染请求拦截模块
+生成PDF时只放行文档、CSS和正文图片，拦截统计脚本、评论点赞组件、视频播放器、字体和界面图片等请求，
+用于减少流量、更快到达 networkidle，并降低触发反爬验证的概率。
+统计只记录本次渲染拦截和加载了什么、加载用了多久，不包含与未拦截时对比的节省量（默认关闭，见 PDF_BLOCK_RESOURCES）
+"""
+import time
+from urllib.parse import urlparse
+from settings import PDF_ALLOWED_RESOURCE_TYPES, PDF_ALLOWED_IMAGE_HOSTS
+
+
+# 在拦截脚本后显示正文（微信文章正文默认 visibility: hidden，由页面脚本显示）
+REVEAL_CONTENT_JS = """
+    () => {
+        document.querySelectorAll('#js_content, .rich_media_content').forEach(el => {
+            el.style.visibility = 'visible';
+            el.style.opacity = '1';
+        });
+    }
+"""
+
+
+class ResourcePolicy:
+    """渲染单篇文章时的请求放行策略及统计"""
+
+    def __init__(self, allowed_types=PDF_ALLOWED_RESOURCE_TYPES, allowed_image_hosts=PDF_ALLOWED_IMAGE_HOSTS):
+        """
+        初始化放行策略
+
+        Args:
+            allowed_types: 放行的资源类型（Playwright resource_type）
+            allowed_image_hosts: 放行的图片域名（包括其子域名）
+        """
+        self.allowed_types = set(allowed_types)
+        self.allowed_image_hosts = tuple(allowed_image_hosts)
+        self.allowed = 0
+        self.blocked = {}  # 资源类型 -> 拦截数
+        self.loaded_bytes = 0
+        self.started_at = time.time()  # 安装拦截（开始加载页面）的时间
+
+    def allows(self, resource_type, url):
+        """
+        判断请求是否放行
+
+        Args:
+            resource_type: 资源类型
+            url: 请求URL
+
+        Returns:
+            bool: 放行返回True
+        """
+        if url.startswith(('data:', 'blob:')):
+            return True
+        if resource_type not in self.allowed_types:
+            return False
+        if resource_type == 'image':
+            host = urlparse(url).hostname or ''
+            return any(host == h or host.endswith('.' + h) for h in self.allowed_image_hosts)
+        return True
+
+    def check(self, request):
+        """
+        判断请求是否放行并计数
+
+        Args:
+            request: Playwright请求对象
+
+        Returns:
+            bool: 放行返回True
+        """
+        if self.allows(request.resource_type, request.url):
+            self.allowed += 1
+            return True
+        self.blocked[request.resource_type] = self.blocked.get(request.resource_type, 0) + 1
+        return False
+
+    def on_response(self, response):
+        """按响应头统计已加载的字节数（没有Content-Length的响应不计入）"""
+        try:
+            self.loaded_bytes += int(response.headers.get('content-length', 0))
+        except ValueError:
+            pass
+
+    def summary(self):
+        """
+        生成统计描述
+
+        Returns:
+            str: 拦截/放行请求数、已加载字节数和从开始加载页面到现在的用时
+        """
+        blocked_total = sum(self.blocked.values())
+        detail = ', '.join(f"{name} {count}" for name, count in sorted(self.blocked.items(), key=lambda x: -x[1]))
+        return (
+            f"拦截 {blocked_total} 个请求" + (f"（{detail}）" if detail else "") +
+            f"，放行 {self.allowed} 个，已加载 {self.loaded_bytes / 1024 / 1024:.2f} MB" +
+            f"，加载用时 {time.time() - self.started_at:.1f} 秒"
+        )
+
+
+def install_sync(page, policy):
+    """在同步页面上安装请求拦截"""
+    page.route('**/*', lambda route: route.continue_() if policy.check(route.request) else route.abort())
+    page.on('response', policy.on_response)
+
+
+async def install_async(page, policy):
+    """在异步页面上安装请求拦截"""
+    async def handle(route):
+        if policy.check(route.request):
+            await route.continue_()
+        else:
+            await route.abort()
+
+    await page.route('**/*', handle)
+    page.on('response', policy.on_response)
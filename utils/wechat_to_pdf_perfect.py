@@ -10,35 +10,249 @@ import re
 import time
 import sys
 import glob
+from utils.job_journal import get_article_id
+from utils.pdf_metadata import sanitize_filename, stamp_article_metadata, read_article_id
+from utils import resource_policy
+from utils import page_capture, browser_profile
+from utils.quarantine import VerificationRequired, is_verification_page
+from utils.pdf_stream import print_pdf_streamed
+from utils.deadline import Deadline, DeadlineExceeded
+from settings import PDF_BLOCK_RESOURCES, PDF_PRINT_BACKEND, PDF_CAPTURE_ARTIFACTS, BROWSER_PROFILE
 
-def sanitize_filename(filename):
-    """清理文件名，移除非法字符"""
-    # 移除Markdown标题标记
-    filename = re.sub(r'^#+\s*', '', filename)  # 移除 # 标题标记
-    filename = filename.strip()
-    
-    # 替换非法字符
-    illegal_chars = ['/', '\\', ':', '*', '?', '"', '<', '>', '|']
-    for char in illegal_chars:
-        filename = filename.replace(char, '_')
+
+# 浏览器启动参数
+BROWSER_ARGS = [
+    '--disable-blink-features=AutomationControlled',
+    '--disable-dev-shm-usage',
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+]
+
+# 浏览器上下文参数，模拟真实浏览器
+CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 1080},
+    'user_agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'locale': 'zh-CN',
+    'timezone_id': 'Asia/Shanghai',
+}
+
+# page.pdf 参数
+PDF_OPTIONS = {
+    'format': 'A4',
+    'print_background': True,  # 包含背景图片和颜色
+    'margin': {
+        'top': '1cm',
+        'right': '1cm',
+        'bottom': '1cm',
+        'left': '1cm'
+    },
+    'prefer_css_page_size': False,
+    'scale': 1.0,
+}
+
+# PDF输出方式：page 使用 page.pdf，stream 使用CDP流式输出（见 utils.pdf_stream）
+PRINT_BACKEND_PAGE = 'page'
+PRINT_BACKEND_STREAM = 'stream'
+PRINT_BACKENDS = (PRINT_BACKEND_PAGE, PRINT_BACKEND_STREAM)
+
+# 没有超时参数的浏览器操作（打印PDF、执行页面脚本）在异步页面中的超时时间（秒），同时不超过文章剩余时间
+PRINT_TIMEOUT = 300
+EVALUATE_TIMEOUT = 30
+
+# 检查图片加载状态（排除UI元素的图片）
+IMAGE_STATUS_JS = """
+    () => {
+        const images = Array.from(document.querySelectorAll('img'));
+        if (images.length === 0) return {
+            total: 0, 
+            loaded: 0, 
+            percentage: 100,
+            failed: []
+        };
+        
+        // 过滤掉UI元素的图片（二维码等）
+        const contentImages = images.filter(img => {
+            // 排除二维码图片
+            if (img.className && (
+                img.className.includes('qr_code') || 
+                img.className.includes('qrcode') ||
+                img.id && img.id.includes('qr_code')
+            )) return false;
+            
+            // 排除空src的图片（通常是UI占位符）
+            if (!img.src || img.src.trim() === '') return false;
+            
+            // 排除src是页面URL的图片（通常是跳转二维码）
+            if (img.src.includes('mp.weixin.qq.com/s/') && !img.src.includes('mmbiz') && !img.src.includes('qpic')) return false;
+            
+            return true;
+        });
+        
+        const failed = [];
+        const loaded = contentImages.filter((img, idx) => {
+            // 检查图片是否加载完成
+            if (img.complete && img.naturalHeight !== 0) return true;
+            // 检查是否是data URI（内联图片）
+            if (img.src.startsWith('data:')) return true;
+            
+            // 记录未加载的图片
+            failed.push({
+                index: idx,
+                src: img.src.substring(0, 100),
+                complete: img.complete,
+                naturalHeight: img.naturalHeight,
+                hasDataSrc: img.hasAttribute('data-src')
+            });
+            return false;
+        }).length;
+        
+        return {
+            total: contentImages.length,
+            loaded: loaded,
+            percentage: contentImages.length > 0 ? Math.round((loaded / contentImages.length) * 100) : 100,
+            failed: failed,
+            totalAll: images.length,
+            uiImages: images.length - contentImages.length
+        };
+    }
+"""
+
+# 强制触发所有图片加载
+FORCE_LOAD_IMAGES_JS = """
+    () => {
+        const images = document.querySelectorAll('img');
+        images.forEach(img => {
+            // 移除懒加载属性
+            if (img.hasAttribute('data-src')) {
+                img.src = img.getAttribute('data-src');
+            }
+            if (img.hasAttribute('data-original')) {
+                img.src = img.getAttribute('data-original');
+            }
+            if (img.hasAttribute('data-url')) {
+                img.src = img.getAttribute('data-url');
+            }
+            if (img.hasAttribute('loading')) {
+                img.removeAttribute('loading');
+            }
+            // 强制重新加载
+            if (!img.complete) {
+                const src = img.src;
+                img.src = '';
+                img.src = src;
+            }
+        });
+        
+        // 触发所有图片的load事件
+        images.forEach(img => {
+            if (img.src && !img.complete) {
+                const newImg = new Image();
+                newImg.src = img.src;
+            }
+        });
+    }
+"""
+
+# 检查页面是否真的加载了文章内容（微信公众号文章通常包含特定的class或id）
+HAS_ARTICLE_CONTENT_JS = """
+    () => {
+        // 检查是否有文章内容区域
+        const articleContent = document.querySelector('#js_content') || 
+                             document.querySelector('.rich_media_content') ||
+                             document.querySelector('article');
+        return articleContent !== null && articleContent.textContent.length > 100;
+    }
+"""
+
+# 触发懒加载时的滚动位置
+SCROLL_TO_BOTTOM_JS = "window.scrollTo(0, document.body.scrollHeight)"
+SCROLL_TO_TOP_JS = "window.scrollTo(0, 0)"
+SCROLL_TO_MIDDLE_JS = "window.scrollTo(0, document.body.scrollHeight / 2)"
+
+
+def load_sync_playwright():
+    """
+    导入 playwright.sync_api.sync_playwright
+
+    只在真正生成PDF时导入；未安装时给出安装提示，不在导入阶段自动安装。
+
+    Returns:
+        sync_playwright 函数
+    """
+    try:
+        from playwright.sync_api import sync_playwright
+    except ImportError:
+        raise ImportError(
+            "未安装 playwright，请先运行: python wechat_article_downloader.py install-deps"
+        ) from None
+    return sync_playwright
+
+
+def check_image_status(image_status, elapsed, show_details=False):
+    """
+    根据一次图片加载状态判断是否可以继续处理（同步和异步渲染共用）
+
+    Args:
+        image_status: IMAGE_STATUS_JS 的返回值
+        elapsed: 已等待时间（秒）
+        show_details: 是否显示未加载图片的详情
+
+    Returns:
+        bool: 可以继续处理时返回True，需要继续等待时返回False
+    """
+    total = image_status['total']
+    loaded = image_status['loaded']
+    percentage = image_status['percentage']
+    failed = image_status.get('failed', [])
+    total_all = image_status.get('totalAll', total)
+    ui_images = image_status.get('uiImages', 0)
     
-    # 移除多余的空格和下划线
-    filename = re.sub(r'[\s_]+', '_', filename)
-    filename = filename.strip('_')
+    if total == 0 or loaded == total:
+        if ui_images > 0:
+            print(f"    ✅ 所有文章图片已加载完成 ({loaded}/{total})，已排除 {ui_images} 个UI元素图片")
+        else:
+            print(f"    ✅ 所有图片已加载完成 ({loaded}/{total})")
+        return True
     
-    # 限制文件名长度
-    if len(filename) > 200:
-        filename = filename[:200]
+    if elapsed > 5:  # 5秒后开始显示进度
+        if show_details and failed:
+            print(f"    文章图片加载进度: {loaded}/{total} ({percentage}%) [总图片: {total_all}, UI图片: {ui_images}]")
+            if len(failed) <= 3:
+                print(f"    未加载图片数: {len(failed)}")
+                for f in failed[:3]:
+                    print(f"      - {f['src'][:80]}...")
+        else:
+            print(f"    文章图片加载进度: {loaded}/{total} ({percentage}%)")
     
-    return filename
+    # 如果已经加载了90%以上，或者等待超过15秒且加载了70%以上，就继续处理
+    if percentage >= 90 or (elapsed > 15 and percentage >= 70):
+        print(f"    ✅ 图片加载 {percentage}%，继续处理（已等待 {elapsed:.0f} 秒）")
+        return True
+    return False
 
-try:
-    from playwright.sync_api import sync_playwright
-except ImportError:
-    print("正在安装 playwright...")
-    os.system(f"{sys.executable} -m pip install playwright")
-    os.system(f"{sys.executable} -m playwright install chromium")
-    from playwright.sync_api import sync_playwright
+
+def report_image_timeout(image_status, show_details=False):
+    """
+    等待图片超时后输出结果
+
+    Args:
+        image_status: 最后一次的图片加载状态
+        show_details: 是否显示未加载图片的详情
+
+    Returns:
+        bool: 加载了70%以上时仍返回True
+    """
+    if not image_status:
+        return False
+    failed = image_status.get('failed', [])
+    percentage = image_status['percentage']
+    print(f"    ⚠️  超时，已加载 {image_status['loaded']}/{image_status['total']} 张文章图片 ({percentage}%)")
+    if failed and show_details:
+        print(f"    未加载的图片详情:")
+        for f in failed[:5]:
+            print(f"      - {f['src'][:80]}...")
+    # 即使超时，如果加载了70%以上也返回True
+    return percentage >= 70
 
 
 def wait_for_all_images_loaded(page, max_wait_time=30, show_details=False):
@@ -51,387 +265,290 @@ def wait_for_all_images_loaded(page, max_wait_time=30, show_details=False):
         show_details: 是否显示未加载图片的详情
     """
     start_time = time.time()
+    image_status = None
     
     while time.time() - start_time < max_wait_time:
-        # 检查图片加载状态（排除UI元素的图片）
-        image_status = page.evaluate("""
-            () => {
-                const images = Array.from(document.querySelectorAll('img'));
-                if (images.length === 0) return {
-                    total: 0, 
-                    loaded: 0, 
-                    percentage: 100,
-                    failed: []
-                };
-                
-                // 过滤掉UI元素的图片（二维码等）
-                const contentImages = images.filter(img => {
-                    // 排除二维码图片
-                    if (img.className && (
-                        img.className.includes('qr_code') || 
-                        img.className.includes('qrcode') ||
-                        img.id && img.id.includes('qr_code')
-                    )) return false;
-                    
-                    // 排除空src的图片（通常是UI占位符）
-                    if (!img.src || img.src.trim() === '') return false;
-                    
-                    // 排除src是页面URL的图片（通常是跳转二维码）
-                    if (img.src.includes('mp.weixin.qq.com/s/') && !img.src.includes('mmbiz') && !img.src.includes('qpic')) return false;
-                    
-                    return true;
-                });
-                
-                const failed = [];
-                const loaded = contentImages.filter((img, idx) => {
-                    // 检查图片是否加载完成
-                    if (img.complete && img.naturalHeight !== 0) return true;
-                    // 检查是否是data URI（内联图片）
-                    if (img.src.startsWith('data:')) return true;
-                    
-                    // 记录未加载的图片
-                    failed.push({
-                        index: idx,
-                        src: img.src.substring(0, 100),
-                        complete: img.complete,
-                        naturalHeight: img.naturalHeight,
-                        hasDataSrc: img.hasAttribute('data-src')
-                    });
-                    return false;
-                }).length;
-                
-                return {
-                    total: contentImages.length,
-                    loaded: loaded,
-                    percentage: Math.round((loaded / contentImages.length) * 100),
-                    failed: failed,
-                    totalAll: images.length,
-                    uiImages: images.length - contentImages.length
-                };
-            }
-        """)
+        image_status = page.evaluate(IMAGE_STATUS_JS)
+        if check_image_status(image_status, time.time() - start_time, show_details):
+            return True
+        time.sleep(1)
+    
+    return report_image_timeout(image_status, show_details)
+
+
+def resolve_pdf_path(output_path, page_title):
+    """
+    使用页面标题生成PDF文件路径
+
+    Args:
+        output_path: 输出目录，或完整的PDF路径（只使用其目录）
+        page_title: 页面标题
+
+    Returns:
+        tuple: (PDF文件路径, 清理后的标题)
+    """
+    # 清理标题，生成安全的文件名
+    safe_title = sanitize_filename(page_title)
+    if os.path.isdir(output_path) or not output_path.endswith('.pdf'):
+        output_dir = output_path
+    else:
+        # 如果已经指定了完整路径，使用页面标题更新文件名
+        output_dir = os.path.dirname(output_path)
+    return os.path.join(output_dir, f"{safe_title}.pdf"), safe_title
+
+
+def remove_stale_pdfs(output_path, url):
+    """
+    删除同一篇文章以其他文件名保存的旧PDF（如文章标题修改后重新生成）
+
+    按PDF中写入的文章ID匹配，不按文件名猜测：多个标签页或进程同时向同一目录写入PDF时，
+    不会删除其他文章的PDF（正在生成、尚未写入文章ID的PDF也不会匹配）
+
+    Args:
+        output_path: 新PDF的路径
+        url: 文章URL
+    """
+    article_id = get_article_id(url)
+    if not article_id:
+        return
+    output_dir = os.path.dirname(output_path)
+    for existing_pdf in glob.glob(os.path.join(output_dir, '*.pdf')):
+        if existing_pdf == output_path or read_article_id(existing_pdf) != article_id:
+            continue
+        print(f"  🗑️  删除旧PDF文件: {os.path.basename(existing_pdf)}")
+        try:
+            os.remove(existing_pdf)
+        except OSError as e:
+            print(f"    ⚠️  删除旧PDF文件失败: {str(e)}")
+
+
+def skip_existing_pdf(output_path):
+    """PDF已存在时输出提示并返回其路径"""
+    file_size = os.path.getsize(output_path) / 1024 / 1024
+    print(f"  ⏭️  PDF已存在 ({file_size:.2f} MB)，跳过")
+    return output_path
+
+
+def finalize_pdf(url, output_path, page_title, images_loaded):
+    """
+    验证生成的PDF并写入文章ID
+
+    Args:
+        url: 文章URL
+        output_path: PDF文件路径
+        page_title: 页面标题
+        images_loaded: 图片是否全部加载
+
+    Returns:
+        str: 成功时返回PDF文件路径，失败返回False
+    """
+    if not os.path.exists(output_path):
+        print("\n❌ PDF文件未生成")
+        return False
+    # 写入文章ID，供归档核对使用
+    article_id = get_article_id(url)
+    if article_id:
+        stamp_article_metadata(output_path, article_id, title=page_title, url=url)
+    file_size = os.path.getsize(output_path) / 1024 / 1024  # MB
+    print(f"\n✅ PDF生成成功！")
+    print(f"   文件大小: {file_size:.2f} MB")
+    print(f"   图片加载: {'✅ 全部加载' if images_loaded else '⚠️  部分加载'}")
+    return output_path
+
+
+def render_article(browser, url, output_path, block_resources=PDF_BLOCK_RESOURCES,
+                   print_backend=PDF_PRINT_BACKEND, capture=PDF_CAPTURE_ARTIFACTS, artifacts=None,
+                   profile=BROWSER_PROFILE, deadline=None):
+    """
+    在已启动的浏览器中渲染一篇文章并生成PDF
+
+    每篇文章使用独立的浏览器上下文，结束后关闭。
+
+    Args:
+        browser: Playwright浏览器对象
+        url: 文章URL
+        output_path: PDF输出目录或路径
+        block_resources: 是否只放行文档、CSS和正文图片（见 utils.resource_policy）
+        print_backend: PDF输出方式（page 或 stream）
+        capture: 同一次加载中额外保存的快照类型（png、mhtml、html，见 utils.page_capture）
+        artifacts: 接收快照路径和渲染后HTML（html_content）的字典，可为None
+        profile: 载入和保存Cookie/本地存储的浏览器配置档（见 utils.browser_profile），None表示不使用
+        deadline: 单篇文章的截止时间（见 utils.deadline），各步骤的超时和等待不超过剩余时间，为None时不限制
+
+    Returns:
+        str: 成功时返回PDF文件路径，失败返回False
+
+    Raises:
+        VerificationRequired: 页面被验证页面拦截（不生成PDF）
+        DeadlineExceeded: 时间预算已用完（不生成PDF）
+    """
+    deadline = deadline or Deadline(None)
+    print("[2/5] 创建浏览器上下文...")
+    context = browser.new_context(**browser_profile.context_options(CONTEXT_OPTIONS, profile))
+    try:
+        page = context.new_page()
+        policy = None
+        if block_resources:
+            policy = resource_policy.ResourcePolicy()
+            resource_policy.install_sync(page, policy)
         
-        total = image_status['total']
-        loaded = image_status['loaded']
-        percentage = image_status['percentage']
-        failed = image_status.get('failed', [])
-        total_all = image_status.get('totalAll', total)
-        ui_images = image_status.get('uiImages', 0)
+        # 访问URL
+        print(f"[3/5] 加载页面: {url}")
+        goto_timeout = deadline.timeout_ms(60000, '加载页面')
+        try:
+            page.goto(url, wait_until='domcontentloaded', timeout=goto_timeout)
+        except Exception as e:
+            print(f"    ⚠️  页面加载警告: {str(e)}")
         
-        if total == 0 or loaded == total:
-            if ui_images > 0:
-                print(f"    ✅ 所有文章图片已加载完成 ({loaded}/{total})，已排除 {ui_images} 个UI元素图片")
-            else:
-                print(f"    ✅ 所有图片已加载完成 ({loaded}/{total})")
-            return True
+        # 等待初始内容加载
+        print("    等待初始内容加载...")
+        deadline.sleep(3)
         
-        if time.time() - start_time > 5:  # 5秒后开始显示进度
-            if show_details and failed:
-                print(f"    文章图片加载进度: {loaded}/{total} ({percentage}%) [总图片: {total_all}, UI图片: {ui_images}]")
-                if len(failed) <= 3:
-                    print(f"    未加载图片数: {len(failed)}")
-                    for f in failed[:3]:
-                        print(f"      - {f['src'][:80]}...")
-            else:
-                print(f"    文章图片加载进度: {loaded}/{total} ({percentage}%)")
+        # 滚动页面以触发懒加载
+        print("[4/5] 触发图片懒加载...")
+        scroll_attempts = 3
+        for i in range(scroll_attempts):
+            # 滚动到底部
+            page.evaluate(SCROLL_TO_BOTTOM_JS)
+            deadline.sleep(2)
+            
+            # 滚动回顶部
+            page.evaluate(SCROLL_TO_TOP_JS)
+            deadline.sleep(1)
+            
+            # 滚动到中间
+            page.evaluate(SCROLL_TO_MIDDLE_JS)
+            deadline.sleep(1)
         
-        # 如果已经加载了90%以上，或者等待超过15秒且加载了70%以上，就继续处理
-        elapsed = time.time() - start_time
-        if percentage >= 90 or (elapsed > 15 and percentage >= 70):
-            print(f"    ✅ 图片加载 {percentage}%，继续处理（已等待 {elapsed:.0f} 秒）")
-            return True
+        # 强制触发所有图片加载
+        print("    强制加载所有图片...")
+        page.evaluate(FORCE_LOAD_IMAGES_JS)
+        if policy:
+            page.evaluate(resource_policy.REVEAL_CONTENT_JS)
         
-        time.sleep(1)
+        # 等待一下让图片开始加载
+        deadline.sleep(2)
+        
+        # 等待所有图片加载完成（减少等待时间，避免卡住）
+        print("[5/5] 等待所有图片加载...")
+        images_loaded = wait_for_all_images_loaded(page, max_wait_time=deadline.timeout(30, '等待图片'), show_details=True)
+        
+        # 如果还有图片未加载，再次尝试滚动和等待
+        if not images_loaded:
+            print("    部分图片未加载，再次尝试...")
+            # 再次滚动
+            for _ in range(2):
+                page.evaluate(SCROLL_TO_BOTTOM_JS)
+                deadline.sleep(2)
+                page.evaluate(SCROLL_TO_TOP_JS)
+                deadline.sleep(1)
+            
+            # 再次等待（显示详情）
+            images_loaded = wait_for_all_images_loaded(page, max_wait_time=deadline.timeout(20, '等待图片'), show_details=True)
+        
+        # 即使图片未完全加载，如果加载了70%以上，也继续处理
+        if not images_loaded:
+            percentage = page.evaluate(IMAGE_STATUS_JS)['percentage']
+            if percentage >= 70:
+                print(f"    ⚠️  图片加载 {percentage}%，继续处理...")
+                images_loaded = True
+        
+        # 额外等待网络空闲
+        idle_start = time.time()
+        idle_timeout = deadline.timeout_ms(10000, '等待网络空闲')
+        try:
+            page.wait_for_load_state('networkidle', timeout=idle_timeout)
+        except:
+            pass
+        if policy:
+            print(f"    请求拦截: {policy.summary()}，等待网络空闲 {time.time() - idle_start:.1f} 秒")
+        
+        # 最后等待确保稳定
+        print("    最后等待确保稳定...")
+        deadline.sleep(3)
+        
+        # 检查页面内容
+        page_title = page.title()
+        print(f"\n页面标题: {page_title}")
+        
+        # 使用页面标题生成PDF文件名
+        output_path, safe_title = resolve_pdf_path(output_path, page_title)
+        
+        # 检查文件是否已存在（需要快照时仍继续处理页面）
+        pdf_exists = os.path.exists(output_path)
+        if pdf_exists and not capture and artifacts is None:
+            return skip_existing_pdf(output_path)
+        
+        # 检查页面是否真的加载了文章内容；验证页面不生成PDF，交给调度器稍后重试
+        if not page.evaluate(HAS_ARTICLE_CONTENT_JS):
+            screenshot_path = output_path.replace('.pdf', '_screenshot.png')
+            page.screenshot(path=screenshot_path, full_page=True)
+            if is_verification_page(page.content()):
+                print(f"    ⚠️  检测到验证页面，已保存截图: {screenshot_path}")
+                raise VerificationRequired(f"检测到验证页面: {url}")
+            print("    ⚠️  未检测到文章内容，可能页面未正确加载")
+            print(f"    已保存截图用于调试: {screenshot_path}")
+            return False
+        
+        # 正常打开文章后保存Cookie和本地存储，供之后的上下文复用
+        try:
+            browser_profile.save_storage_state(context, profile)
+        except Exception as e:
+            print(f"    ⚠️  保存浏览器状态失败: {str(e)}")
+        
+        # 同一次加载中保存快照
+        page_capture.capture_artifacts(page, url, capture, safe_title, artifacts)
+        if pdf_exists:
+            return skip_existing_pdf(output_path)
+        remove_stale_pdfs(output_path, url)
+        
+        # 生成PDF
+        deadline.check('生成PDF')
+        print(f"\n生成PDF: {output_path}")
+        if print_backend == PRINT_BACKEND_STREAM:
+            print_pdf_streamed(page, output_path)
+        else:
+            page.pdf(path=output_path, **PDF_OPTIONS)
+    finally:
+        context.close()
     
-    print(f"    ⚠️  超时，已加载 {loaded}/{total} 张文章图片 ({percentage}%)")
-    if failed and show_details:
-        print(f"    未加载的图片详情:")
-        for f in failed[:5]:
-            print(f"      - {f['src'][:80]}...")
-    # 即使超时，如果加载了70%以上也返回True
-    return percentage >= 70
+    return finalize_pdf(url, output_path, page_title, images_loaded)
 
 
-def convert_wechat_article_to_pdf_perfect(url, output_path):
+def convert_wechat_article_to_pdf_perfect(url, output_path, artifacts=None, deadline=None):
     """
     完美转换微信公众号文章为PDF
     
     Args:
         url: 文章URL
         output_path: PDF输出路径
+        artifacts: 接收快照路径和渲染后HTML的字典（见 render_article），可为None
+        deadline: 单篇文章的截止时间，为None时不限制
         
     Returns:
-        bool: 是否成功
+        str: 成功时返回PDF文件路径，失败返回False
+        
+    Raises:
+        VerificationRequired: 页面被验证页面拦截（不生成PDF）
+        DeadlineExceeded: 时间预算已用完
     """
     print(f"\n{'='*60}")
     print(f"转换文章: {url}")
     print(f"{'='*60}")
     
+    sync_playwright = load_sync_playwright()
     try:
         with sync_playwright() as p:
             # 启动浏览器
             print("\n[1/5] 启动浏览器...")
-            browser = p.chromium.launch(
-                headless=True,
-                args=[
-                    '--disable-blink-features=AutomationControlled',
-                    '--disable-dev-shm-usage',
-                    '--no-sandbox',
-                    '--disable-setuid-sandbox',
-                ]
-            )
-            
-            # 创建上下文，模拟真实浏览器
-            print("[2/5] 创建浏览器上下文...")
-            context = browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                locale='zh-CN',
-                timezone_id='Asia/Shanghai',
-            )
-            
-            page = context.new_page()
-            
-            # 访问URL
-            print(f"[3/5] 加载页面: {url}")
-            try:
-                page.goto(url, wait_until='domcontentloaded', timeout=60000)
-            except Exception as e:
-                print(f"    ⚠️  页面加载警告: {str(e)}")
-            
-            # 等待初始内容加载
-            print("    等待初始内容加载...")
-            time.sleep(3)
-            
-            # 滚动页面以触发懒加载
-            print("[4/5] 触发图片懒加载...")
-            scroll_attempts = 3
-            for i in range(scroll_attempts):
-                # 滚动到底部
-                page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                time.sleep(2)
-                
-                # 滚动回顶部
-                page.evaluate("window.scrollTo(0, 0)")
-                time.sleep(1)
-                
-                # 滚动到中间
-                page.evaluate("window.scrollTo(0, document.body.scrollHeight / 2)")
-                time.sleep(1)
-            
-            # 强制触发所有图片加载
-            print("    强制加载所有图片...")
-            page.evaluate("""
-                () => {
-                    const images = document.querySelectorAll('img');
-                    images.forEach(img => {
-                        // 移除懒加载属性
-                        if (img.hasAttribute('data-src')) {
-                            img.src = img.getAttribute('data-src');
-                        }
-                        if (img.hasAttribute('data-original')) {
-                            img.src = img.getAttribute('data-original');
-                        }
-                        if (img.hasAttribute('data-url')) {
-                            img.src = img.getAttribute('data-url');
-                        }
-                        if (img.hasAttribute('loading')) {
-                            img.removeAttribute('loading');
-                        }
-                        // 强制重新加载
-                        if (!img.complete) {
-                            const src = img.src;
-                            img.src = '';
-                            img.src = src;
-                        }
-                    });
-                    
-                    // 触发所有图片的load事件
-                    images.forEach(img => {
-                        if (img.src && !img.complete) {
-                            const newImg = new Image();
-                            newImg.src = img.src;
-                        }
-                    });
-                }
-            """)
-            
-            # 等待一下让图片开始加载
-            time.sleep(2)
-            
-            # 等待所有图片加载完成（减少等待时间，避免卡住）
-            print("[5/5] 等待所有图片加载...")
-            images_loaded = wait_for_all_images_loaded(page, max_wait_time=30, show_details=True)
-            
-            # 如果还有图片未加载，再次尝试滚动和等待
-            if not images_loaded:
-                print("    部分图片未加载，再次尝试...")
-                # 再次滚动
-                for _ in range(2):
-                    page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                    time.sleep(2)
-                    page.evaluate("window.scrollTo(0, 0)")
-                    time.sleep(1)
-                
-                # 再次等待（显示详情）
-                images_loaded = wait_for_all_images_loaded(page, max_wait_time=20, show_details=True)
-            
-            # 即使图片未完全加载，如果加载了80%以上，也继续处理
-            if not images_loaded:
-                image_status = page.evaluate("""
-                    () => {
-                        const images = Array.from(document.querySelectorAll('img'));
-                        const contentImages = images.filter(img => {
-                            if (img.className && (
-                                img.className.includes('qr_code') || 
-                                img.className.includes('qrcode') ||
-                                img.id && img.id.includes('qr_code')
-                            )) return false;
-                            if (!img.src || img.src.trim() === '') return false;
-                            if (img.src.includes('mp.weixin.qq.com/s/') && !img.src.includes('mmbiz') && !img.src.includes('qpic')) return false;
-                            return true;
-                        });
-                        const loaded = contentImages.filter(img => {
-                            return img.complete && (img.naturalHeight !== 0 || img.src.startsWith('data:'));
-                        }).length;
-                        return {
-                            total: contentImages.length,
-                            loaded: loaded,
-                            percentage: contentImages.length > 0 ? Math.round((loaded / contentImages.length) * 100) : 100
-                        };
-                    }
-                """)
-                percentage = image_status['percentage']
-                # 降低阈值到70%，确保能处理更多文章
-                if percentage >= 70:
-                    print(f"    ⚠️  图片加载 {percentage}%，继续处理...")
-                    images_loaded = True
-            
-            # 额外等待网络空闲
+            browser = p.chromium.launch(headless=True, args=BROWSER_ARGS)
             try:
-                page.wait_for_load_state('networkidle', timeout=10000)
-            except:
-                pass
-            
-            # 最后等待确保稳定
-            print("    最后等待确保稳定...")
-            time.sleep(3)
-            
-            # 检查页面内容
-            page_title = page.title()
-            print(f"\n页面标题: {page_title}")
-            
-            # 使用页面标题生成PDF文件名
-            if os.path.isdir(output_path) or not output_path.endswith('.pdf'):
-                # 清理标题，生成安全的文件名
-                safe_title = sanitize_filename(page_title)
-                output_path = os.path.join(output_path, f"{safe_title}.pdf")
-            else:
-                # 如果已经指定了完整路径，使用页面标题更新文件名
-                output_dir = os.path.dirname(output_path)
-                safe_title = sanitize_filename(page_title)
-                output_path = os.path.join(output_dir, f"{safe_title}.pdf")
-            
-            # 检查文件是否已存在（包括检查是否有类似的文件名）
-            if os.path.exists(output_path):
-                file_size = os.path.getsize(output_path) / 1024 / 1024
-                print(f"  ⏭️  PDF已存在 ({file_size:.2f} MB)，跳过")
-                browser.close()
-                return True
-            
-            # 检查是否有基于Markdown文件名的旧PDF文件（避免重复）
-            output_dir = os.path.dirname(output_path)
-            safe_title_clean = safe_title.split('_2026')[0] if '_2026' in safe_title else safe_title
-            existing_pdfs = glob.glob(os.path.join(output_dir, '*.pdf'))
-            for existing_pdf in existing_pdfs:
-                existing_name = os.path.basename(existing_pdf).replace('.pdf', '')
-                existing_clean = existing_name.split('_2026')[0] if '_2026' in existing_name else existing_name
-                # 如果文件名匹配（忽略时间戳），删除旧文件
-                if safe_title_clean == existing_clean or safe_title_clean in existing_clean or existing_clean in safe_title_clean:
-                    if existing_pdf != output_path:
-                        print(f"  🗑️  删除旧PDF文件: {os.path.basename(existing_pdf)}")
-                        try:
-                            os.remove(existing_pdf)
-                        except:
-                            pass
-                        break
-            
-            # 检查是否有验证页面
-            page_content = page.content()
-            has_verification = '环境异常' in page_content or '验证' in page_content or '完成验证' in page_content
-            
-            if has_verification:
-                print("    ⚠️  检测到验证页面！")
-                screenshot_path = output_path.replace('.pdf', '_screenshot.png')
-                page.screenshot(path=screenshot_path, full_page=True)
-                print(f"    已保存截图: {screenshot_path}")
-                
-                # 等待更长时间，看是否能自动通过验证
-                print("    等待验证页面处理（30秒）...")
-                time.sleep(30)
-                
-                # 刷新页面重试
-                print("    刷新页面重试...")
-                page.reload(wait_until='domcontentloaded', timeout=60000)
-                time.sleep(5)
-                
-                # 再次检查
-                page_content = page.content()
-                has_verification = '环境异常' in page_content or '验证' in page_content or '完成验证' in page_content
-                
-                if has_verification:
-                    print("    ⚠️  仍然显示验证页面，但尝试继续生成PDF...")
-                    # 不直接返回False，尝试继续生成PDF（可能内容已经加载）
-            
-            # 检查页面是否真的加载了文章内容
-            # 微信公众号文章通常包含特定的class或id
-            has_article_content = page.evaluate("""
-                () => {
-                    // 检查是否有文章内容区域
-                    const articleContent = document.querySelector('#js_content') || 
-                                         document.querySelector('.rich_media_content') ||
-                                         document.querySelector('article');
-                    return articleContent !== null && articleContent.textContent.length > 100;
-                }
-            """)
-            
-            if not has_article_content:
-                print("    ⚠️  未检测到文章内容，可能页面未正确加载")
-                screenshot_path = output_path.replace('.pdf', '_screenshot.png')
-                page.screenshot(path=screenshot_path, full_page=True)
-                print(f"    已保存截图用于调试: {screenshot_path}")
+                return render_article(browser, url, output_path, artifacts=artifacts, deadline=deadline)
+            finally:
                 browser.close()
-                return False
-            
-            # 生成PDF
-            print(f"\n生成PDF: {output_path}")
-            page.pdf(
-                path=output_path,
-                format='A4',
-                print_background=True,  # 包含背景图片和颜色
-                margin={
-                    'top': '1cm',
-                    'right': '1cm',
-                    'bottom': '1cm',
-                    'left': '1cm'
-                },
-                prefer_css_page_size=False,
-                scale=1.0,
-            )
-            
-            browser.close()
-            
-            # 验证PDF文件
-            if os.path.exists(output_path):
-                file_size = os.path.getsize(output_path) / 1024 / 1024  # MB
-                print(f"\n✅ PDF生成成功！")
-                print(f"   文件大小: {file_size:.2f} MB")
-                print(f"   图片加载: {'✅ 全部加载' if images_loaded else '⚠️  部分加载'}")
-                return True
-            else:
-                print("\n❌ PDF文件未生成")
-                return False
                 
+    except (VerificationRequired, DeadlineExceeded):
+        raise
     except Exception as e:
         print(f"\n❌ 错误: {str(e)}")
         import traceback
@@ -439,6 +556,50 @@ def convert_wechat_article_to_pdf_perfect(url, output_path):
         return False
 
 
+def rerender_from_snapshot(browser, mhtml_path, output_path, print_backend=PDF_PRINT_BACKEND):
+    """
+    不联网，从MHTML快照重新生成PDF
+
+    快照中没有的资源请求一律拦截，页面只使用快照中保存的内容。
+
+    Args:
+        browser: Playwright浏览器对象
+        mhtml_path: MHTML快照路径
+        output_path: PDF输出目录或路径
+        print_backend: PDF输出方式（page 或 stream）
+
+    Returns:
+        str: 成功时返回PDF文件路径，失败返回False
+    """
+    url = page_capture.read_snapshot_url(mhtml_path)
+    context = browser.new_context(**CONTEXT_OPTIONS)
+    try:
+        page = context.new_page()
+        page.route('**/*', lambda route: route.abort())
+        page.goto('file://' + os.path.abspath(mhtml_path), wait_until='load', timeout=60000)
+        page.evaluate(resource_policy.REVEAL_CONTENT_JS)
+        
+        page_title = page.title()
+        output_path, safe_title = resolve_pdf_path(output_path, page_title)
+        if os.path.exists(output_path):
+            return skip_existing_pdf(output_path)
+        if not page.evaluate(HAS_ARTICLE_CONTENT_JS):
+            print(f"    ⚠️  快照中没有文章内容: {mhtml_path}")
+            return False
+        
+        print(f"生成PDF: {output_path}")
+        if print_backend == PRINT_BACKEND_STREAM:
+            print_pdf_streamed(page, output_path)
+        else:
+            page.pdf(path=output_path, **PDF_OPTIONS)
+    finally:
+        context.close()
+    
+    if url:
+        return finalize_pdf(url, output_path, page_title, True)
+    return output_path if os.path.exists(output_path) else False
+
+
 def get_url_from_markdown(md_file_path):
     """从Markdown文件中提取URL"""
     try:
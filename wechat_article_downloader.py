@@ -3,37 +3,190 @@
 """
 微信公众号文章批量下载工具
 主程序
+
+为了让 --help、status 等命令快速启动，requests、bs4、markdownify、openpyxl
+和 Playwright 只在对应阶段第一次用到时才导入。
 """
 import os
 import sys
+import signal
+import json
 import argparse
+import threading
 from datetime import datetime
-from config import MARKDOWN_DIR, PDF_DIR, INVALID_CHARS
-from utils.html_parser import WeChatArticleParser
-from utils.image_downloader import ImageDownloader
-from utils.markdown_converter import MarkdownConverter
+from settings import (
+    MARKDOWN_DIR, IMAGES_DIR, PDF_DIR, INVALID_CHARS,
+    JOURNAL_FILE, STATUS_FILE, MAX_WORKERS, PDF_TABS,
+    PDF_PROCESSES, PDF_PROCESS_MAX_RSS_MB, SINGLE_PAGE_LOAD, SNAPSHOT_DIR, PDF_SOURCE,
+    ARTICLE_DEADLINE, IMAGE_QUALITY, ARTICLE_MAX_BYTES, BATCH_MAX_BYTES, IMAGE_MODE,
+    EXTRACT_MEDIA, MEDIA_DIR
+)
+from utils import job_journal
+from utils.job_journal import JobJournal, classify_error
+from utils.progress import (
+    ProgressReporter, read_status, format_status,
+    PROGRESS_FINISHED, PROGRESS_INTERRUPTED, PROGRESS_BUDGET_EXHAUSTED,
+)
+from utils.quarantine import QuarantineQueue
+from utils.deadline import Deadline
+from utils.byte_budget import ByteBudget, format_bytes
+from utils import layout
+
+
+# 图片下载方式
+IMAGES_EAGER = 'eager'
+IMAGES_DEFERRED = 'deferred'
+IMAGE_MODES = (IMAGES_EAGER, IMAGES_DEFERRED)
 
 
 class WeChatArticleDownloader:
     """微信公众号文章下载器"""
     
-    def __init__(self, download_format='both'):
+    def __init__(self, download_format='both', workers=MAX_WORKERS, journal_path=JOURNAL_FILE,
+                 status_path=STATUS_FILE, pdf_tabs=PDF_TABS, pdf_processes=PDF_PROCESSES,
+                 single_load=SINGLE_PAGE_LOAD, pdf_source=PDF_SOURCE, article_deadline=ARTICLE_DEADLINE,
+                 image_quality=IMAGE_QUALITY, article_max_bytes=ARTICLE_MAX_BYTES,
+                 batch_max_bytes=BATCH_MAX_BYTES, image_mode=IMAGE_MODE, extract_media=EXTRACT_MEDIA):
         """
         初始化下载器
         
         Args:
             download_format: 下载格式，可选 'md'（仅Markdown）、'pdf'（仅PDF）、'both'（两者都下载，默认）
+            workers: 同时处理的文章数
+            journal_path: 任务日志文件路径
+            status_path: 进度文件路径
+            pdf_tabs: 在同一个浏览器中同时渲染PDF的标签页数（1表示每篇文章单独启动浏览器）
+            pdf_processes: PDF渲染进程数（0表示不使用多进程渲染）
+            single_load: 生成PDF时是否用浏览器渲染后的HTML生成Markdown（每篇文章只加载一次页面）
+            pdf_source: PDF来源，page（加载文章页面）或 markdown（用保存的Markdown和本地图片离线生成）
+            article_deadline: 单篇文章所有阶段共用的时间预算（秒），0表示不限制
+            image_quality: 图片质量（original、1080、640、webp）
+            article_max_bytes: 单篇文章的图片下载量上限（字节），0表示不限制
+            batch_max_bytes: 整批任务的图片下载量上限（字节），0表示不限制
+            image_mode: 图片下载方式，eager（处理文章时下载）或 deferred（Markdown先引用远程图片，
+                之后用 hydrate-images 下载）
+            extract_media: 是否下载正文中嵌入的视频、音频（Markdown中链接到本地文件）
         """
-        self.parser = WeChatArticleParser()
-        self.image_downloader = ImageDownloader()
-        self.markdown_converter = MarkdownConverter()
+        self._parser = None
+        self._image_downloader = None
+        self._media_downloader = None
+        self._markdown_converter = None
+        self._init_lock = threading.Lock()
         self.download_format = download_format
+        self.workers = max(1, workers)
+        self.journal = JobJournal(journal_path)
+        self.status_path = status_path
+        self.progress = None
+        self.pdf_tabs = max(1, pdf_tabs)
+        self.pdf_processes = max(0, pdf_processes)
+        self.single_load = single_load
+        self.pdf_source = pdf_source
+        self.article_deadline = article_deadline
+        self.image_quality = image_quality
+        self.article_max_bytes = article_max_bytes
+        # 每次运行任务列表时重新创建；单篇文章的预算挂在它下面
+        self.batch_budget = ByteBudget(batch_max_bytes, '整批任务')
+        self.image_mode = image_mode
+        self.pending_images = None
+        if image_mode == IMAGES_DEFERRED:
+            from utils.pending_images import PendingImages
+            self.pending_images = PendingImages()
+        self.extract_media = extract_media
+        self._pdf_renderer = None
+        self._markdown_renderer = None  # 未启用PDF渲染池时离线Markdown转PDF共用的浏览器
+        self._stop_event = threading.Event()
         
         # 确保输出目录存在
         os.makedirs(MARKDOWN_DIR, exist_ok=True)
         if self.download_format in ('pdf', 'both'):
             os.makedirs(PDF_DIR, exist_ok=True)
     
+    @property
+    def parser(self):
+        """文章解析器（首次使用时才导入requests和bs4）"""
+        if self._parser is None:
+            with self._init_lock:
+                if self._parser is None:
+                    from utils.html_parser import WeChatArticleParser
+                    self._parser = WeChatArticleParser(self.extract_media)
+        return self._parser
+    
+    @property
+    def image_downloader(self):
+        """图片下载器（首次使用时才导入）"""
+        if self._image_downloader is None:
+            with self._init_lock:
+                if self._image_downloader is None:
+                    from utils.image_downloader import ImageDownloader
+                    self._image_downloader = ImageDownloader(self.image_quality)
+        return self._image_downloader
+    
+    @property
+    def media_downloader(self):
+        """音视频下载器（首次使用时才导入）"""
+        if self._media_downloader is None:
+            with self._init_lock:
+                if self._media_downloader is None:
+                    from utils.media_downloader import MediaDownloader
+                    self._media_downloader = MediaDownloader()
+        return self._media_downloader
+    
+    @property
+    def markdown_converter(self):
+        """Markdown转换器（首次使用时才导入markdownify）"""
+        if self._markdown_converter is None:
+            with self._init_lock:
+                if self._markdown_converter is None:
+                    from utils.markdown_converter import MarkdownConverter
+                    self._markdown_converter = MarkdownConverter()
+        return self._markdown_converter
+    
+    @property
+    def pdf_renderer(self):
+        """
+        共享的PDF渲染器（首次生成PDF时启动）
+        
+        pdf_processes大于0时为多进程渲染池，否则pdf_tabs大于1时为单浏览器多标签页渲染池，
+        都不启用时返回None（每篇文章单独启动浏览器）。
+        """
+        if self._pdf_renderer is None and (self.pdf_processes > 0 or self.pdf_tabs > 1):
+            with self._init_lock:
+                if self._pdf_renderer is None:
+                    if self.pdf_processes > 0:
+                        from utils.pdf_render_farm import PdfRenderFarm
+                        self._pdf_renderer = PdfRenderFarm(self.pdf_processes, PDF_PROCESS_MAX_RSS_MB)
+                    else:
+                        from utils.pdf_render_pool import PdfRenderPool
+                        self._pdf_renderer = PdfRenderPool(self.pdf_tabs)
+        return self._pdf_renderer
+    
+    @property
+    def markdown_renderer(self):
+        """
+        离线Markdown转PDF使用的渲染器
+        
+        启用了PDF渲染池（多标签页或多进程）时直接使用；否则启动一个共享浏览器的多标签页渲染池
+        （标签页数与工作线程数相同），离线打印不访问网络，不需要每篇文章单独启动浏览器。
+        """
+        renderer = self.pdf_renderer
+        if renderer is not None:
+            return renderer
+        if self._markdown_renderer is None:
+            with self._init_lock:
+                if self._markdown_renderer is None:
+                    from utils.pdf_render_pool import PdfRenderPool
+                    self._markdown_renderer = PdfRenderPool(self.workers)
+        return self._markdown_renderer
+    
+    def close_pdf_renderer(self):
+        """关闭共享的PDF渲染器"""
+        if self._pdf_renderer is not None:
+            self._pdf_renderer.close()
+            self._pdf_renderer = None
+        if self._markdown_renderer is not None:
+            self._markdown_renderer.close()
+            self._markdown_renderer = None
+    
     def sanitize_filename(self, filename):
         """清理文件名"""
         for char in INVALID_CHARS:
@@ -43,7 +196,7 @@ class WeChatArticleDownloader:
         filename = re.sub(r'[_\s]+', '_', filename)
         return filename.strip('_')
     
-    def save_markdown(self, markdown_content, title, publish_time):
+    def save_markdown(self, markdown_content, title, publish_time, md_dir=MARKDOWN_DIR):
         """
         保存Markdown文件
         
@@ -51,6 +204,7 @@ class WeChatArticleDownloader:
             markdown_content: Markdown内容
             title: 文章标题
             publish_time: 发布时间
+            md_dir: 保存目录（分片布局下为文章所在的分片目录）
         """
         # 清理文件名
         safe_title = self.sanitize_filename(title)
@@ -65,7 +219,8 @@ class WeChatArticleDownloader:
             time_str = datetime.now().strftime('%Y%m%d_%H%M%S')
         
         filename = f"{safe_title}_{time_str}.md"
-        filepath = os.path.join(MARKDOWN_DIR, filename)
+        os.makedirs(md_dir, exist_ok=True)
+        filepath = os.path.join(md_dir, filename)
         
         with open(filepath, 'w', encoding='utf-8') as f:
             f.write(markdown_content)
@@ -93,20 +248,17 @@ class WeChatArticleDownloader:
             return False
         
         # 检查Markdown文件中是否包含这个URL
-        if os.path.exists(MARKDOWN_DIR):
-            for filename in os.listdir(MARKDOWN_DIR):
-                if filename.endswith('.md'):
-                    filepath = os.path.join(MARKDOWN_DIR, filename)
-                    try:
-                        with open(filepath, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                            if article_id in content or url in content:
-                                return True
-                    except:
-                        continue
+        for filepath in layout.iter_files(MARKDOWN_DIR, ('.md',)):
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                    if article_id in content or url in content:
+                        return True
+            except:
+                continue
         return False
     
-    def download_article(self, url, article_index=0, skip_existing=True):
+    def download_article(self, url, article_index=0, skip_existing=True, resume_record=None):
         """
         下载单篇文章
         
@@ -114,6 +266,7 @@ class WeChatArticleDownloader:
             url: 文章URL
             article_index: 文章索引
             skip_existing: 是否跳过已存在的文件（默认True）
+            resume_record: 任务日志中该URL的上次记录（用于从中断的阶段继续）
             
         Returns:
             dict: 下载结果
@@ -128,37 +281,94 @@ class WeChatArticleDownloader:
                 'message': '文件已存在，已跳过'
             }
         
+        # Markdown已保存但PDF未完成时，只需继续PDF阶段
+        if self._can_resume_from_markdown(resume_record):
+            print(f"\n[{article_index + 1}] 继续未完成的PDF: {url}")
+            result = {
+                'success': True,
+                'skipped': False,
+                'title': resume_record.get('title'),
+                'url': url,
+                'md_path': resume_record['md_path'],
+                'images_count': resume_record.get('images_count', 0),
+                'account': resume_record.get('account'),
+                'publish_time': resume_record.get('publish_time')
+            }
+            self._run_pdf_stage(url, result, deadline=Deadline(self.article_deadline))
+            return self._finish_job(url, result)
+        
+        # 各阶段共用的时间预算和图片下载量预算
+        deadline = Deadline(self.article_deadline)
+        budget = ByteBudget(self.article_max_bytes, '单篇文章', parent=self.batch_budget)
+        stage = job_journal.STAGE_QUEUED
+        self._record(url, stage)
         try:
             print(f"\n[{article_index + 1}] 正在处理: {url}")
             
-            # 1. 获取文章HTML
-            print("  获取文章内容...")
-            html_content = self.parser.fetch_article(url)
+            # 1. 获取文章HTML（单次加载模式下直接使用生成PDF时渲染的页面）
+            rendered = None
+            html_content = None
+            if self.single_load and self.pdf_source == 'page' and self.download_format in ('pdf', 'both'):
+                print("  渲染页面（单次加载）...")
+                rendered = self._render_single_load(url, deadline)
+                html_content = rendered.pop('html_content')
+                if not html_content:
+                    print("  ⚠️  未取得渲染后的页面，改为直接请求")
+            if not html_content:
+                print("  获取文章内容...")
+                html_content = self.parser.fetch_article(url, deadline)
             
             # 2. 解析文章
             print("  解析文章信息...")
             article_data = self.parser.parse_article(html_content, url)
             title = article_data['title']
             author = article_data['author']
+            account = article_data.get('account')
             publish_time = article_data['publish_time']
             content_html = article_data['content_html']
             
             print(f"  标题: {title}")
             print(f"  作者: {author}")
             print(f"  时间: {publish_time}")
+            stage = job_journal.STAGE_FETCHED
+            self._record(url, stage, title=title, account=account or author, publish_time=publish_time)
             
-            # 3. 下载图片并更新HTML
-            print("  下载图片...")
-            content_html, image_map = self.image_downloader.download_images_from_html(
-                content_html, title, article_index
-            )
-            print(f"  已下载 {len(image_map)} 张图片")
+            # 3. 下载图片并更新HTML（延后下载时Markdown先引用远程图片）
+            failed_images = []
+            pending_images = []
+            if self.pending_images is not None:
+                content_html, pending_images = self.image_downloader.prepare_deferred(content_html)
+                image_map = {}
+                print(f"  延后下载 {len(pending_images)} 张图片")
+            else:
+                print("  下载图片...")
+                content_html, image_map = self.image_downloader.download_images_from_html(
+                    content_html, title, article_index, failed=failed_images, deadline=deadline, budget=budget
+                )
+                print(f"  已下载 {len(image_map)} 张图片（{format_bytes(budget.used)}）")
+            stage = job_journal.STAGE_IMAGES
+            self._record(url, stage, images_count=len(image_map), images_failed=len(failed_images),
+                         images_bytes=budget.used, images_pending=len(pending_images))
+            
+            md_dir = layout.markdown_dir_for(account or author, publish_time)
+            media_count = 0
+            if self.extract_media:
+                link_prefix = os.path.relpath(MEDIA_DIR, md_dir).replace(os.sep, '/') + '/'
+                content_html, media_count = self.media_downloader.download_media_from_html(
+                    content_html, title, article_index, link_prefix, deadline=deadline
+                )
+                if media_count:
+                    print(f"  已下载 {media_count} 个音视频")
+                    self._record(url, stage, media_count=media_count)
             
             # 4. 转换为Markdown
+            deadline.check('转换Markdown')
             print("  转换为Markdown...")
-            markdown_content = self.markdown_converter.html_to_markdown(content_html)
+            markdown_content = self.markdown_converter.html_to_markdown(
+                content_html, image_prefix=layout.image_link_prefix(md_dir)
+            )
             markdown_content = self.markdown_converter.add_metadata(
-                markdown_content, title, author, publish_time, url
+                markdown_content, title, author, publish_time, url, account=account
             )
             
             result = {
@@ -166,44 +376,181 @@ class WeChatArticleDownloader:
                 'skipped': False,
                 'title': title,
                 'url': url,
-                'images_count': len(image_map)
+                'account': account or author,
+                'publish_time': publish_time,
+                'images_count': len(image_map),
+                'images_failed': len(failed_images),
+                'images_bytes': budget.used,
+                'media_count': media_count
             }
             
             # 5. 根据用户选择保存文件
             if self.download_format in ('md', 'both'):
                 print("  保存Markdown文件...")
-                md_path = self.save_markdown(markdown_content, title, publish_time)
+                md_path = self.save_markdown(markdown_content, title, publish_time, md_dir)
                 print(f"  ✓ Markdown已保存: {md_path}")
                 result['md_path'] = md_path
+                if pending_images:
+                    self.pending_images.add(md_path, title, article_index, pending_images)
+                stage = job_journal.STAGE_MD
+                self._record(url, stage, md_path=md_path)
             
             if self.download_format in ('pdf', 'both'):
-                print("  生成PDF文件...")
-                try:
-                    from utils.wechat_to_pdf_perfect import convert_wechat_article_to_pdf_perfect
-                    pdf_path = convert_wechat_article_to_pdf_perfect(url, PDF_DIR)
-                    if pdf_path:
-                        print(f"  ✓ PDF已保存: {pdf_path}")
-                        result['pdf_path'] = pdf_path
-                except Exception as pdf_error:
-                    print(f"  ⚠️  PDF生成失败: {str(pdf_error)}")
-                    result['pdf_error'] = str(pdf_error)
+                self._run_pdf_stage(url, result, rendered, deadline)
             
-            return result
+            return self._finish_job(url, result)
             
         except Exception as e:
             print(f"  ✗ 处理失败: {str(e)}")
+            error_class = classify_error(e)
+            self._record(url, job_journal.STATE_FAILED, failed_stage=stage,
+                         error_class=error_class, error=str(e))
             return {
                 'success': False,
                 'url': url,
-                'error': str(e)
+                'error': str(e),
+                'error_class': error_class
             }
     
-    def download_from_file(self, file_path):
+    def _record(self, url, state, **fields):
+        """把状态变更写入任务日志，并同步到进度文件"""
+        self.journal.record(url, state, **fields)
+        if self.progress is not None:
+            self.progress.update(url, state)
+    
+    def _can_resume_from_markdown(self, record):
+        """上次记录是否停在Markdown已保存、PDF未完成的阶段"""
+        if not record or self.download_format not in ('pdf', 'both'):
+            return False
+        stopped_at = record.get('state')
+        if stopped_at == job_journal.STATE_FAILED:
+            stopped_at = record.get('failed_stage')
+        if stopped_at not in (job_journal.STAGE_MD, job_journal.STAGE_PDF):
+            return False
+        md_path = record.get('md_path')
+        return bool(md_path) and os.path.exists(md_path)
+    
+    def _render_pdf(self, url, pdf_dir, artifacts=None, deadline=None):
+        """
+        使用配置的渲染方式生成PDF
+        
+        Args:
+            url: 文章URL
+            pdf_dir: PDF输出目录
+            artifacts: 接收快照路径和渲染后HTML的字典，可为None
+            deadline: 单篇文章的截止时间，为None时不限制
+            
+        Returns:
+            str: 成功时返回PDF文件路径，失败返回False
+        """
+        renderer = self.pdf_renderer
+        if renderer is not None:
+            return renderer.render(url, pdf_dir, artifacts, deadline)
+        from utils.wechat_to_pdf_perfect import convert_wechat_article_to_pdf_perfect
+        return convert_wechat_article_to_pdf_perfect(url, pdf_dir, artifacts, deadline)
+    
+    def _render_markdown_pdf(self, md_path, pdf_dir):
+        """
+        用保存的Markdown和本地图片离线生成PDF（不访问网络）
+        
+        在共享的浏览器中打印（多标签页渲染池、多进程渲染池的工作进程，或只用于离线打印的渲染池，
+        见 markdown_renderer），不会每篇文章启动一个浏览器。
+        
+        Args:
+            md_path: Markdown文件路径
+            pdf_dir: PDF输出目录
+            
+        Returns:
+            str: 成功时返回PDF文件路径，失败返回False
+        """
+        return self.markdown_renderer.render_markdown(md_path, pdf_dir)
+    
+    def _render_single_load(self, url, deadline=None):
+        """
+        单次加载模式：先渲染页面生成PDF，同时取回渲染后的HTML供生成Markdown
+        
+        此时还不知道文章的公众号和发布时间，PDF先生成在PDF根目录，之后再移动到布局对应的目录。
+        
+        Args:
+            url: 文章URL
+            deadline: 单篇文章的截止时间，为None时不限制
+            
+        Returns:
+            dict: pdf_path、pdf_error、html_content
+        """
+        artifacts = {}
+        rendered = {'pdf_path': False, 'pdf_error': None}
+        try:
+            rendered['pdf_path'] = self._render_pdf(url, PDF_DIR, artifacts, deadline)
+            if not rendered['pdf_path']:
+                rendered['pdf_error'] = 'PDF生成失败'
+        except Exception as pdf_error:
+            rendered['pdf_error'] = str(pdf_error)
+        rendered['html_content'] = artifacts.get('html_content')
+        return rendered
+    
+    def _run_pdf_stage(self, url, result, rendered=None, deadline=None):
+        """
+        生成PDF，并把结果写入result
+        
+        Args:
+            url: 文章URL
+            result: 下载结果字典
+            rendered: 单次加载模式下已生成的PDF（_render_single_load 的返回值），为None时现在生成
+            deadline: 单篇文章的截止时间，为None时不限制
+        """
+        print("  生成PDF文件...")
+        self._record(url, job_journal.STAGE_PDF)
+        try:
+            pdf_dir = layout.pdf_dir_for(result.get('account'), result.get('publish_time'))
+            os.makedirs(pdf_dir, exist_ok=True)
+            if rendered is None and self.pdf_source == 'markdown' and result.get('md_path'):
+                pdf_path = self._render_markdown_pdf(result['md_path'], pdf_dir)
+            elif rendered is None:
+                pdf_path = self._render_pdf(url, pdf_dir, deadline=deadline)
+            elif rendered['pdf_error']:
+                raise RuntimeError(rendered['pdf_error'])
+            else:
+                pdf_path = rendered['pdf_path']
+                target = os.path.join(pdf_dir, os.path.basename(pdf_path))
+                if os.path.abspath(target) != os.path.abspath(pdf_path):
+                    os.replace(pdf_path, target)
+                    pdf_path = target
+            if pdf_path:
+                print(f"  ✓ PDF已保存: {pdf_path}")
+                result['pdf_path'] = pdf_path
+            else:
+                result['pdf_error'] = 'PDF生成失败'
+        except Exception as pdf_error:
+            print(f"  ⚠️  PDF生成失败: {str(pdf_error)}")
+            result['pdf_error'] = str(pdf_error)
+            # 按异常类型分类（验证页面、超时），不依赖错误信息的文字
+            result['pdf_error_class'] = classify_error(pdf_error)
+    
+    def _finish_job(self, url, result):
+        """根据下载结果写入任务的最终状态"""
+        if result.get('pdf_error'):
+            error_class = result.get('pdf_error_class') or classify_error(result['pdf_error'])
+            if error_class == job_journal.ERROR_UNKNOWN:
+                error_class = job_journal.ERROR_MISSING_PDF
+            result['error_class'] = error_class
+            self._record(url, job_journal.STATE_FAILED, failed_stage=job_journal.STAGE_PDF,
+                         error_class=error_class, error=result['pdf_error'])
+        elif result.get('images_failed'):
+            self._record(url, job_journal.STATE_FAILED, failed_stage=job_journal.STAGE_IMAGES,
+                         error_class=job_journal.ERROR_PARTIAL_IMAGES,
+                         error=f"{result['images_failed']} 张图片下载失败")
+        else:
+            self._record(url, job_journal.STATE_DONE)
+        return result
+    
+    def download_from_file(self, file_path, resume=False):
         """
         从文件读取URL列表并批量下载
         
         Args:
             file_path: URL列表文件路径（每行一个URL）
+            resume: 是否根据任务日志从上次中断处继续
         """
         if not os.path.exists(file_path):
             print(f"错误: 文件不存在 {file_path}")
@@ -224,27 +571,15 @@ class WeChatArticleDownloader:
         print(f"找到 {len(urls)} 篇文章，开始下载...")
         print("=" * 60)
         
-        # 统计已存在的文件
-        skipped_count = 0
-        results = []
-        for i, url in enumerate(urls):
-            result = self.download_article(url, i, skip_existing=True)
-            results.append(result)
-            if result.get('skipped'):
-                skipped_count += 1
-        
-        if skipped_count > 0:
-            print(f"\n已跳过 {skipped_count} 篇已存在的文章")
-        
-        # 打印统计信息
-        self._print_summary(results)
+        self._run_batch(urls, resume=resume)
     
-    def download_from_urls(self, urls):
+    def download_from_urls(self, urls, resume=False):
         """
         从URL列表批量下载
         
         Args:
             urls: URL列表
+            resume: 是否根据任务日志从上次中断处继续
         """
         if not urls:
             print("错误: URL列表为空")
@@ -253,20 +588,211 @@ class WeChatArticleDownloader:
         print(f"开始下载 {len(urls)} 篇文章...")
         print("=" * 60)
         
-        skipped_count = 0
-        results = []
+        self._run_batch(urls, resume=resume)
+    
+    def _run_batch(self, urls, resume=False):
+        """
+        批量处理URL列表
+        
+        Args:
+            urls: URL列表
+            resume: 是否根据任务日志从上次中断处继续（跳过已处于终态的文章，不再扫描Markdown目录）
+        """
+        jobs = []
+        resumed_count = 0
         for i, url in enumerate(urls):
-            result = self.download_article(url, i, skip_existing=True)
-            results.append(result)
-            if result.get('skipped'):
-                skipped_count += 1
+            record = self.journal.get(url) if resume else None
+            if record and record.get('state') in job_journal.TERMINAL_STATES:
+                resumed_count += 1
+                continue
+            jobs.append((i, url, record))
+        
+        if resume:
+            print(f"根据任务日志跳过 {resumed_count} 篇已处理的文章，剩余 {len(jobs)} 篇")
+        
+        results = self._run_jobs(jobs, skip_existing=not resume)
         
+        skipped_count = sum(1 for r in results if r.get('skipped'))
         if skipped_count > 0:
             print(f"\n已跳过 {skipped_count} 篇已存在的文章")
         
         # 打印统计信息
         self._print_summary(results)
     
+    def _run_jobs(self, jobs, skip_existing=True):
+        """
+        使用线程池处理任务列表
+        
+        收到SIGINT/SIGTERM后不再提交新任务，等待进行中的文章处理完毕并刷写任务日志。
+        遇到验证页面的文章放入隔离队列，冷却后重新提交，其余文章照常处理。
+        
+        Args:
+            jobs: (文章索引, URL, 任务日志记录) 列表
+            skip_existing: 是否跳过已存在的文件
+            
+        Returns:
+            list: 已完成任务的下载结果
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        
+        results = []
+        quarantine = QuarantineQueue()
+        self.batch_budget = ByteBudget(self.batch_budget.limit, self.batch_budget.name)
+        self.progress = ProgressReporter(self.status_path, total=len(jobs))
+        self.progress.write(force=True)
+        previous_handlers = self._install_signal_handlers()
+        budget_exhausted = False  # 因整批任务的下载量预算用完而停止（区别于Ctrl+C中断）
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                pending = {}  # Future -> 任务
+                job_iter = iter(jobs)
+                while True:
+                    # 控制进行中的任务数，便于收到信号后尽快停止；冷却结束的隔离任务优先
+                    while not self._stop_event.is_set() and len(pending) < self.workers:
+                        job = quarantine.pop_due() or next(job_iter, None)
+                        if job is None:
+                            break
+                        i, url, record = job
+                        retrying = url in quarantine.attempts
+                        future = executor.submit(
+                            self.download_article, url, i,
+                            skip_existing=skip_existing and not retrying, resume_record=record
+                        )
+                        pending[future] = job
+                    if not pending:
+                        if len(quarantine) and not self._stop_event.is_set():
+                            # 只剩隔离中的文章，等到下一篇冷却结束
+                            self._stop_event.wait(quarantine.seconds_until_due())
+                            continue
+                        break
+                    done, _ = wait(pending, timeout=quarantine.seconds_until_due(),
+                                   return_when=FIRST_COMPLETED)
+                    for future in done:
+                        i, url, _ = pending.pop(future)
+                        result = future.result()
+                        if result.get('skipped'):
+                            self.progress.skip(result['url'])
+                        if self.batch_budget.exhausted() and not self._stop_event.is_set():
+                            # 进行中的文章继续处理（不再下载图片），剩余文章留给 --resume
+                            print(f"\n整批任务的图片下载量已达到上限 {format_bytes(self.batch_budget.limit)}，"
+                                  "不再开始新的文章")
+                            budget_exhausted = True
+                            self._stop_event.set()
+                        if self._quarantine(quarantine, i, url, result):
+                            continue
+                        results.append(result)
+        finally:
+            self._restore_signal_handlers(previous_handlers)
+            self.close_pdf_renderer()
+            if self._image_downloader is not None:
+                self._image_downloader.close()
+            self.journal.flush()
+            if budget_exhausted:
+                self.progress.finish(PROGRESS_BUDGET_EXHAUSTED)
+            else:
+                self.progress.finish(PROGRESS_INTERRUPTED if self._stop_event.is_set() else PROGRESS_FINISHED)
+        
+        if self._stop_event.is_set():
+            if budget_exhausted:
+                print(f"\n图片下载量已达到整批任务的上限，任务日志已保存: {self.journal.journal_path}")
+            else:
+                print(f"\n已中断，任务日志已保存: {self.journal.journal_path}")
+            if len(quarantine):
+                print(f"仍有 {len(quarantine)} 篇遇到验证的文章在隔离队列中")
+            print("使用 --resume 参数可从中断处继续")
+        
+        return results
+    
+    def _quarantine(self, quarantine, article_index, url, result):
+        """
+        遇到验证页面的文章放入隔离队列
+        
+        Args:
+            quarantine: 隔离队列
+            article_index: 文章索引
+            url: 文章URL
+            result: 下载结果
+            
+        Returns:
+            bool: 已隔离返回True；不是验证失败、已超过隔离次数或正在停止时返回False
+        """
+        if result.get('error_class') != job_journal.ERROR_VERIFICATION or self._stop_event.is_set():
+            return False
+        # 保留失败时的记录，重试时可以只重新生成PDF
+        record = self.journal.get(url)
+        delay = quarantine.add(url, (article_index, url, record))
+        if delay is None:
+            print(f"  ✗ 已隔离 {quarantine.max_attempts} 次仍遇到验证，放弃: {url}")
+            return False
+        attempt = quarantine.attempts[url]
+        print(f"  ⏸️  遇到验证页面，隔离 {delay:.0f} 秒后重试（第 {attempt} 次）: {url}")
+        self.progress.requeue(url)
+        self.journal.record(url, job_journal.STAGE_QUARANTINED, attempts=attempt,
+                            retry_after=round(delay))
+        return True
+    
+    def retry_failed(self, error_classes=None, dry_run=False):
+        """
+        根据任务日志中记录的失败分类重新处理失败的文章
+        
+        Markdown已保存、仅PDF失败的文章只重新生成PDF，其余文章重新完整处理。
+        
+        Args:
+            error_classes: 只重试这些失败分类（None表示全部）
+            dry_run: 只列出将要重试的文章，不实际处理
+        """
+        failures = self.journal.failures(error_classes)
+        if not failures:
+            print("任务日志中没有需要重试的文章")
+            return
+        
+        by_class = {}
+        for record in failures:
+            error_class = record.get('error_class', job_journal.ERROR_UNKNOWN)
+            by_class[error_class] = by_class.get(error_class, 0) + 1
+        print(f"找到 {len(failures)} 篇失败的文章:")
+        for error_class, count in sorted(by_class.items()):
+            print(f"  {error_class}: {count} 篇")
+        
+        if dry_run:
+            for record in failures:
+                print(f"  [{record.get('error_class', job_journal.ERROR_UNKNOWN)}] {record['url']}")
+            return
+        
+        print("=" * 60)
+        jobs = [(i, record['url'], record) for i, record in enumerate(failures)]
+        results = self._run_jobs(jobs, skip_existing=False)
+        self._print_summary(results)
+    
+    def _install_signal_handlers(self):
+        """
+        安装SIGINT/SIGTERM处理函数
+        
+        第一次收到信号时停止提交新任务，第二次收到时立即中断。
+        
+        Returns:
+            dict: 原有的信号处理函数（非主线程时为空）
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return {}
+        
+        def handle_signal(signum, frame):
+            if self._stop_event.is_set():
+                raise KeyboardInterrupt
+            self._stop_event.set()
+            print(f"\n收到信号 {signal.Signals(signum).name}，等待进行中的文章处理完成（再次发送将立即退出）...")
+        
+        previous = {}
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            previous[signum] = signal.getsignal(signum)
+            signal.signal(signum, handle_signal)
+        return previous
+    
+    def _restore_signal_handlers(self, previous):
+        """恢复原有的信号处理函数"""
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+    
     def _print_summary(self, results):
         """打印下载统计信息"""
         print("\n" + "=" * 60)
@@ -276,11 +802,20 @@ class WeChatArticleDownloader:
         success_count = sum(1 for r in results if r['success'] and not r.get('skipped', False))
         skipped_count = sum(1 for r in results if r.get('skipped', False))
         fail_count = len(results) - success_count - skipped_count
+        pdf_fail_count = sum(1 for r in results if r.get('pdf_error'))
         
         print(f"总计: {len(results)} 篇")
         print(f"新下载: {success_count} 篇")
         print(f"已跳过: {skipped_count} 篇")
         print(f"失败: {fail_count} 篇")
+        if pdf_fail_count > 0:
+            print(f"PDF未生成: {pdf_fail_count} 篇（使用 retry 子命令重试）")
+        print(f"图片下载量: {format_bytes(self.batch_budget.used)}")
+        if self._parser is not None or self._image_downloader is not None:
+            from utils.http_pool import format_pool_stats
+            reuse = format_pool_stats()
+            if reuse:
+                print(f"连接复用率: {reuse}")
         
         if fail_count > 0:
             print("\n失败的URL:")
@@ -289,8 +824,553 @@ class WeChatArticleDownloader:
                     print(f"  - {r['url']}: {r.get('error', '未知错误')}")
 
 
+FAILURE_CLASSES = (
+    job_journal.ERROR_VERIFICATION,
+    job_journal.ERROR_TIMEOUT,
+    job_journal.ERROR_NETWORK,
+    job_journal.ERROR_PARTIAL_IMAGES,
+    job_journal.ERROR_MISSING_PDF,
+    job_journal.ERROR_UNKNOWN,
+)
+
+
+def add_budget_arguments(parser):
+    """添加图片下载量预算参数（单位MB，0表示不限制）"""
+    parser.add_argument(
+        '--article-max-mb',
+        type=int,
+        default=ARTICLE_MAX_BYTES // (1024 * 1024),
+        help=f'单篇文章的图片下载量上限（MB，默认{ARTICLE_MAX_BYTES // (1024 * 1024)}，0表示不限制）'
+    )
+    parser.add_argument(
+        '--batch-max-mb',
+        type=int,
+        default=BATCH_MAX_BYTES // (1024 * 1024),
+        help=f'整批任务的图片下载量上限（MB，默认{BATCH_MAX_BYTES // (1024 * 1024)}，0表示不限制，'
+             '达到后不再开始新的文章）'
+    )
+
+
+def retry_command(argv):
+    """
+    retry 子命令：按失败分类重试任务日志中失败的文章
+    
+    Args:
+        argv: 子命令参数列表
+    """
+    parser = argparse.ArgumentParser(
+        prog='wechat_article_downloader.py retry',
+        description='根据任务日志中记录的失败分类重新处理失败的文章'
+    )
+    parser.add_argument(
+        '--class',
+        dest='error_classes',
+        nargs='+',
+        choices=FAILURE_CLASSES,
+        help='只重试这些失败分类（默认全部）'
+    )
+    parser.add_argument(
+        '--format',
+        choices=['md', 'pdf', 'both'],
+        default='both',
+        help='下载格式（默认both）'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=MAX_WORKERS,
+        help=f'同时处理的文章数（默认{MAX_WORKERS}）'
+    )
+    parser.add_argument(
+        '--pdf-tabs',
+        type=int,
+        default=PDF_TABS,
+        help=f'在同一个浏览器中同时渲染PDF的标签页数（默认{PDF_TABS}）'
+    )
+    parser.add_argument(
+        '--pdf-processes',
+        type=int,
+        default=PDF_PROCESSES,
+        help=f'PDF渲染进程数（默认{PDF_PROCESSES}）'
+    )
+    parser.add_argument(
+        '--deadline',
+        type=int,
+        default=ARTICLE_DEADLINE,
+        help=f'单篇文章的时间预算（秒，默认{ARTICLE_DEADLINE}，0表示不限制）'
+    )
+    add_budget_arguments(parser)
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='只列出将要重试的文章'
+    )
+    args = parser.parse_args(argv)
+    
+    downloader = WeChatArticleDownloader(download_format=args.format, workers=args.workers,
+                                         pdf_tabs=args.pdf_tabs, pdf_processes=args.pdf_processes,
+                                         article_deadline=args.deadline,
+                                         article_max_bytes=args.article_max_mb * 1024 * 1024,
+                                         batch_max_bytes=args.batch_max_mb * 1024 * 1024)
+    downloader.retry_failed(args.error_classes, dry_run=args.dry_run)
+
+
+def reconcile_command(argv):
+    """
+    reconcile 子命令：核对归档中缺失、重复和孤立的文件
+    
+    Args:
+        argv: 子命令参数列表
+    """
+    from utils.archive_index import reconcile_archive, print_report
+    
+    parser = argparse.ArgumentParser(
+        prog='wechat_article_downloader.py reconcile',
+        description='按文章ID核对Markdown、PDF和图片，找出缺失、重复和未被引用的文件'
+    )
+    parser.add_argument('--markdown-dir', default=MARKDOWN_DIR, help='Markdown目录')
+    parser.add_argument('--pdf-dir', default=PDF_DIR, help='PDF目录')
+    parser.add_argument('--images-dir', default=IMAGES_DIR, help='图片目录')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出完整结果')
+    args = parser.parse_args(argv)
+    
+    report = reconcile_archive(args.markdown_dir, args.pdf_dir, args.images_dir)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+def status_command(argv):
+    """
+    status 子命令：显示正在运行的批量任务的进度
+    
+    Args:
+        argv: 子命令参数列表
+    """
+    import time
+    
+    parser = argparse.ArgumentParser(
+        prog='wechat_article_downloader.py status',
+        description='读取下载器发布的进度文件，显示各阶段计数、进行中的任务、吞吐量和预计剩余时间'
+    )
+    parser.add_argument('--file', default=STATUS_FILE, help='进度文件路径')
+    parser.add_argument('-f', '--follow', action='store_true', help='持续显示，直到任务结束')
+    parser.add_argument('--interval', type=float, default=1.0, help='持续显示时检查更新的间隔（秒）')
+    parser.add_argument('--json', action='store_true', help='输出原始JSON')
+    args = parser.parse_args(argv)
+    
+    last_mtime = None
+    try:
+        while True:
+            try:
+                mtime = os.stat(args.file).st_mtime_ns
+            except OSError:
+                mtime = None
+            
+            # 只在进度文件被替换后才重新读取
+            if mtime is not None and mtime != last_mtime:
+                last_mtime = mtime
+                status = read_status(args.file)
+                if status:
+                    if args.json:
+                        print(json.dumps(status, ensure_ascii=False))
+                    else:
+                        print(format_status(status))
+                        if not args.follow:
+                            for job in status.get('in_flight', []):
+                                print(f"  - [{job['stage']}] {job['seconds']}s {job['url']}")
+                    if status.get('state') != 'running':
+                        break
+            elif mtime is None and not args.follow:
+                print(f"进度文件不存在: {args.file}")
+                sys.exit(1)
+            
+            if not args.follow:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def migrate_layout_command(argv):
+    """
+    migrate-layout 子命令：把已有归档迁移到平铺或分片布局
+    
+    Args:
+        argv: 子命令参数列表
+    """
+    from utils.archive_index import migrate_layout
+    
+    parser = argparse.ArgumentParser(
+        prog='wechat_article_downloader.py migrate-layout',
+        description='移动已有的Markdown、PDF和图片文件到指定布局，并改写Markdown中的图片链接'
+    )
+    parser.add_argument(
+        '--to',
+        dest='target_layout',
+        choices=layout.LAYOUTS,
+        default=layout.LAYOUT_SHARDED,
+        help='目标布局（默认sharded，需与config.py中的OUTPUT_LAYOUT一致）'
+    )
+    parser.add_argument('--markdown-dir', default=MARKDOWN_DIR, help='Markdown目录')
+    parser.add_argument('--pdf-dir', default=PDF_DIR, help='PDF目录')
+    parser.add_argument('--images-dir', default=IMAGES_DIR, help='图片目录')
+    parser.add_argument('--dry-run', action='store_true', help='只统计需要移动的文件')
+    args = parser.parse_args(argv)
+    
+    if args.target_layout != layout.OUTPUT_LAYOUT:
+        print(f"提示: config.py 中的 OUTPUT_LAYOUT 为 {layout.OUTPUT_LAYOUT}，迁移后请改为 {args.target_layout}")
+    
+    stats = migrate_layout(args.target_layout, args.markdown_dir, args.pdf_dir, args.images_dir,
+                           dry_run=args.dry_run)
+    print(f"{'将' if args.dry_run else '已'}迁移到 {args.target_layout} 布局:")
+    print(f"  图片: {stats['images']}")
+    print(f"  Markdown: {stats['markdown']}（改写图片链接 {stats['links']} 处）")
+    print(f"  PDF: {stats['pdf']}")
+    if stats['unmatched_pdf']:
+        print(f"  未找到对应Markdown、保持原位的PDF: {stats['unmatched_pdf']}")
+
+
+def rerender_command(argv):
+    """
+    rerender 子命令：不联网，从MHTML快照重新生成PDF
+    
+    Args:
+        argv: 子命令参数列表
+    """
+    parser = argparse.ArgumentParser(
+        prog='wechat_article_downloader.py rerender',
+        description='从下载时保存的MHTML快照重新生成PDF，不访问网络（已存在的PDF会跳过）'
+    )
+    parser.add_argument('ids', nargs='*', help='只处理这些文章ID（默认快照目录中的全部快照）')
+    parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR, help='快照目录')
+    parser.add_argument('--pdf-dir', default=PDF_DIR, help='PDF输出目录')
+    args = parser.parse_args(argv)
+    
+    if args.ids:
+        snapshots = [os.path.join(args.snapshot_dir, f"{article_id}.mhtml") for article_id in args.ids]
+    else:
+        snapshots = sorted(layout.iter_files(args.snapshot_dir, ('.mhtml',)))
+    missing = [path for path in snapshots if not os.path.exists(path)]
+    for path in missing:
+        print(f"错误: 快照不存在 {path}")
+    snapshots = [path for path in snapshots if path not in missing]
+    if not snapshots:
+        print("没有可用的MHTML快照（下载时在 config.py 的 PDF_CAPTURE_ARTIFACTS 中加入 mhtml）")
+        sys.exit(1)
+    
+    from utils.wechat_to_pdf_perfect import load_sync_playwright, rerender_from_snapshot, BROWSER_ARGS
+    os.makedirs(args.pdf_dir, exist_ok=True)
+    succeeded = 0
+    with load_sync_playwright()() as p:
+        browser = p.chromium.launch(headless=True, args=BROWSER_ARGS)
+        try:
+            for path in snapshots:
+                print(f"\n从快照生成PDF: {path}")
+                try:
+                    if rerender_from_snapshot(browser, path, args.pdf_dir):
+                        succeeded += 1
+                except Exception as e:
+                    print(f"  ✗ 失败: {str(e)}")
+        finally:
+            browser.close()
+    print(f"\n完成: {succeeded}/{len(snapshots)} 个快照")
+    if succeeded < len(snapshots) or missing:
+        sys.exit(1)
+
+
+def md_to_pdf_command(argv):
+    """
+    md-to-pdf 子命令：不联网，用已保存的Markdown和本地图片生成PDF
+    
+    Args:
+        argv: 子命令参数列表
+    """
+    parser = argparse.ArgumentParser(
+        prog='wechat_article_downloader.py md-to-pdf',
+        description='把Markdown文件（图片使用本地 images/ 目录）打印为PDF，不访问网络（已存在的PDF会跳过）'
+    )
+    parser.add_argument('paths', nargs='*', help='Markdown文件或目录（默认Markdown目录中的全部文件）')
+    parser.add_argument('--pdf-dir', default=PDF_DIR, help='PDF输出目录')
+    parser.add_argument('--images-dir', default=IMAGES_DIR, help='图片目录')
+    parser.add_argument('--tabs', type=int, default=max(PDF_TABS, 4), help='同时打印的标签页数')
+    args = parser.parse_args(argv)
+    
+    md_files = []
+    for path in args.paths or [MARKDOWN_DIR]:
+        if os.path.isdir(path):
+            md_files.extend(sorted(layout.iter_files(path, ('.md',))))
+        elif os.path.exists(path):
+            md_files.append(path)
+        else:
+            print(f"错误: 文件不存在 {path}")
+    if not md_files:
+        print("没有可转换的Markdown文件")
+        sys.exit(1)
+    
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.pdf_render_pool import PdfRenderPool
+    os.makedirs(args.pdf_dir, exist_ok=True)
+    tabs = max(1, args.tabs)
+    pool = PdfRenderPool(tabs)
+    try:
+        with ThreadPoolExecutor(max_workers=tabs) as executor:
+            results = list(executor.map(
+                lambda md_file: pool.render_markdown(md_file, args.pdf_dir, args.images_dir), md_files
+            ))
+    finally:
+        pool.close()
+    succeeded = sum(1 for pdf_path in results if pdf_path)
+    print(f"\n完成: {succeeded}/{len(md_files)} 个Markdown文件")
+    if succeeded < len(md_files):
+        sys.exit(1)
+
+
+def audit_images_command(argv):
+    """
+    audit-images 子命令：检查已下载图片的完整性，只重新下载缺失或损坏的图片
+    
+    Args:
+        argv: 子命令参数列表
+    """
+    from utils.image_cache import ImageCache
+    from utils.image_integrity import RedownloadQueue, audit_images
+    
+    parser = argparse.ArgumentParser(
+        prog='wechat_article_downloader.py audit-images',
+        description='按图片缓存索引检查本地图片（文件头、结束标记、大小），缺失或损坏的放入重新下载队列并重新下载'
+    )
+    parser.add_argument('--dry-run', action='store_true', help='只检查并写入队列，不重新下载')
+    parser.add_argument('--queue-only', action='store_true', help='不检查，只重新下载队列中剩余的图片')
+    args = parser.parse_args(argv)
+    
+    queue = RedownloadQueue()
+    if not args.queue_only:
+        stats = audit_images(ImageCache(), queue)
+        queue.save()
+        print(f"已检查 {stats['checked']} 张图片，{stats['queued']} 张缺失或损坏")
+    for entry in queue.entries.values():
+        print(f"  [{entry['reason']}] {entry['path']}")
+    if args.dry_run or not len(queue):
+        return
+    
+    from utils.image_downloader import ImageDownloader
+    downloader = ImageDownloader()
+    try:
+        fixed, failed = downloader.redownload(queue)
+    finally:
+        downloader.close()
+    print(f"重新下载: 成功 {fixed} 张，失败 {failed} 张")
+    if failed:
+        print(f"失败的图片保留在队列中（{queue.path}），可使用 --queue-only 重试")
+        sys.exit(1)
+
+
+def hydrate_images_command(argv):
+    """
+    hydrate-images 子命令：下载 --images deferred 模式延后的图片，并原地改写Markdown中的链接
+    
+    Args:
+        argv: 子命令参数列表
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from utils.pending_images import PendingImages, hydrate_article
+    
+    parser = argparse.ArgumentParser(
+        prog='wechat_article_downloader.py hydrate-images',
+        description='下载待下载列表中的图片，把Markdown中的远程图片链接改为本地路径（失败的图片保留在列表中）'
+    )
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS,
+                        help=f'同时处理的文章数（默认{MAX_WORKERS}）')
+    parser.add_argument('--image-quality', choices=['original', '1080', '640', 'webp'], default=IMAGE_QUALITY,
+                        help=f'图片质量（默认{IMAGE_QUALITY}）')
+    args = parser.parse_args(argv)
+    
+    pending = PendingImages()
+    if not len(pending):
+        print("没有待下载的图片")
+        return
+    total = sum(len(entry['images']) for entry in pending.entries.values())
+    print(f"待下载: {len(pending)} 篇文章，{total} 张图片")
+    
+    from utils.image_downloader import ImageDownloader
+    downloader = ImageDownloader(args.image_quality)
+    downloaded = remaining = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            futures = {executor.submit(hydrate_article, downloader, entry): md_path
+                       for md_path, entry in list(pending.entries.items())}
+            for future in as_completed(futures):
+                md_path = futures[future]
+                count, failed = future.result()
+                pending.update(md_path, failed)
+                downloaded += count
+                remaining += len(failed)
+                print(f"  {os.path.basename(md_path)}: 已下载 {count} 张" + (f"，失败 {len(failed)} 张" if failed else ''))
+    finally:
+        downloader.close()
+    print(f"\n完成: 已下载 {downloaded} 张图片，{remaining} 张仍在待下载列表中")
+    from utils.http_pool import format_pool_stats
+    reuse = format_pool_stats()
+    if reuse:
+        print(f"连接复用率: {reuse}")
+    if remaining:
+        sys.exit(1)
+
+
+def hash_images_command(argv):
+    """
+    hash-images 子命令：为已有图片批量计算感知哈希，统计近似重复的图片，可选用硬链接合并
+    
+    Args:
+        argv: 子命令参数列表
+    """
+    from utils.image_hash import ImageHashIndex
+    from utils.image_cache import ImageCache
+    
+    parser = argparse.ArgumentParser(
+        prog='wechat_article_downloader.py hash-images',
+        description='为图片目录中尚未记录的图片计算感知哈希（多进程），列出近似重复的图片和可节省的空间'
+    )
+    parser.add_argument('--processes', type=int, default=None, help='计算哈希的进程数（默认CPU核数）')
+    parser.add_argument('--link', action='store_true',
+                        help='把扩展名相同的重复图片替换为指向保留图片的硬链接（Markdown中的链接不变）')
+    parser.add_argument('-v', '--verbose', action='store_true', help='列出每组重复的图片')
+    args = parser.parse_args(argv)
+    
+    index = ImageHashIndex()
+    try:
+        added = index.backfill(args.processes)
+        print(f"已记录 {len(index.entries)} 张图片（本次新计算 {added} 张）")
+        groups = index.duplicate_groups()
+        duplicates = sum(len(others) for others in groups.values())
+        reclaimable = sum(os.path.getsize(os.path.join(index.images_dir, relpath))
+                          for others in groups.values() for relpath in others)
+        print(f"近似重复: {len(groups)} 组，{duplicates} 张图片，可节省 {format_bytes(reclaimable)}")
+        if args.verbose:
+            for canonical, others in sorted(groups.items()):
+                print(f"  {canonical}")
+                for relpath in others:
+                    print(f"    = {relpath}")
+        if not args.link:
+            return
+        
+        cache = ImageCache()
+        skipped = 0
+        for canonical, others in groups.items():
+            for relpath in others:
+                # 硬链接后文件内容与扩展名必须一致
+                if os.path.splitext(relpath)[1].lower() != os.path.splitext(canonical)[1].lower():
+                    skipped += 1
+                    continue
+                index.link(canonical, relpath)
+                cache.refresh(relpath)
+        cache.close()
+        print(f"已合并 {index.duplicates} 张图片，节省 {format_bytes(index.reclaimed)}"
+              + (f"（{skipped} 张扩展名不同，未合并）" if skipped else ''))
+    finally:
+        index.close()
+
+
+def compact_gifs_command(argv):
+    """
+    compact-gifs 子命令：把已有归档中的GIF动图转换为WebP动图，并改写Markdown中的链接
+    
+    Args:
+        argv: 子命令参数列表
+    """
+    from settings import IMAGE_OPTIMIZE_QUALITY, IMAGE_OPTIMIZE_PROCESSES, IMAGE_GIF_KEEP_ORIGINAL
+    from utils.image_optimizer import ImageOptimizer, compact_gifs
+    from utils.image_cache import ImageCache
+    
+    parser = argparse.ArgumentParser(
+        prog='wechat_article_downloader.py compact-gifs',
+        description='把图片目录中的GIF动图转换为WebP动图（多进程），改写Markdown中的图片链接；可重复运行'
+    )
+    parser.add_argument('--quality', type=int, default=IMAGE_OPTIMIZE_QUALITY,
+                        help=f'有损压缩质量（默认{IMAGE_OPTIMIZE_QUALITY}）')
+    parser.add_argument('--processes', type=int, default=max(1, IMAGE_OPTIMIZE_PROCESSES),
+                        help=f'转换进程数（默认{max(1, IMAGE_OPTIMIZE_PROCESSES)}）')
+    parser.add_argument('--keep-original', action='store_true', default=IMAGE_GIF_KEEP_ORIGINAL,
+                        help='转换后保留原GIF')
+    parser.add_argument('--dry-run', action='store_true', help='只统计需要转换的GIF')
+    args = parser.parse_args(argv)
+    
+    optimizer = ImageOptimizer(None, 0, args.quality, args.processes, animated_gif=True)
+    if not optimizer.enabled:
+        sys.exit(1)
+    cache = ImageCache()
+    try:
+        stats = compact_gifs(IMAGES_DIR, MARKDOWN_DIR, optimizer, cache, args.keep_original, args.dry_run)
+    finally:
+        optimizer.close()
+        cache.close()
+    if args.dry_run:
+        print(f"待转换 {stats['todo']} 个GIF，{stats['converted']} 个已转换、等待改写链接")
+        return
+    print(f"已转换 {stats['converted']} 个GIF（节省 {format_bytes(stats['saved'])}），"
+          f"改写 {stats['markdown']} 个Markdown中的 {stats['links']} 处链接")
+    if stats['unchanged']:
+        print(f"{stats['unchanged']} 个GIF不是动图或转换后没有变小，保持不变")
+
+
+def install_deps_command(argv):
+    """
+    install-deps 子命令：安装Python依赖和Playwright使用的Chromium
+    
+    Args:
+        argv: 子命令参数列表
+    """
+    import subprocess
+    
+    parser = argparse.ArgumentParser(
+        prog='wechat_article_downloader.py install-deps',
+        description='安装 requirements.txt 中的依赖，并下载生成PDF所需的Chromium浏览器'
+    )
+    parser.add_argument('--skip-pip', action='store_true', help='不安装Python依赖')
+    parser.add_argument('--skip-browser', action='store_true', help='不下载Chromium')
+    args = parser.parse_args(argv)
+    
+    requirements = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'requirements.txt')
+    steps = []
+    if not args.skip_pip:
+        steps.append([sys.executable, '-m', 'pip', 'install', '-r', requirements])
+    if not args.skip_browser:
+        steps.append([sys.executable, '-m', 'playwright', 'install', 'chromium'])
+    
+    for cmd in steps:
+        print(f"运行: {' '.join(cmd)}")
+        try:
+            subprocess.check_call(cmd)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"错误: 安装失败: {str(e)}")
+            sys.exit(1)
+    print("依赖安装完成")
+
+
+# 子命令名称 -> 处理函数
+COMMANDS = {
+    'retry': retry_command,
+    'reconcile': reconcile_command,
+    'status': status_command,
+    'migrate-layout': migrate_layout_command,
+    'rerender': rerender_command,
+    'md-to-pdf': md_to_pdf_command,
+    'audit-images': audit_images_command,
+    'hydrate-images': hydrate_images_command,
+    'hash-images': hash_images_command,
+    'compact-gifs': compact_gifs_command,
+    'install-deps': install_deps_command,
+}
+
+
 def main():
     """主函数"""
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+    
     parser = argparse.ArgumentParser(
         description='微信公众号文章批量下载工具',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -316,6 +1396,61 @@ def main():
   
   # 选择下载格式：两者都下载（默认）
   python wechat_article_downloader.py --format both 微信公众号文章.xlsx
+  
+  # 同时处理4篇文章
+  python wechat_article_downloader.py --workers 4 -f urls.txt
+  
+  # 4个工作线程共用一个浏览器，同时打开4个标签页生成PDF
+  python wechat_article_downloader.py --workers 4 --pdf-tabs 4 -f urls.txt
+  
+  # 大批量下载：32个工作线程，PDF交给16个渲染进程（每个进程一个浏览器）
+  python wechat_article_downloader.py --workers 32 --pdf-processes 16 -f urls.txt
+  
+  # 中断后从上次停止的地方继续
+  python wechat_article_downloader.py --resume -f urls.txt
+  
+  # 重试任务日志中失败的文章（可用 --class 按失败分类筛选）
+  python wechat_article_downloader.py retry --class verification missing_pdf
+  
+  # 核对归档中缺失、重复和未被引用的文件
+  python wechat_article_downloader.py reconcile --json
+  
+  # 查看正在运行的任务进度（-f 持续显示）
+  python wechat_article_downloader.py status -f
+  
+  # 把已有归档迁移到分片布局
+  python wechat_article_downloader.py migrate-layout --to sharded
+  
+  # 生成PDF的同时取回渲染后的页面生成Markdown，每篇文章只加载一次
+  python wechat_article_downloader.py --single-load -f urls.txt
+  
+  # 不联网，从MHTML快照重新生成PDF
+  python wechat_article_downloader.py rerender --pdf-dir output/pdf_rerender
+  
+  # 下载时用保存的Markdown和本地图片离线生成PDF
+  python wechat_article_downloader.py --pdf-source markdown -f urls.txt
+  
+  # 不联网，把已有的Markdown打印为PDF
+  python wechat_article_downloader.py md-to-pdf --pdf-dir output/pdf_with_images
+  
+  # 先保存文字（Markdown引用远程图片），之后再下载图片
+  python wechat_article_downloader.py --images deferred --format md -f urls.txt
+  python wechat_article_downloader.py hydrate-images
+  
+  # 同时下载正文中嵌入的视频、音频
+  python wechat_article_downloader.py --media -f urls.txt
+  
+  # 为已有图片计算感知哈希，用硬链接合并近似重复的图片
+  python wechat_article_downloader.py hash-images --link
+  
+  # 把已有归档中的GIF动图转换为WebP动图
+  python wechat_article_downloader.py compact-gifs
+  
+  # 检查已下载图片的完整性，只重新下载缺失或损坏的图片
+  python wechat_article_downloader.py audit-images
+  
+  # 安装依赖和生成PDF所需的Chromium
+  python wechat_article_downloader.py install-deps
         """
     )
     
@@ -343,9 +1478,90 @@ def main():
         help='下载格式：md（仅Markdown）、pdf（仅PDF）、both（两者都下载，默认）'
     )
     
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=MAX_WORKERS,
+        help=f'同时处理的文章数（默认{MAX_WORKERS}）'
+    )
+    
+    parser.add_argument(
+        '--pdf-tabs',
+        type=int,
+        default=PDF_TABS,
+        help=f'在同一个浏览器中同时渲染PDF的标签页数（默认{PDF_TABS}，应不大于 --workers）'
+    )
+    
+    parser.add_argument(
+        '--pdf-processes',
+        type=int,
+        default=PDF_PROCESSES,
+        help=f'PDF渲染进程数，每个进程一个浏览器（默认{PDF_PROCESSES}，0表示不使用多进程渲染，应不大于 --workers）'
+    )
+    
+    parser.add_argument(
+        '--single-load',
+        action='store_true',
+        default=SINGLE_PAGE_LOAD,
+        help='生成PDF时用浏览器渲染后的页面生成Markdown，每篇文章只加载一次页面（需要 --format both 或 pdf）'
+    )
+    
+    parser.add_argument(
+        '--pdf-source',
+        choices=['page', 'markdown'],
+        default=PDF_SOURCE,
+        help=f'PDF来源：page 加载文章页面打印，markdown 用保存的Markdown和本地图片离线打印（默认{PDF_SOURCE}）'
+    )
+    
+    parser.add_argument(
+        '--deadline',
+        type=int,
+        default=ARTICLE_DEADLINE,
+        help=f'单篇文章获取、图片和PDF各阶段共用的时间预算（秒，默认{ARTICLE_DEADLINE}，0表示不限制）'
+    )
+    
+    parser.add_argument(
+        '--image-quality',
+        choices=['original', '1080', '640', 'webp'],
+        default=IMAGE_QUALITY,
+        help=f'图片质量：original 原图，1080/640 限制宽度，webp 下载WebP版本（默认{IMAGE_QUALITY}，失败时自动改用原图）'
+    )
+    
+    add_budget_arguments(parser)
+    
+    parser.add_argument(
+        '--images',
+        dest='image_mode',
+        choices=IMAGE_MODES,
+        default=IMAGE_MODE,
+        help=f'图片下载方式：eager 处理文章时下载，deferred 先保存引用远程图片的Markdown、'
+             f'之后用 hydrate-images 子命令下载（默认{IMAGE_MODE}）'
+    )
+    
+    parser.add_argument(
+        '--media',
+        action='store_true',
+        default=EXTRACT_MEDIA,
+        help='下载正文中嵌入的视频、音频（分段并行下载，可断点续传），Markdown中链接到本地文件'
+    )
+    
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='根据任务日志从上次中断处继续，不再重新检查已完成的文章'
+    )
+    
     args = parser.parse_args()
+    if args.image_mode == IMAGES_DEFERRED and args.pdf_source == 'markdown':
+        parser.error('--images deferred 不能与 --pdf-source markdown 同时使用（补全图片后可用 md-to-pdf 生成PDF）')
     
-    downloader = WeChatArticleDownloader(download_format=args.format)
+    downloader = WeChatArticleDownloader(download_format=args.format, workers=args.workers,
+                                         pdf_tabs=args.pdf_tabs, pdf_processes=args.pdf_processes,
+                                         single_load=args.single_load, pdf_source=args.pdf_source,
+                                         article_deadline=args.deadline, image_quality=args.image_quality,
+                                         article_max_bytes=args.article_max_mb * 1024 * 1024,
+                                         batch_max_bytes=args.batch_max_mb * 1024 * 1024,
+                                         image_mode=args.image_mode, extract_media=args.media)
     
     # 如果第一个参数是Excel文件，自动处理
     if args.input and args.input.endswith(('.xlsx', '.xls')):
@@ -360,7 +1576,7 @@ def main():
         
         if urls and len(urls) > 0:
             print(f"\n成功提取 {len(urls)} 个URL，开始下载...\n")
-            downloader.download_from_file(temp_urls_file)
+            downloader.download_from_file(temp_urls_file, resume=args.resume)
             # 清理临时文件
             if os.path.exists(temp_urls_file):
                 os.remove(temp_urls_file)
@@ -368,12 +1584,12 @@ def main():
             print("错误: 未能从Excel文件中提取到任何URL")
             sys.exit(1)
     elif args.file:
-        downloader.download_from_file(args.file)
+        downloader.download_from_file(args.file, resume=args.resume)
     elif args.urls:
-        downloader.download_from_urls(args.urls)
+        downloader.download_from_urls(args.urls, resume=args.resume)
     elif args.input and os.path.exists(args.input):
         # 如果输入是普通文本文件，当作URL列表文件处理
-        downloader.download_from_file(args.input)
+        downloader.download_from_file(args.input, resume=args.resume)
     else:
         parser.print_help()
         print("\n错误: 请指定Excel文件、-f 或 -u 参数")